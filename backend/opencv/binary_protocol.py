@@ -0,0 +1,151 @@
+"""
+Binary WebSocket framing for file transfers between the desktop client and the
+local processing server.
+
+Clients that negotiate binary frames send and receive file chunks as raw
+WebSocket binary messages instead of base64 strings wrapped in JSON. Every
+frame carries a small header followed by the chunk bytes:
+
+    version (u8) | flags (u8) | task_id length (u8) | file_id length (u8) |
+    sequence (u32, big endian) | task_id (utf-8) | file_id (utf-8) | payload
+
+Clients that never negotiate keep using the JSON/base64 chunk messages.
+"""
+
+import struct
+from typing import Any, Dict, Optional
+
+BINARY_FRAME_VERSION = 1
+
+# Frame flags
+FLAG_FINAL_CHUNK = 0x01
+
+# Chunk size limits accepted during negotiation
+DEFAULT_CHUNK_SIZE = 1024 * 200
+MIN_CHUNK_SIZE = 1024 * 16
+MAX_CHUNK_SIZE = 1024 * 1024 * 4
+
+_HEADER = struct.Struct("!BBBBI")
+_MAX_ID_LENGTH = 255
+
+
+class BinaryFrame:
+    """A decoded binary file chunk frame."""
+
+    __slots__ = ("task_id", "file_id", "sequence", "payload", "is_final")
+
+    def __init__(self, task_id: str, file_id: str, sequence: int, payload, is_final: bool):
+        self.task_id = task_id
+        self.file_id = file_id
+        self.sequence = sequence
+        self.payload = payload
+        self.is_final = is_final
+
+
+def encode_frame(task_id: str, file_id: str, sequence: int, payload, is_final: bool) -> bytes:
+    """
+    Build a binary frame for one file chunk.
+
+    Args:
+        task_id: Task the file belongs to
+        file_id: Identifier of the file being transferred
+        sequence: Zero-based index of this chunk within the file
+        payload: Raw chunk bytes (bytes, bytearray or memoryview)
+        is_final: Whether this is the last chunk of the file
+
+    Returns:
+        The encoded frame, ready to be sent as a WebSocket binary message
+    """
+    task_bytes = task_id.encode("utf-8")
+    file_bytes = file_id.encode("utf-8")
+
+    if len(task_bytes) > _MAX_ID_LENGTH or len(file_bytes) > _MAX_ID_LENGTH:
+        raise ValueError("task_id and file_id must be at most 255 bytes long")
+
+    flags = FLAG_FINAL_CHUNK if is_final else 0
+    header = _HEADER.pack(BINARY_FRAME_VERSION, flags, len(task_bytes), len(file_bytes), sequence)
+
+    return b"".join((header, task_bytes, file_bytes, payload))
+
+
+def decode_frame(data) -> BinaryFrame:
+    """
+    Parse a binary frame received from a client.
+
+    The payload is returned as a memoryview over the received message so it
+    can be appended to the file buffer without an intermediate copy.
+    """
+    view = memoryview(data)
+
+    if len(view) < _HEADER.size:
+        raise ValueError(f"Binary frame too short: {len(view)} bytes")
+
+    version, flags, task_len, file_len, sequence = _HEADER.unpack_from(view)
+
+    if version != BINARY_FRAME_VERSION:
+        raise ValueError(f"Unsupported binary frame version: {version}")
+
+    ids_end = _HEADER.size + task_len + file_len
+    if len(view) < ids_end:
+        raise ValueError("Binary frame header is truncated")
+
+    task_id = bytes(view[_HEADER.size:_HEADER.size + task_len]).decode("utf-8")
+    file_id = bytes(view[_HEADER.size + task_len:ids_end]).decode("utf-8")
+
+    return BinaryFrame(
+        task_id=task_id,
+        file_id=file_id,
+        sequence=sequence,
+        payload=view[ids_end:],
+        is_final=bool(flags & FLAG_FINAL_CHUNK),
+    )
+
+
+class ProtocolSettings:
+    """Transfer settings negotiated with a single client connection."""
+
+    def __init__(self, binary_frames: bool = False, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.binary_frames = binary_frames
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def negotiate(requested: Optional[Dict[str, Any]]) -> "ProtocolSettings":
+        """
+        Build the settings to use for a client from its negotiation request.
+
+        Unknown or invalid values fall back to the legacy JSON/base64 defaults,
+        and the chunk size is clamped to the range supported by the server.
+        """
+        requested = requested or {}
+
+        try:
+            frame_version = int(requested.get("binary_frame_version", BINARY_FRAME_VERSION))
+        except (TypeError, ValueError):
+            frame_version = None
+        binary_frames = bool(requested.get("binary_frames", False)) and frame_version == BINARY_FRAME_VERSION
+
+        try:
+            chunk_size = int(requested.get("chunk_size", DEFAULT_CHUNK_SIZE))
+        except (TypeError, ValueError):
+            chunk_size = DEFAULT_CHUNK_SIZE
+        chunk_size = max(MIN_CHUNK_SIZE, min(MAX_CHUNK_SIZE, chunk_size))
+
+        return ProtocolSettings(binary_frames=binary_frames, chunk_size=chunk_size)
+
+    @staticmethod
+    def capabilities() -> Dict[str, Any]:
+        """Describe what the server supports, advertised in the welcome message."""
+        return {
+            "binary_frames": True,
+            "binary_frame_version": BINARY_FRAME_VERSION,
+            "default_chunk_size": DEFAULT_CHUNK_SIZE,
+            "min_chunk_size": MIN_CHUNK_SIZE,
+            "max_chunk_size": MAX_CHUNK_SIZE,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "binary_frames": self.binary_frames,
+            "binary_frame_version": BINARY_FRAME_VERSION,
+            "chunk_size": self.chunk_size,
+        }
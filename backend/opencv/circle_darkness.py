@@ -0,0 +1,167 @@
+"""
+Batched fill measurement for detected circles.
+
+Deciding whether a bubble is filled used to average its bounding square, and
+the white content filter built a padded region and a mask for every circle.
+`CircleDarkness` prepares per-row summed-area tables of a box once and
+measures all circles in one call: each circle is a precomputed disk template
+of row spans, so its sums are two table lookups per row.
+
+Pixels of a circle that fall outside the box count as white paper, like the
+white padding the white content filter used.
+"""
+
+import math
+
+import cv2
+import numpy as np
+
+# Intensity below which a pixel is considered ink (180/255 darkness threshold)
+DEFAULT_DARK_THRESHOLD = 180
+
+# Intensity at or above which a pixel is considered white paper
+DEFAULT_WHITE_THRESHOLD = 200
+
+# Value of the pixels outside the box
+OUTSIDE_VALUE = 255
+
+# radius -> (dy, dx_start, dx_end) row spans of the disk template
+_disk_templates = {}
+
+
+def disk_template(radius):
+    """
+    Row spans of the disk of `radius` pixels: for each row offset dy, the pixels
+    dx_start <= dx < dx_end relative to the center.
+
+    The disk covers the pixels with dx**2 + dy**2 <= radius**2 inside the
+    2r x 2r square starting at (-r, -r), the mask the white content filter used.
+    """
+    if radius not in _disk_templates:
+        dy = np.arange(-radius, radius, dtype=np.int64)
+        half_widths = np.array([math.isqrt(radius * radius - offset * offset) for offset in dy], dtype=np.int64)
+        _disk_templates[radius] = (dy, -half_widths, np.minimum(half_widths, radius - 1) + 1)
+    return _disk_templates[radius]
+
+
+class CircleDarkness:
+    """Measures the pixels inside many circles of one box image."""
+
+    def __init__(self, image):
+        """
+        Args:
+            image: Box image, grayscale or BGR
+        """
+        self.gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        self.height, self.width = self.gray.shape[:2]
+        self._tables = {}
+
+    def _integral(self, key):
+        """Summed-area table of the gray plane ('value') or of a threshold mask, built on first use."""
+        if key not in self._tables:
+            if key == 'value':
+                # 32 bit sums are exact as long as the whole box sum fits
+                sdepth = cv2.CV_32S if self.gray.size * 255 < 2**31 else cv2.CV_64F
+                self._tables[key] = cv2.integral(self.gray, sdepth=sdepth)
+            else:
+                comparison, threshold = key
+                mask = self.gray < threshold if comparison == 'below' else self.gray >= threshold
+                self._tables[key] = cv2.integral(mask.view(np.uint8), sdepth=cv2.CV_32S)
+        return self._tables[key]
+
+    def _disk_sums(self, centers, radius, keys):
+        """Pixel counts and sums of the tables in `keys` inside disks of `radius` around (K, 2) integer `centers`."""
+        dy, dx_start, dx_end = disk_template(radius)
+
+        rows = centers[:, 1:2] + dy
+        starts = np.clip(centers[:, 0:1] + dx_start, 0, self.width)
+        ends = np.clip(centers[:, 0:1] + dx_end, 0, self.width)
+        inside_rows = (rows >= 0) & (rows < self.height)
+        rows = np.clip(rows, 0, self.height - 1)
+
+        total_count = int(np.sum(dx_end - dx_start))
+        inside_count = np.sum(np.where(inside_rows, ends - starts, 0), axis=1)
+
+        sums = []
+        for key in keys:
+            table = self._integral(key)
+            # A row span is a rectangle of height 1 in the summed-area table
+            span_sums = (table[rows + 1, ends].astype(np.int64) - table[rows + 1, starts]
+                         - table[rows, ends] + table[rows, starts])
+            sums.append(np.sum(np.where(inside_rows, span_sums, 0), axis=1))
+        return total_count, total_count - inside_count, sums
+
+    def measure(self, circles, dark_threshold=DEFAULT_DARK_THRESHOLD, white_threshold=DEFAULT_WHITE_THRESHOLD):
+        """
+        Measure every circle inside its disk.
+
+        Args:
+            circles: (N, 3) integer [x, y, radius] in box pixels
+            dark_threshold: Intensity below which a pixel counts as ink (None skips the
+                mean, dark ratio and confidence)
+            white_threshold: Intensity at or above which a pixel counts as white (None
+                skips the white ratio)
+
+        Returns:
+            Dictionary of (N,) arrays:
+            - pixel_count: number of pixels in the disk
+            - mean: mean intensity inside the disk (255 for empty disks)
+            - dark_ratio: fraction of the disk darker than `dark_threshold`
+            - confidence: how far the mean is from `dark_threshold`, from 0 (on the
+              threshold) to 1 (pure black or pure white)
+            - white_pixels / white_ratio: pixels at or above `white_threshold` and their fraction
+        """
+        circles = np.asarray(circles, dtype=np.int64).reshape(-1, 3)
+        num_circles = len(circles)
+
+        keys = []
+        if dark_threshold is not None:
+            keys += ['value', ('below', dark_threshold)]
+        if white_threshold is not None:
+            keys.append(('at_least', white_threshold))
+
+        # Pixels outside the box are white paper
+        outside_values = {
+            'value': OUTSIDE_VALUE,
+            ('below', dark_threshold): int(OUTSIDE_VALUE < dark_threshold) if dark_threshold is not None else 0,
+            ('at_least', white_threshold): int(OUTSIDE_VALUE >= white_threshold) if white_threshold is not None else 0
+        }
+
+        pixel_count = np.zeros(num_circles, dtype=np.int64)
+        sums = {key: np.zeros(num_circles, dtype=np.float64 if key == 'value' else np.int64) for key in keys}
+
+        # Circles of the same radius share a disk template
+        for radius in np.unique(circles[:, 2]):
+            if radius <= 0:
+                continue
+            indices = np.flatnonzero(circles[:, 2] == radius)
+            total_count, outside_count, disk_sums = self._disk_sums(circles[indices, :2], int(radius), keys)
+
+            pixel_count[indices] = total_count
+            for key, disk_sum in zip(keys, disk_sums):
+                sums[key][indices] = disk_sum + outside_values[key] * outside_count
+
+        has_pixels = pixel_count > 0
+        safe_count = np.maximum(pixel_count, 1)
+        measurements = {'pixel_count': pixel_count}
+
+        if dark_threshold is not None:
+            mean = np.where(has_pixels, sums['value'] / safe_count, float(OUTSIDE_VALUE))
+
+            # Distance to the threshold relative to the room left on that side of it
+            confidence = np.where(
+                mean < dark_threshold,
+                (dark_threshold - mean) / max(dark_threshold, 1),
+                (mean - dark_threshold) / max(255 - dark_threshold, 1)
+            )
+
+            measurements['mean'] = mean
+            measurements['dark_ratio'] = np.where(has_pixels, sums[('below', dark_threshold)] / safe_count, 0.0)
+            measurements['confidence'] = np.where(has_pixels, np.clip(confidence, 0, 1), 0.0)
+
+        if white_threshold is not None:
+            white_pixels = sums[('at_least', white_threshold)]
+            measurements['white_pixels'] = white_pixels
+            measurements['white_ratio'] = np.where(has_pixels, white_pixels / safe_count, 1.0)
+
+        return measurements
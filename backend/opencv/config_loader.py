@@ -98,10 +98,96 @@ class ConfigLoader:
             return self.get('WEBSOCKET_URI_PROD', 'wss://orca-app-h5tlv.ondigitalocean.app')
 
     def get_memory_config(self) -> Dict[str, Any]:
-        """Get memory monitoring configuration."""
+        """Get memory monitoring and memory budget configuration (uploads and jobs that do not fit are told to retry later, jobs wait at most upload_timeout seconds for their files)."""
         return {
             'threshold_percent': self.get_int('MEMORY_THRESHOLD_PERCENT', 90),
-            'check_interval': self.get_int('MEMORY_CHECK_INTERVAL', 2)
+            'check_interval': self.get_int('MEMORY_CHECK_INTERVAL', 2),
+            'budget_mb': max(1, self.get_int('MEMORY_BUDGET_MB', 1024)),
+            'job_reserve_mb': max(0, self.get_int('JOB_MEMORY_RESERVE_MB', 64)),
+            'queue_timeout': max(0.0, self.get_float('MEMORY_QUEUE_TIMEOUT', 30.0)),
+            'retry_after': max(0.0, self.get_float('MEMORY_RETRY_AFTER', 5.0)),
+            'upload_timeout': max(1.0, self.get_float('FILE_UPLOAD_TIMEOUT', 300.0))
+        }
+
+    def get_worker_pool_config(self) -> Dict[str, Any]:
+        """Get worker pool configuration (0 workers = one per CPU core, negative queue depth = unbounded)."""
+        max_workers = self.get_int('WORKER_POOL_SIZE', 0)
+        max_queue_depth = self.get_int('WORKER_POOL_QUEUE_DEPTH', 32)
+        return {
+            'max_workers': max_workers if max_workers > 0 else (os.cpu_count() or 1),
+            'max_queue_depth': max_queue_depth if max_queue_depth >= 0 else None
+        }
+
+    def get_find_circles_config(self) -> Dict[str, Any]:
+        """Get circle detection job configuration (0 page concurrency = one page per worker)."""
+        page_concurrency = self.get_int('FIND_CIRCLES_PAGE_CONCURRENCY', 0)
+        return {
+            'page_concurrency': page_concurrency if page_concurrency > 0 else self.get_worker_pool_config()['max_workers']
+        }
+
+    def get_hough_search_config(self) -> Dict[str, Any]:
+        """Get Hough parameter search configuration (0 call budget = no limit)."""
+        return {
+            'strategy': self.get('HOUGH_SEARCH_STRATEGY', 'exhaustive').lower(),
+            'call_budget': self.get_int('HOUGH_CALL_BUDGET', 0)
+        }
+
+    def get_read_to_images_config(self) -> Dict[str, Any]:
+        """Get PDF conversion configuration (pages rendered and kept in memory at once, grayscale rendering of calibrated pages, embedded scan extraction)."""
+        return {
+            'pages_in_flight': max(1, self.get_int('PDF_PAGES_IN_FLIGHT', 4)),
+            'grayscale': self.get_bool('PDF_RENDER_GRAYSCALE', True),
+            'extract_scans': self.get_bool('PDF_EXTRACT_SCAN_IMAGES', True)
+        }
+
+    def get_calibration_config(self) -> Dict[str, Any]:
+        """Get page calibration process pool configuration (0 workers = one per CPU core)."""
+        max_workers = self.get_int('CALIBRATION_WORKERS', 0)
+        return {
+            'max_workers': max_workers if max_workers > 0 else (os.cpu_count() or 1),
+            'memory_per_worker_mb': max(1, self.get_int('CALIBRATION_MEMORY_PER_WORKER_MB', 256))
+        }
+
+    def get_corner_detection_config(self) -> Dict[str, Any]:
+        """Get document corner detection configuration (pyramid factor 1 = search the full-resolution page, largest distance in pixels accepted between pyramid and full-resolution corners)."""
+        return {
+            'pyramid_factor': max(1, self.get_int('CORNER_PYRAMID_FACTOR', 4)),
+            'tolerance_px': max(0.0, self.get_float('CORNER_PYRAMID_TOLERANCE_PX', 2.0))
+        }
+
+    def get_content_store_config(self) -> Dict[str, Any]:
+        """Get uploaded file cache configuration (byte budget of the files kept by content hash, 0 = disabled)."""
+        return {
+            'max_mb': max(0, self.get_int('CONTENT_STORE_MAX_MB', 256))
+        }
+
+    def get_session_pages_config(self) -> Dict[str, Any]:
+        """Get the per-connection registry of calibrated pages (byte budget per connection, 0 = disabled, and time to live in seconds)."""
+        return {
+            'max_mb': max(0, self.get_int('SESSION_PAGES_MAX_MB', 256)),
+            'ttl_seconds': max(1, self.get_int('SESSION_PAGES_TTL_SECONDS', 1800))
+        }
+
+    def get_page_encoding_config(self) -> Dict[str, Any]:
+        """Get the default encoding of the pages returned to the client (png, jpeg, webp or raw gray; quality for jpeg/webp, zlib level for png)."""
+        return {
+            'format': self.get('PAGE_OUTPUT_FORMAT', 'png').lower(),
+            'quality': min(100, max(1, self.get_int('PAGE_OUTPUT_QUALITY', 90))),
+            'png_compression': min(9, max(0, self.get_int('PAGE_PNG_COMPRESSION', 1)))
+        }
+
+    def get_connection_writer_config(self) -> Dict[str, Any]:
+        """Get outbound message configuration (minimum seconds between two progress messages of a task, results queued per connection)."""
+        return {
+            'progress_interval': max(0.0, self.get_float('PROGRESS_MIN_INTERVAL', 0.25)),
+            'max_queue': max(1, self.get_int('OUTBOUND_QUEUE_SIZE', 64))
+        }
+
+    def get_parameter_stats_config(self) -> Dict[str, Any]:
+        """Get parameter statistics writer configuration (intervals in seconds)."""
+        return {
+            'flush_interval': max(0.05, self.get_float('PARAMETER_STATS_FLUSH_INTERVAL', 1.0)),
+            'compact_interval': max(0.05, self.get_float('PARAMETER_STATS_COMPACT_INTERVAL', 30.0))
         }
 
     def print_config_summary(self) -> None:
@@ -113,6 +199,17 @@ class ConfigLoader:
         print(f"   HTTP Config: {self.get_http_config()}")
         print(f"   WebSocket URI: {self.get_websocket_uri()}")
         print(f"   Memory Config: {self.get_memory_config()}")
+        print(f"   Worker Pool Config: {self.get_worker_pool_config()}")
+        print(f"   Find Circles Config: {self.get_find_circles_config()}")
+        print(f"   Hough Search Config: {self.get_hough_search_config()}")
+        print(f"   Read To Images Config: {self.get_read_to_images_config()}")
+        print(f"   Calibration Config: {self.get_calibration_config()}")
+        print(f"   Corner Detection Config: {self.get_corner_detection_config()}")
+        print(f"   Content Store Config: {self.get_content_store_config()}")
+        print(f"   Session Pages Config: {self.get_session_pages_config()}")
+        print(f"   Page Encoding Config: {self.get_page_encoding_config()}")
+        print(f"   Connection Writer Config: {self.get_connection_writer_config()}")
+        print(f"   Parameter Stats Config: {self.get_parameter_stats_config()}")
         print()
 
 
@@ -0,0 +1,159 @@
+"""
+Outbound message writer of a WebSocket connection.
+
+Every message to a client goes through the connection's writer, which owns the
+socket's send side in a single task:
+
+- results (completed tasks, pages, file chunks, errors, pongs) are sent first,
+  in order, from a bounded queue: `send` waits while it is full, which keeps
+  the backpressure page sending relies on;
+- progress messages never wait: the latest message of a task replaces the one
+  still pending and a task gets at most one progress message every
+  `progress_interval` seconds, sent when no result is waiting.
+
+A task's pending progress goes out right before the next result of that task,
+so clients still see a task's progress before its completion; progress reported
+after the task finished (`forget_task`) is dropped. Once the connection is gone,
+jobs still running for it get a `ClosedConnectionWriter`.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+
+from utils import Utils
+
+# Finished task ids remembered to drop their late progress messages
+FINISHED_TASKS_KEPT = 256
+
+
+class ConnectionWriter:
+    """Single sender task of a connection, with prioritized results and coalesced progress."""
+
+    def __init__(self, websocket, progress_interval=0.25, max_queue=64):
+        """
+        Args:
+            websocket: Connection the messages are sent on
+            progress_interval: Minimum time between two progress messages of a task, in seconds
+            max_queue: Maximum number of results waiting to be sent
+        """
+        self.websocket = websocket
+        self.progress_interval = progress_interval
+        self.max_queue = max(1, max_queue)
+        self.sent_progress = 0
+        self.coalesced_progress = 0
+
+        self._results = deque()
+        self._progress = OrderedDict()  # task_id -> latest pending message
+        self._last_progress_at = {}  # task_id -> time its last progress was sent
+        self._finished_tasks = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Condition()
+        self._error = None
+        self._task = asyncio.ensure_future(self._run())
+
+    async def send(self, message, task_id=None):
+        """
+        Queue a result message (str or bytes), waiting while the queue is full.
+        The pending progress of `task_id`, if any, is sent before it.
+        Raises the error that stopped the writer (e.g. the connection closed).
+        """
+        async with self._space:
+            await self._space.wait_for(lambda: self._error is not None or len(self._results) < self.max_queue)
+        if self._error is not None:
+            raise self._error
+
+        if task_id is not None and task_id in self._progress:
+            self._results.append(self._progress.pop(task_id))
+            self._last_progress_at[task_id] = time.monotonic()
+            self.sent_progress += 1
+        self._results.append(message)
+        self._wakeup.set()
+
+    def progress(self, task_id, message):
+        """Queue a progress message of `task_id`, replacing the one not sent yet. Never waits."""
+        if self._error is not None or task_id in self._finished_tasks:
+            return
+        if task_id in self._progress:
+            self.coalesced_progress += 1
+        self._progress[task_id] = message
+        self._wakeup.set()
+
+    def forget_task(self, task_id):
+        """Drop the progress state of a finished task, its later progress messages are ignored."""
+        self._progress.pop(task_id, None)
+        self._last_progress_at.pop(task_id, None)
+        self._finished_tasks[task_id] = True
+        if len(self._finished_tasks) > FINISHED_TASKS_KEPT:
+            self._finished_tasks.popitem(last=False)
+
+    async def close(self):
+        """Stop the writer, messages not sent yet are dropped."""
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        await self._fail(ConnectionError("Connection writer closed"))
+
+    async def _fail(self, error):
+        if self._error is None:
+            self._error = error
+        self._results.clear()
+        self._progress.clear()
+        async with self._space:
+            self._space.notify_all()
+
+    def _next_progress(self, now):
+        """(task_id, seconds until its progress is due) of the pending progress due first."""
+        due = None
+        for task_id in self._progress:
+            wait = self._last_progress_at.get(task_id, 0) + self.progress_interval - now
+            if due is None or wait < due[1]:
+                due = (task_id, wait)
+        return due
+
+    async def _run(self):
+        try:
+            while True:
+                if self._results:
+                    await self.websocket.send(self._results.popleft())
+                    async with self._space:
+                        self._space.notify_all()
+                    continue
+
+                now = time.monotonic()
+                due = self._next_progress(now)
+                if due is not None and due[1] <= 0:
+                    task_id = due[0]
+                    await self.websocket.send(self._progress.pop(task_id))
+                    self._last_progress_at[task_id] = now
+                    self.sent_progress += 1
+                    continue
+
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=None if due is None else due[1])
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            Utils.log_error(f"Connection writer stopped: {str(e)}")
+            await self._fail(e)
+
+
+class ClosedConnectionWriter:
+    """Writer of a connection that is gone: progress is dropped and results raise, like a closed ConnectionWriter."""
+
+    async def send(self, message, task_id=None):
+        raise ConnectionError("Connection closed")
+
+    def progress(self, task_id, message):
+        pass
+
+    def forget_task(self, task_id):
+        pass
+
+    async def close(self):
+        pass
@@ -0,0 +1,142 @@
+"""
+Content-addressed store for the page files uploaded to the local processing server.
+
+The desktop client uploads the same page image for every findCircles run (each
+darkness threshold or box tweak). Uploaded files are kept here keyed by their
+SHA-256, within a byte budget, least recently used files being evicted first.
+A client asks which hashes are held (QUERY_CACHED_FILES) and references them in
+its jobs ("file_hashes") instead of uploading them again. The decoded page is
+kept next to the file, so a cache hit also skips image decoding.
+"""
+
+import hashlib
+from collections import OrderedDict
+
+
+def content_hash(data) -> str:
+    """Hex SHA-256 of a file's bytes, the key files are stored under."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class ContentStore:
+    """
+    LRU store of file bytes (and their decoded page) by content hash, bounded by
+    `max_bytes` in total. Meant to be used from the event loop only.
+    """
+
+    def __init__(self, max_bytes):
+        """
+        Args:
+            max_bytes: Byte budget of the files and decoded pages held (0 disables the store)
+        """
+        self.max_bytes = max(0, max_bytes)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # digest -> {"data": bytes, "image": ndarray or None}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, digest):
+        return digest in self._entries
+
+    def put(self, data, digest=None) -> str:
+        """Store `data` (not copied, it must not change afterwards) and return its hash."""
+        digest = digest or content_hash(data)
+        if digest in self._entries:
+            self._entries.move_to_end(digest)
+            return digest
+        if len(data) > self.max_bytes:
+            return digest
+
+        self._entries[digest] = {"data": data, "image": None}
+        self.size += len(data)
+        self._evict()
+        return digest
+
+    def get(self, digest):
+        """The bytes stored under `digest`, None when not held."""
+        entry = self._entries.get(digest)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(digest)
+        return entry["data"]
+
+    def held(self, digests):
+        """The hashes of `digests` the store holds, in the given order."""
+        return [digest for digest in digests if digest in self._entries]
+
+    def get_image(self, digest):
+        """Decoded page of the file stored under `digest`, None when not decoded yet."""
+        entry = self._entries.get(digest)
+        if entry is None or entry["image"] is None:
+            return None
+        self._entries.move_to_end(digest)
+        return entry["image"]
+
+    def set_image(self, digest, image):
+        """
+        Keep the decoded page of a stored file. The array is made read-only,
+        as every job using the file shares it.
+        """
+        entry = self._entries.get(digest)
+        if entry is None or entry["image"] is not None:
+            return
+        if self._entry_size(entry) + image.nbytes > self.max_bytes:
+            return
+
+        image.flags.writeable = False
+        entry["image"] = image
+        self.size += image.nbytes
+        self._entries.move_to_end(digest)
+        self._evict()
+
+    def holds_image(self, digest, image):
+        """True when `image` is the decoded page kept for the file stored under `digest`."""
+        entry = self._entries.get(digest)
+        return entry is not None and entry["image"] is image
+
+    def unshared_size(self, shared=()):
+        """Bytes held, not counting the files whose buffer is one of `shared` (held elsewhere as well)."""
+        shared_ids = {id(buffer) for buffer in shared}
+        return self.size - sum(len(entry["data"]) for entry in self._entries.values() if id(entry["data"]) in shared_ids)
+
+    def shrink(self, max_bytes, shared=()):
+        """
+        Evict the least recently used files until the store holds at most `max_bytes`.
+        Files whose buffer is one of `shared` are not counted (see `unshared_size`) and only
+        lose their decoded page: evicting them would not free their bytes.
+        """
+        shared_ids = {id(buffer) for buffer in shared}
+        size = self.unshared_size(shared)
+        for digest in list(self._entries):
+            if size <= max_bytes:
+                break
+            entry = self._entries[digest]
+            if id(entry["data"]) in shared_ids:
+                freed = entry["image"].nbytes if entry["image"] is not None else 0
+                entry["image"] = None
+            else:
+                freed = self._entry_size(entry)
+                del self._entries[digest]
+            size -= freed
+            self.size -= freed
+
+    def stats(self):
+        return {
+            "files": len(self._entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    @staticmethod
+    def _entry_size(entry):
+        return len(entry["data"]) + (entry["image"].nbytes if entry["image"] is not None else 0)
+
+    def _evict(self):
+        self.shrink(self.max_bytes)
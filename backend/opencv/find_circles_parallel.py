@@ -4,6 +4,7 @@ import cv2
 from concurrent.futures import ProcessPoolExecutor, as_completed
 from utils import Utils
 from find_circles import evaluate_circles_quality
+from hough_search import create_hough_search
 
 def test_parameter_combination(args):
     """
@@ -91,12 +92,17 @@ def test_parameter_combination(args):
 async def find_circles_hough_parallel(gray_img, dp_base, min_dist, min_radius, max_radius, 
                                     expected_count=None, circle_precision_percentage=1, 
                                     on_progress=None, rectangle_info=None, crop_img=None, 
-                                    max_workers=None):
+                                    max_workers=None, search_strategy=None, call_budget=None,
+                                    darkness=None):
     """
     Parallelized version of find_circles_hough_iterative using multiprocessing.
+    Each wave of the search strategy is evaluated in parallel.
     
     Args:
         max_workers: Number of parallel processes (defaults to CPU count)
+        search_strategy: "exhaustive" (full grid, default) or "adaptive"
+        call_budget: Maximum number of HoughCircles calls for the box
+        darkness: CircleDarkness of crop_img used by the white content filter
     """
     
     # Determine number of workers
@@ -113,33 +119,11 @@ async def find_circles_hough_parallel(gray_img, dp_base, min_dist, min_radius, m
     param_circle_counts = {}
     param_combo_results = []
     
-    # Parameter ranges to test
-    dp_values = [1, 1.2]
-    param1_values = [0.4]
-    param2_values = [2, 5, 9]
-    threshold_values = [220, 224, 228, 233, 237, 243]
-    min_dist_values = [min_dist]
+    # Parameter combinations are proposed in waves by the search strategy
+    search = create_hough_search(search_strategy, min_dist, gray_img, call_budget)
     
-    # Generate all parameter combinations
-    param_combinations = []
-    for dp in dp_values:
-        for param1 in param1_values:
-            for param2 in param2_values:
-                for threshold in threshold_values:
-                    for test_min_dist in min_dist_values:
-                        param_combinations.append({
-                            'dp': dp,
-                            'param1': param1,
-                            'param2': param2,
-                            'threshold': threshold,
-                            'min_dist': test_min_dist,
-                            'min_radius': min_radius,
-                            'max_radius': max_radius,
-                            'expected_count': expected_count
-                        })
-    
-    total_combinations = len(param_combinations)
-    Utils.log_info(f"Testing {total_combinations} parameter combinations in parallel...")
+    total_combinations = search.max_calls
+    Utils.log_info(f"Testing up to {total_combinations} parameter combinations in parallel ({search.name} search)...")
     
     # Format rectangle info for progress messages
     rect_info = ""
@@ -154,72 +138,78 @@ async def find_circles_hough_parallel(gray_img, dp_base, min_dist, min_radius, m
     gray_img_bytes = gray_img.tobytes()
     img_shape = gray_img.shape
     
-    # Prepare arguments for worker processes
-    worker_args = []
-    for params in param_combinations:
-        worker_args.append((gray_img_bytes, img_shape, params))
-    
     # Progress tracking
     completed_count = 0
     
     if on_progress is not None:
-        await on_progress(f"{rect_info}Starting parallel processing...\n{max_workers} workers, {total_combinations} combinations")
+        await on_progress(f"{rect_info}Starting parallel processing...\n{max_workers} workers, up to {total_combinations} combinations")
     
-    # Execute parameter combinations in parallel
+    # Execute parameter combinations in parallel, one wave at a time
     with ProcessPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all tasks
-        future_to_params = {
-            executor.submit(test_parameter_combination, args): args[2] 
-            for args in worker_args
-        }
-        
-        # Process results as they complete
-        for future in as_completed(future_to_params):
-            completed_count += 1
-            progress_percent = (completed_count / total_combinations) * 100
+        while True:
+            wave = search.next_wave()
+            if not wave:
+                break
+
+            # Submit all tasks of the wave
+            future_to_params = {
+                executor.submit(test_parameter_combination, (gray_img_bytes, img_shape, {
+                    **param_combo,
+                    'min_radius': min_radius,
+                    'max_radius': max_radius,
+                    'expected_count': expected_count
+                })): param_combo
+                for param_combo in wave
+            }
             
-            try:
-                result = future.result()
+            # Process results as they complete
+            for future in as_completed(future_to_params):
+                completed_count += 1
+                progress_percent = (completed_count / total_combinations) * 100
                 
-                if result['success']:
-                    # Store results
-                    param_combo_results.append((
-                        result['param_combo'], 
-                        result['score'], 
-                        result['circles']
-                    ))
-                    param_circle_counts[result['param_key']] = result['circle_count']
+                try:
+                    result = future.result()
                     
-                    # Check if this is the best result so far
-                    if result['score'] > best_score:
-                        best_score = result['score']
-                        best_circles = result['circles']
-                        best_params = result['param_combo']
-                        
-                        Utils.log_info(f"🎯 NEW BEST SCORE: {result['score']:.3f} with {result['circle_count']} circles! "
-                                     f"Params: dp={best_params['dp']}, param1={best_params['param1']}, "
-                                     f"param2={best_params['param2']}, threshold={best_params['threshold']}")
+                    if result['success']:
+                        # Store results
+                        param_combo_results.append((
+                            result['param_combo'], 
+                            result['score'], 
+                            result['circles']
+                        ))
+                        param_circle_counts[result['param_key']] = result['circle_count']
+                        search.report(future_to_params[future], result['score'], result['circle_count'])
                         
+                        # Check if this is the best result so far
+                        if result['score'] > best_score:
+                            best_score = result['score']
+                            best_circles = result['circles']
+                            best_params = result['param_combo']
+                            
+                            Utils.log_info(f"🎯 NEW BEST SCORE: {result['score']:.3f} with {result['circle_count']} circles! "
+                                         f"Params: dp={best_params['dp']}, param1={best_params['param1']}, "
+                                         f"param2={best_params['param2']}, threshold={best_params['threshold']}")
+                            
+                            if on_progress is not None:
+                                await on_progress(f"{rect_info}🎯 NEW BEST!\n"
+                                                f"Score: {result['score']:.3f}, Circles: {result['circle_count']}\n"
+                                                f"Progress: {progress_percent:.1f}% ({completed_count}/{total_combinations})")
+                    else:
+                        Utils.log_error(f"Parameter combination failed: {result.get('error', 'Unknown error')}")
+                    
+                    # Update progress periodically
+                    if completed_count % 5 == 0 or completed_count == total_combinations:
+                        best_score_text = f"Best: {best_score:.3f}" if best_score > -1 else "Best: None"
                         if on_progress is not None:
-                            await on_progress(f"{rect_info}🎯 NEW BEST!\n"
-                                            f"Score: {result['score']:.3f}, Circles: {result['circle_count']}\n"
-                                            f"Progress: {progress_percent:.1f}% ({completed_count}/{total_combinations})")
-                else:
-                    Utils.log_error(f"Parameter combination failed: {result.get('error', 'Unknown error')}")
-                
-                # Update progress periodically
-                if completed_count % 5 == 0 or completed_count == total_combinations:
-                    best_score_text = f"Best: {best_score:.3f}" if best_score > -1 else "Best: None"
-                    if on_progress is not None:
-                        await on_progress(f"{rect_info}Processing... {completed_count}/{total_combinations} ({progress_percent:.1f}%)\n{best_score_text}")
-                        
-            except Exception as e:
-                Utils.log_error(f"Error processing future result: {e}")
-                continue
+                            await on_progress(f"{rect_info}Processing... {completed_count}/{total_combinations} ({progress_percent:.1f}%)\n{best_score_text}")
+                            
+                except Exception as e:
+                    Utils.log_error(f"Error processing future result: {e}")
+                    continue
     
-    Utils.log_info(f"✅ Parallel parameter testing complete! Processing {total_combinations} combinations with {max_workers} workers")
+    Utils.log_info(f"✅ Parallel parameter testing complete! Processed {search.evaluated} combinations with {max_workers} workers")
     if on_progress is not None:
-        await on_progress(f"{rect_info}Parallel testing complete!\nFinal score: {best_score:.3f} | Applying consensus recovery...")
+        await on_progress(f"{rect_info}Parallel testing complete! ({search.evaluated}/{search.grid_size} combinations, {search.name})\nFinal score: {best_score:.3f} | Applying consensus recovery...")
     
     # Apply the same post-processing as the original function
     from find_circles import apply_consensus_recovery, filter_circles_by_bounds, remove_white_content_circles, remove_overlapping_circles
@@ -239,7 +229,7 @@ async def find_circles_hough_parallel(gray_img, dp_base, min_dist, min_radius, m
         white_filtered_circles = bounds_filtered_circles
         if crop_img is not None:
             Utils.log_info(f"🔍 Removing circles with excessive white content...")
-            white_filtered_circles = remove_white_content_circles(bounds_filtered_circles, crop_img)
+            white_filtered_circles = remove_white_content_circles(bounds_filtered_circles, crop_img, darkness=darkness)
         
         # Remove overlapping circles
         Utils.log_info(f"🔄 Removing overlapping circles...")
@@ -257,7 +247,7 @@ async def find_circles_hough_parallel(gray_img, dp_base, min_dist, min_radius, m
         if on_progress is not None:
             await on_progress(f"{rect_info}✨ Parallel analysis complete!\n"
                             f"Final result: {len(filtered_circles)} circles detected\n"
-                            f"Performance: {max_workers} workers processed {total_combinations} combinations")
+                            f"Performance: {max_workers} workers processed {search.evaluated} combinations")
     else:
         if on_progress is not None:
             await on_progress(f"{rect_info}✨ Parallel analysis complete!\n"
@@ -268,11 +258,12 @@ async def find_circles_hough_parallel(gray_img, dp_base, min_dist, min_radius, m
         'parameter_combinations': param_circle_counts,
         'final_circle_count': final_circle_count,
         'total_combinations_tested': len(param_circle_counts),
-        'parallel_workers_used': max_workers
+        'parallel_workers_used': max_workers,
+        **search.stats()
     }
 
     Utils.log_info(f"🏆 Parallel result - Best parameters: {best_params} with score: {best_score:.3f}")
-    Utils.log_info(f"⚡ Performance: Used {max_workers} parallel workers for {total_combinations} combinations")
+    Utils.log_info(f"⚡ Performance: Used {max_workers} parallel workers for {search.evaluated} combinations")
     
     return best_circles, best_params, best_score, param_stats 
 
@@ -0,0 +1,208 @@
+"""
+Search strategies for the Hough circle parameter grid.
+
+Circle detection tries combinations of dp, param1, param2 and binarization
+threshold and keeps the best scoring one. A search strategy decides which
+combinations are evaluated, in waves, so both the sequential and the parallel
+detectors can share it:
+
+- exhaustive: the full grid in a single wave (the original behaviour)
+- adaptive: probes a few thresholds chosen from the crop's histogram, refines
+  dp/param2 and neighbouring thresholds around the best one and stops once
+  the best score and circle count stabilize
+
+Both strategies honour an optional per-box budget of HoughCircles calls.
+"""
+
+import abc
+
+import numpy as np
+
+# Parameter grid
+DP_VALUES = [1, 1.2]
+PARAM1_VALUES = [0.4]
+PARAM2_VALUES = [2, 5, 9]
+THRESHOLD_VALUES = [220, 224, 228, 233, 237, 243]
+
+SEARCH_STRATEGY_EXHAUSTIVE = "exhaustive"
+SEARCH_STRATEGY_ADAPTIVE = "adaptive"
+SEARCH_STRATEGIES = (SEARCH_STRATEGY_EXHAUSTIVE, SEARCH_STRATEGY_ADAPTIVE)
+
+
+def param_key(param_combo):
+    """Key used to track the circle count of a parameter combination."""
+    return f"dp={param_combo['dp']}_p1={param_combo['param1']}_p2={param_combo['param2']}_th={param_combo['threshold']}"
+
+
+def choose_probe_thresholds(gray_img, thresholds=THRESHOLD_VALUES, probe_count=3):
+    """
+    Pick `probe_count` thresholds spread over the ones that can separate marks from paper.
+
+    Most of a box is paper, so the median of the crop's histogram is the paper level.
+    Thresholds at or above it would turn the paper itself black and are only probed
+    when no threshold is below it.
+    """
+    histogram = np.bincount(gray_img.ravel(), minlength=256)
+    paper_level = int(np.searchsorted(np.cumsum(histogram), gray_img.size / 2))
+
+    candidates = [threshold for threshold in thresholds if threshold < paper_level] or list(thresholds)
+    indices = np.unique(np.round(np.linspace(0, len(candidates) - 1, min(probe_count, len(candidates)))).astype(int))
+    return [candidates[index] for index in indices]
+
+
+class HoughParameterSearch(abc.ABC):
+    """Base class: proposes waves of parameter combinations and collects their results."""
+
+    name = None
+
+    def __init__(self, min_dist, call_budget=None):
+        """
+        Args:
+            min_dist: Minimum distance between circle centers passed to HoughCircles
+            call_budget: Maximum number of HoughCircles calls for the box (None or <= 0 = unlimited)
+        """
+        self.min_dist = min_dist
+        self.call_budget = call_budget if call_budget and call_budget > 0 else None
+        self.grid_size = len(DP_VALUES) * len(PARAM1_VALUES) * len(PARAM2_VALUES) * len(THRESHOLD_VALUES)
+        self.evaluated = 0
+        self.best_score = -1
+        self.best_combo = None
+        self.best_count = 0
+        self._proposed = set()
+
+    @property
+    def max_calls(self):
+        """Upper bound of HoughCircles calls for this box, used for progress messages."""
+        return min(self.grid_size, self.call_budget) if self.call_budget else self.grid_size
+
+    def combo(self, dp, param1, param2, threshold):
+        return {
+            'dp': dp,
+            'param1': param1,
+            'param2': param2,
+            'threshold': threshold,
+            'min_dist': self.min_dist
+        }
+
+    def next_wave(self):
+        """Return the next combinations to evaluate (empty when the search is over)."""
+        remaining = self.call_budget - self.evaluated if self.call_budget else None
+        if remaining is not None and remaining <= 0:
+            return []
+
+        wave = []
+        for param_combo in self._propose():
+            key = param_key(param_combo)
+            if key in self._proposed:
+                continue
+            self._proposed.add(key)
+            wave.append(param_combo)
+            if remaining is not None and len(wave) >= remaining:
+                break
+
+        self.evaluated += len(wave)
+        return wave
+
+    def report(self, param_combo, score, circle_count):
+        """Record the result of an evaluated combination."""
+        if score > self.best_score:
+            self.best_score = score
+            self.best_combo = param_combo
+            self.best_count = circle_count
+
+    def stats(self):
+        return {
+            'search_strategy': self.name,
+            'combinations_evaluated': self.evaluated,
+            'grid_size': self.grid_size,
+            'call_budget': self.call_budget
+        }
+
+    @abc.abstractmethod
+    def _propose(self):
+        """Yield the combinations worth evaluating next, already evaluated ones are skipped."""
+
+
+class ExhaustiveSearch(HoughParameterSearch):
+    """Evaluate the whole grid in one wave."""
+
+    name = SEARCH_STRATEGY_EXHAUSTIVE
+
+    def _propose(self):
+        return [
+            self.combo(dp, param1, param2, threshold)
+            for dp in DP_VALUES
+            for param1 in PARAM1_VALUES
+            for param2 in PARAM2_VALUES
+            for threshold in THRESHOLD_VALUES
+        ]
+
+
+class AdaptiveSearch(HoughParameterSearch):
+    """
+    Coarse-to-fine search:
+
+    1. probe: thresholds chosen from the histogram at the default dp and middle param2
+    2. refine parameters: every dp/param2 at the best threshold
+    3. refine threshold: neighbouring thresholds of the best one, repeated while it keeps moving
+
+    After each refinement wave the search stops if the best score moved less than
+    `score_tolerance` and the best circle count did not change.
+    """
+
+    name = SEARCH_STRATEGY_ADAPTIVE
+
+    def __init__(self, min_dist, gray_img, call_budget=None, probe_count=3, score_tolerance=0.01):
+        super().__init__(min_dist, call_budget)
+        self.probe_thresholds = choose_probe_thresholds(gray_img, probe_count=probe_count)
+        self.score_tolerance = score_tolerance
+        self._phase = 0
+        self._last_best = None
+
+    def _is_stable(self):
+        previous = self._last_best
+        self._last_best = (self.best_score, self.best_count)
+        if previous is None:
+            return False
+        return abs(self.best_score - previous[0]) < self.score_tolerance and self.best_count == previous[1]
+
+    def _propose(self):
+        param1 = PARAM1_VALUES[0]
+
+        if self._phase == 0:
+            self._phase = 1
+            param2 = PARAM2_VALUES[len(PARAM2_VALUES) // 2]
+            return [self.combo(DP_VALUES[0], param1, param2, threshold) for threshold in self.probe_thresholds]
+
+        if self.best_combo is None:
+            return []
+
+        best_threshold = self.best_combo['threshold']
+
+        if self._phase == 1:
+            self._phase = 2
+            self._is_stable()
+            return [
+                self.combo(dp, param1, param2, best_threshold)
+                for dp in DP_VALUES
+                for param2 in PARAM2_VALUES
+            ]
+
+        if self._is_stable():
+            return []
+
+        index = THRESHOLD_VALUES.index(best_threshold)
+        neighbours = [THRESHOLD_VALUES[i] for i in (index - 1, index + 1) if 0 <= i < len(THRESHOLD_VALUES)]
+        return [
+            self.combo(self.best_combo['dp'], param1, self.best_combo['param2'], threshold)
+            for threshold in neighbours
+        ]
+
+
+def create_hough_search(strategy, min_dist, gray_img, call_budget=None):
+    """Build the search for `strategy` ("exhaustive" or "adaptive")."""
+    if strategy in (None, SEARCH_STRATEGY_EXHAUSTIVE):
+        return ExhaustiveSearch(min_dist, call_budget=call_budget)
+    if strategy == SEARCH_STRATEGY_ADAPTIVE:
+        return AdaptiveSearch(min_dist, gray_img, call_budget=call_budget)
+    raise ValueError(f"Unknown Hough search strategy: {strategy}. Expected one of {SEARCH_STRATEGIES}")
@@ -0,0 +1,112 @@
+"""
+Encoding of the page images returned to the client.
+
+Pages are encoded once, straight from their array with OpenCV, into the format a
+job asks for ("output_format"):
+
+    "png"   lossless, with a fast zlib level by default
+    "jpeg"  lossy, `quality` 1-100
+    "webp"  lossy, `quality` 1-100
+    "raw"   the single channel gray pixels, row by row, without any header:
+            the page dimensions are in the job's "image_sizes"
+
+The job can pass the format name only, or {"format": ..., "quality": ..., "png_compression": ...}.
+"""
+
+import time
+
+import cv2
+
+from utils import Utils
+
+OUTPUT_FORMATS = ("png", "jpeg", "webp", "raw")
+
+DEFAULT_PNG_COMPRESSION = 1
+DEFAULT_QUALITY = 90
+
+
+def parse_output_format(spec=None, default=None):
+    """
+    Validate a job's "output_format" and fill in the missing settings from `default`
+    (a dict like the one returned, e.g. config.get_page_encoding_config()).
+    Raises ValueError for unknown formats and out of range settings.
+    """
+    output_format = {"format": "png", "quality": DEFAULT_QUALITY, "png_compression": DEFAULT_PNG_COMPRESSION}
+    output_format.update(default or {})
+    if isinstance(spec, str):
+        output_format["format"] = spec
+    elif spec:
+        output_format.update({key: value for key, value in spec.items() if value is not None})
+
+    output_format["format"] = str(output_format["format"]).lower()
+    if output_format["format"] == "jpg":
+        output_format["format"] = "jpeg"
+    if output_format["format"] not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format {output_format['format']}, expected one of {', '.join(OUTPUT_FORMATS)}")
+    if not 1 <= int(output_format["quality"]) <= 100:
+        raise ValueError(f"Output quality must be between 1 and 100, got {output_format['quality']}")
+    if not 0 <= int(output_format["png_compression"]) <= 9:
+        raise ValueError(f"PNG compression must be between 0 and 9, got {output_format['png_compression']}")
+
+    output_format["quality"] = int(output_format["quality"])
+    output_format["png_compression"] = int(output_format["png_compression"])
+    return output_format
+
+
+def encode_page(page, output_format):
+    """
+    Encode a page array (gray or BGR) in `output_format` (see parse_output_format).
+    Returns the encoded bytes, as a bytes-like object.
+    """
+    name = output_format["format"]
+    if name == "raw":
+        gray = page if page.ndim == 2 else cv2.cvtColor(page, cv2.COLOR_BGR2GRAY)
+        return memoryview(gray).cast("B")
+
+    if name == "png":
+        params = [cv2.IMWRITE_PNG_COMPRESSION, output_format["png_compression"]]
+    elif name == "jpeg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, output_format["quality"]]
+    else:
+        params = [cv2.IMWRITE_WEBP_QUALITY, output_format["quality"]]
+
+    ok, encoded = cv2.imencode(f".{name}", page, params)
+    if not ok:
+        raise Exception(f"Could not encode page as {name}")
+    return memoryview(encoded).cast("B")
+
+
+class EncodingStats:
+    """Encode time and size of the pages of a job, per format, for its completion message."""
+
+    def __init__(self):
+        self.per_format = {}
+
+    def timed_encode(self, page, output_format):
+        """encode_page, recording how long it took and the encoded size."""
+        started_at = time.perf_counter()
+        data = encode_page(page, output_format)
+        self.add(output_format["format"], time.perf_counter() - started_at, len(data))
+        return data
+
+    def add(self, name, seconds, size):
+        stats = self.per_format.setdefault(name, {"pages": 0, "bytes": 0, "encode_ms": 0.0})
+        stats["pages"] += 1
+        stats["bytes"] += size
+        stats["encode_ms"] += seconds * 1000
+
+    def to_dict(self):
+        return {
+            name: {
+                "pages": stats["pages"],
+                "bytes": stats["bytes"],
+                "encode_ms": round(stats["encode_ms"], 2),
+                "average_bytes": stats["bytes"] // stats["pages"],
+                "average_encode_ms": round(stats["encode_ms"] / stats["pages"], 2),
+            }
+            for name, stats in self.per_format.items()
+        }
+
+    def log_summary(self):
+        for name, stats in self.to_dict().items():
+            Utils.log_info(f"🖼️ Encoded {stats['pages']} pages as {name}: {stats['average_encode_ms']} ms and {stats['average_bytes'] / 1024:.0f} KB per page")
@@ -3,6 +3,59 @@ import numpy as np
 from PIL import Image
 from pdf2image import convert_from_path
 from utils import Utils,FlagNames
+from config_loader import config
+
+# Corners are searched on a 1/CORNER_PYRAMID_FACTOR level of the dark pixel mask, then refined at full resolution
+CORNER_PYRAMID_FACTOR = config.get_corner_detection_config()['pyramid_factor']
+
+# Pyramid cells around each coarse corner searched again at full resolution
+CORNER_REFINE_MARGIN_CELLS = 2
+
+# Refinement rounds adding cells before falling back to the full-resolution search
+CORNER_REFINE_ROUNDS = 4
+
+# Parameter combinations the legacy convex hull method tries
+LEGACY_PARAMETER_SETS = [
+    # (blur_kernel, threshold, morph_kernel, description)
+    ((3, 3), 50, (3, 3), "default_aggressive"),
+    ((5, 5), 50, (3, 3), "more_blur_aggressive"), 
+    ((3, 3), 70, (3, 3), "default_moderate"),
+    ((5, 5), 70, (3, 3), "more_blur_moderate"),
+    ((3, 3), 40, (5, 5), "very_aggressive_larger_morph"),
+    ((7, 7), 60, (3, 3), "heavy_blur_balanced"),
+    ((3, 3), 80, (2, 2), "conservative_small_morph"),
+    ((5, 5), 45, (4, 4), "balanced_medium_morph"),
+    ((3, 3), 55, (6, 6), "default_large_morph"),
+    ((9, 9), 65, (3, 3), "maximum_blur_moderate")
+]
+
+# Angle detection cascade (detect_angle_with_fallback): a tier whose result scores at least
+# this confidence decides the page, otherwise the next, more expensive tier runs
+CASCADE_CONFIDENCE_THRESHOLD = 0.6
+
+
+
+def to_cv_image(img):
+    """PIL Image to OpenCV format: BGR, or a single plane for grayscale ('L') pages."""
+    if isinstance(img, Image.Image):
+        if img.mode == 'L':
+            return np.array(img)
+        return cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+    return img
+
+
+def to_pil_image(cv_img):
+    """OpenCV image (BGR or single plane) back to a PIL Image."""
+    if cv_img.ndim == 2:
+        return Image.fromarray(cv_img)
+    return Image.fromarray(cv2.cvtColor(cv_img, cv2.COLOR_BGR2RGB))
+
+
+def to_gray(cv_img):
+    """Grayscale plane of an OpenCV image, without a copy when it already is one."""
+    if cv_img.ndim == 2:
+        return cv_img
+    return cv2.cvtColor(cv_img, cv2.COLOR_BGR2GRAY)
 
 
 def auto_crop_document(img, padding_percent=0.005):
@@ -18,80 +71,64 @@ def auto_crop_document(img, padding_percent=0.005):
     """
     # Convert PIL Image to OpenCV format if needed
     if isinstance(img, Image.Image):
-        cv_img = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+        cv_img = to_cv_image(img)
         original_pil = img
     else:
         cv_img = img
-        original_pil = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+        original_pil = to_pil_image(img)
     
-    # Show original image
-    # if Utils.is_debug():
-    #     show_image(cv_img, "crop_1_original_image")
+    box = find_document_crop_box(cv_img, padding_percent)
+    if box is None:
+        return original_pil
     
+    # Crop the original PIL image
+    x, y, w, h = box
+    return original_pil.crop((x, y, x + w, y + h))
+
+
+def find_document_crop_box(cv_img, padding_percent=0.005):
+    """
+    Bounding box (x, y, width, height) of the document content of an OpenCV image, padded
+    by `padding_percent` of the page size. None when no content is found or the box would
+    be smaller than half the page in either direction (the page is then kept as is).
+    """
     # Get original dimensions
     height, width = cv_img.shape[:2]
     
     # Convert to grayscale
-    gray = cv2.cvtColor(cv_img, cv2.COLOR_BGR2GRAY)
-    # if Utils.is_debug():
-    #     show_image(gray, "crop_2_grayscale")
+    gray = to_gray(cv_img)
     
     # Apply Gaussian blur to reduce noise
     blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-    # if Utils.is_debug():
-    #     show_image(blurred, "crop_3_blurred")
     
     # Use adaptive threshold to handle varying lighting conditions
     thresh = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
                                    cv2.THRESH_BINARY_INV, 11, 10)
     
-    
-    
     # Find contours
     contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     
     if not contours:
         Utils.log_info("No contours found, returning original image")
-        return original_pil
-    
-    # Show contours
-    contour_img = cv_img.copy()
-    cv2.drawContours(contour_img, contours, -1, (0, 255, 0), 2)
-    # if Utils.is_debug():
-    #     show_image(contour_img, "crop_5_all_contours")
+        return None
     
     # Method 1: Find the largest contour (main document)
     largest_contour = max(contours, key=cv2.contourArea)
     
-    # Show largest contour
-    largest_contour_img = cv_img.copy()
-    cv2.drawContours(largest_contour_img, [largest_contour], -1, (0, 0, 255), 3)
-    # if Utils.is_debug():
-    #     show_image(largest_contour_img, "crop_6_largest_contour")
-    
     # Get bounding rectangle of the largest contour
     x, y, w, h = cv2.boundingRect(largest_contour)
     
     # Method 2: Alternative approach - find bounding box of all non-white pixels
     # This is more robust for documents with multiple separate elements
-    coords = np.column_stack(np.where(thresh > 0))
-    if len(coords) > 0:
-        y_min, x_min = coords.min(axis=0)
-        y_max, x_max = coords.max(axis=0)
+    coords = cv2.findNonZero(thresh)
+    if coords is not None:
+        x_min, y_min, coords_w, coords_h = cv2.boundingRect(coords)
+        x_max, y_max = x_min + coords_w - 1, y_min + coords_h - 1
         
         # Use whichever method gives a more reasonable result
         contour_area = w * h
         coords_area = (x_max - x_min) * (y_max - y_min)
         
-        # Show both bounding boxes for comparison
-        comparison_img = cv_img.copy()
-        # Contour-based box in blue
-        cv2.rectangle(comparison_img, (x, y), (x + w, y + h), (255, 0, 0), 2)
-        # Coordinate-based box in green
-        cv2.rectangle(comparison_img, (x_min, y_min), (x_max, y_max), (0, 255, 0), 2)
-        # if Utils.is_debug():
-        #     show_image(comparison_img, "crop_7_bounding_boxes_comparison")
-        
         # If the coordinate-based method gives a significantly larger area, use it
         if coords_area > contour_area * 1.2:
             x, y, w, h = x_min, y_min, x_max - x_min, y_max - y_min
@@ -115,50 +152,35 @@ def auto_crop_document(img, padding_percent=0.005):
     
     if w < min_width or h < min_height:
         Utils.log_info("Detected crop area too small, returning original image")
-        # if Utils.is_debug():
-        #     show_image(cv_img, "crop_8_no_crop_too_small")
-        return original_pil
-    
-    # Draw the final crop rectangle on the image
-    debug_img = cv_img.copy()
-    cv2.rectangle(debug_img, (x, y), (x + w, y + h), (0, 255, 255), 4)  # Yellow rectangle
-    cv2.putText(debug_img, f"CROP AREA: {w}x{h}", (x, y-10), 
-                cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
-    # if Utils.is_debug():
-    #     show_image(debug_img, "crop_8_final_crop_area")
+        return None
     
     Utils.log_info(f"Cropping from ({x}, {y}) with size ({w}, {h})")
     Utils.log_info(f"Original size: ({width}, {height}), New size: ({w}, {h})")
     Utils.log_info(f"Size reduction: {((width * height - w * h) / (width * height) * 100):.1f}%")
     
-    # Crop the original PIL image
-    cropped_pil = original_pil.crop((x, y, x + w, y + h))
-    
-
-    cropped_cv = cv2.cvtColor(np.array(cropped_pil), cv2.COLOR_RGB2BGR)
-    # if Utils.is_debug():
-    #     show_image(cropped_cv, "crop_9_final_cropped_result")
-    
-    return cropped_pil
+    return x, y, w, h
 
 
-def detect_document_corners(img):
+def detect_document_corners(img, pyramid_factor=CORNER_PYRAMID_FACTOR):
     """
     Simplified method: Detect the four corners of a document using darkest pixels.
     Gets pixels with values 0-30 and finds the 4 most distant from center and each other.
+    With a pyramid factor above 1 the search runs on a downscaled mask first (see
+    find_corners_on_pyramid), falling back to all full-resolution pixels when needed.
     Returns the four corner points for perspective correction.
     """
     # Convert PIL Image to OpenCV format if needed
-    if isinstance(img, Image.Image):
-        cv_img = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
-    else:
-        cv_img = img
+    cv_img = to_cv_image(img)
     
     if Utils.get_image_show_flag(FlagNames.CornerDetection):
         show_image(cv_img, "corners_0_original")
     
     # Convert to grayscale
-    gray = cv2.cvtColor(cv_img, cv2.COLOR_BGR2GRAY)
+    gray = to_gray(cv_img)
+
+    if Utils.get_image_show_flag(FlagNames.CornerDetection) and cv_img.ndim == 2:
+        # colored debug drawings need a BGR copy of grayscale pages
+        cv_img = cv2.cvtColor(cv_img, cv2.COLOR_GRAY2BGR)
     
     if Utils.get_image_show_flag(FlagNames.CornerDetection):
         show_image(gray, "corners_1_grayscale")
@@ -179,18 +201,6 @@ def detect_document_corners(img):
         overlay_img[thresh > 0] = [0, 0, 255]  # Mark dark pixels in red
         show_image(overlay_img, "corners_2_dark_pixels_overlay")
     
-    # Find all dark pixels
-    dark_pixels = np.column_stack(np.where(thresh > 0))
-    
-    if len(dark_pixels) == 0:
-        Utils.log_info("No dark pixels found for corner detection")
-        return None
-    
-    # Convert to (x, y) format for easier processing
-    dark_pixels_xy = np.array([(pt[1], pt[0]) for pt in dark_pixels])
-    
-    Utils.log_info(f"Found {len(dark_pixels_xy)} dark pixels")
-    
     # Show center point
     if Utils.get_image_show_flag(FlagNames.CornerDetection):
         center_img = cv_img.copy()
@@ -199,8 +209,24 @@ def detect_document_corners(img):
                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
         show_image(center_img, "corners_2_center_point")
     
-    # Find the 4 pixels with maximum distance from center and between themselves
-    corners, angle = find_4_most_distant_pixels(dark_pixels_xy, center, cv_img)
+    corners, angle = None, None
+    if pyramid_factor > 1:
+        corners, angle = find_corners_on_pyramid(thresh, center, pyramid_factor, cv_img)
+    
+    if corners is None:
+        # Find all dark pixels as (x, y), in the row-major order np.where would give
+        dark_pixels_xy = cv2.findNonZero(thresh)
+        
+        if dark_pixels_xy is None:
+            Utils.log_info("No dark pixels found for corner detection")
+            return None
+        
+        dark_pixels_xy = dark_pixels_xy.reshape(-1, 2).astype(np.int64)
+        
+        Utils.log_info(f"Found {len(dark_pixels_xy)} dark pixels")
+        
+        # Find the 4 pixels with maximum distance from center and between themselves
+        corners, angle = find_4_most_distant_pixels(dark_pixels_xy, center, cv_img)
     
     if corners is None:
         Utils.log_info("Could not find 4 suitable corner pixels")
@@ -342,10 +368,85 @@ def validate_document_corners(corners, img_shape):
     return score
 
 
+def find_corners_on_pyramid(thresh, center, pyramid_factor, cv_img=None):
+    """
+    Coarse-to-fine corner search on a dark pixel mask.
+    Each pyramid cell is dark when any of its full-resolution pixels is, so thin borders survive
+    the downscale. The corners found on the cells are refined on the full-resolution dark pixels
+    of the cells around them. A cell left out is added when the best score any of its pixels
+    could reach beats a refined pick, so the refined corners are those of the full search
+    (up to ties between equal scores).
+    Returns (None, None) when the full-resolution search is needed.
+    """
+    height, width = thresh.shape
+    
+    # Pad to whole cells, then a cell averaging to non zero holds at least one dark pixel
+    padded = cv2.copyMakeBorder(thresh, 0, -height % pyramid_factor, 0, -width % pyramid_factor,
+                                cv2.BORDER_CONSTANT, value=0)
+    coarse = cv2.resize(padded, (padded.shape[1] // pyramid_factor, padded.shape[0] // pyramid_factor),
+                        interpolation=cv2.INTER_AREA)
+    coarse_cells = cv2.findNonZero(coarse)
+    
+    if coarse_cells is None:
+        return None, None
+    
+    # Cells stand for the full-resolution pixel at their center, all their pixels lie within cell_radius of it
+    coarse_cells = coarse_cells.reshape(-1, 2).astype(np.int64)
+    cell_offsets = np.arange(pyramid_factor)
+    cell_centers = coarse_cells * pyramid_factor + (pyramid_factor - 1) / 2
+    cell_radius = (pyramid_factor - 1) / np.sqrt(2)
+    cell_center_distances = np.linalg.norm(cell_centers - center, axis=1)
+    img_diagonal = np.linalg.norm(center * 2)
+    
+    coarse_corners, _ = find_4_most_distant_pixels(cell_centers, center)
+    
+    if coarse_corners is None:
+        return None, None
+    
+    # Start from the cells around the coarse corners
+    refined_cells = np.zeros(len(coarse_cells), dtype=bool)
+    for corner in coarse_corners:
+        refined_cells |= np.abs(cell_centers - corner).max(axis=1) <= pyramid_factor * CORNER_REFINE_MARGIN_CELLS
+    
+    for _ in range(CORNER_REFINE_ROUNDS):
+        # Full-resolution dark pixels of the refined cells, in the row-major order of the full search
+        xs = (coarse_cells[refined_cells, 0, None, None] * pyramid_factor + cell_offsets[None, None, :]).repeat(pyramid_factor, axis=1)
+        ys = (coarse_cells[refined_cells, 1, None, None] * pyramid_factor + cell_offsets[None, :, None]).repeat(pyramid_factor, axis=2)
+        dark = padded[ys, xs] > 0
+        row_major = np.sort(ys[dark] * width + xs[dark])
+        dark_pixels_xy = np.column_stack((row_major % width, row_major // width))
+        corners, angle = find_4_most_distant_pixels(dark_pixels_xy, center, cv_img)
+        
+        if corners is None:
+            return None, None
+        
+        # Upper bounds of the greedy scores in the cells left out, against each refined pick
+        max_center_dist = np.max(np.linalg.norm(dark_pixels_xy - center, axis=1))
+        missing = cell_center_distances + cell_radius >= max_center_dist
+        min_dist_to_selected = np.full(len(coarse_cells), np.inf)
+        for k in range(1, 4):
+            min_dist_to_selected = np.minimum(min_dist_to_selected, np.linalg.norm(cell_centers - corners[k - 1], axis=1))
+            pick_score = (np.linalg.norm(corners[k] - center) / max_center_dist) * 0.5 + \
+                         (np.min(np.linalg.norm(corners[:k] - corners[k], axis=1)) / img_diagonal) * 0.5
+            cell_bound = ((cell_center_distances + cell_radius) / max_center_dist) * 0.5 + \
+                         ((min_dist_to_selected + cell_radius) / img_diagonal) * 0.5
+            missing |= cell_bound >= pick_score - 1e-9
+        missing &= ~refined_cells
+        
+        Utils.log_info(f"Refined pyramid corners on {len(dark_pixels_xy)} dark pixels, {np.count_nonzero(missing)} more cells to check")
+        
+        if not missing.any():
+            return corners, angle
+        refined_cells |= missing
+    
+    return None, None
+
+
 def find_4_most_distant_pixels(pixels, center, cv_img=None):
     """
     Find 4 pixels that are most distant from center and have good separation between themselves.
     Uses a greedy approach to select pixels that maximize both center distance and mutual distance.
+    Each greedy step scores all candidates at once with array operations.
     Returns the corners and the angle of the rectangle formed by these pixels.
     """
     if len(pixels) < 4:
@@ -356,10 +457,10 @@ def find_4_most_distant_pixels(pixels, center, cv_img=None):
     
     # Sort pixels by distance from center (descending)
     sorted_indices = np.argsort(center_distances)[::-1]
+    sorted_pixels = pixels[sorted_indices]
     
     # Start with the pixel most distant from center
-    selected_pixels = [pixels[sorted_indices[0]]]
-    selected_indices = [sorted_indices[0]]
+    selected_pixels = [sorted_pixels[0]]
     
     Utils.log_info(f"Starting with pixel at distance {center_distances[sorted_indices[0]]:.1f} from center")
     
@@ -374,48 +475,31 @@ def find_4_most_distant_pixels(pixels, center, cv_img=None):
                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 0, 0), 2)
         show_image(first_pixel_img, "corners_3_first_pixel")
     
+    # Score components normalized to similar scales: distance from center, and
+    # separation from the selected pixels relative to the image diagonal (rough estimate)
+    normalized_center_dist = center_distances[sorted_indices] / np.max(center_distances)
+    img_diagonal = np.linalg.norm(center * 2)
+    
+    # Minimum distance of every candidate to the pixels selected so far
+    min_dist_to_selected = np.linalg.norm(sorted_pixels - sorted_pixels[0], axis=1)
+    available = np.ones(len(sorted_pixels), dtype=bool)
+    available[0] = False
+    
     # Greedily select remaining 3 pixels
     for _ in range(3):
-        best_pixel = None
-        best_score = -1
-        best_idx = -1
-        
-        # Try remaining pixels
-        for idx in sorted_indices:
-            if idx in selected_indices:
-                continue
-                
-            candidate_pixel = pixels[idx]
-            
-            # Calculate score: combination of distance from center and minimum distance to selected pixels
-            center_dist = center_distances[idx]
-            
-            # Find minimum distance to already selected pixels
-            min_dist_to_selected = float('inf')
-            for selected_pixel in selected_pixels:
-                dist = np.linalg.norm(candidate_pixel - selected_pixel)
-                min_dist_to_selected = min(min_dist_to_selected, dist)
-            
-            # Score combines center distance and separation from selected pixels
-            # Normalize both components to similar scales
-            max_center_dist = np.max(center_distances)
-            normalized_center_dist = center_dist / max_center_dist
-            
-            # Estimate maximum possible distance between pixels (diagonal of image)
-            img_diagonal = np.linalg.norm(center * 2)  # rough estimate
-            normalized_separation = min_dist_to_selected / img_diagonal
-            
-            # Combined score: weight center distance and separation equally
-            score = normalized_center_dist * 0.5 + normalized_separation * 0.5
-            
-            if score > best_score:
-                best_score = score
-                best_pixel = candidate_pixel
-                best_idx = idx
+        # Combined score: weight center distance and separation equally
+        scores = normalized_center_dist * 0.5 + (min_dist_to_selected / img_diagonal) * 0.5
+        scores[~available] = -1
+        
+        # First best candidate in center distance order, like a strict comparison over the sorted pixels
+        best_idx = int(np.argmax(scores))
+        best_score = scores[best_idx]
         
-        if best_pixel is not None:
+        if available[best_idx] and best_score > -1:
+            best_pixel = sorted_pixels[best_idx]
             selected_pixels.append(best_pixel)
-            selected_indices.append(best_idx)
+            available[best_idx] = False
+            min_dist_to_selected = np.minimum(min_dist_to_selected, np.linalg.norm(sorted_pixels - best_pixel, axis=1))
             Utils.log_info(f"Selected pixel {len(selected_pixels)} with score {best_score:.3f}")
             
             # Show current selection
@@ -543,6 +627,16 @@ def detect_contour_angle(img):
     Uses percentile-based method to ignore outliers and find main content bounds.
     Returns both angle and the bounding rectangle.
     """
+    result = _detect_percentile_angle(img)
+    return result['angle'], result['crop_rect']
+
+
+def _detect_percentile_angle(img):
+    """
+    Percentile-based angle detection of detect_contour_angle.
+    Returns a rotation result with the pixel statistics _score_detection_result scores, and the
+    percentile that gave the angle (None when it fell back to the bounding box of all pixels).
+    """
     # Convert PIL Image to OpenCV format if needed
     if isinstance(img, Image.Image):
         cv_img = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
@@ -568,7 +662,7 @@ def detect_contour_angle(img):
     
     if len(black_pixels) == 0:
         Utils.log_info("No black pixels found for angle detection, returning 0")
-        return 0, None
+        return {'type': 'rotation', 'angle': 0, 'crop_rect': None, 'pixel_count': 0, 'percentile': None}
     
     Utils.log_info(f"Total black pixels found: {len(black_pixels)}")
     
@@ -577,6 +671,7 @@ def detect_contour_angle(img):
     angle = 0
     crop_rect = None
     filtered_pixels_xy = None
+    decided_percentile = None
     
     for percentile in percentile_options:
         Utils.log_info(f"Trying percentile: {percentile}%")
@@ -657,6 +752,7 @@ def detect_contour_angle(img):
                 'width': min(img_width - max(0, x_min - padding_x), (x_max - x_min) + 2 * padding_x),
                 'height': min(img_height - max(0, y_min - padding_y), (y_max - y_min) + 2 * padding_y)
             }
+            decided_percentile = percentile
             
             break
     
@@ -747,47 +843,38 @@ def detect_contour_angle(img):
     Utils.log_info(f"Final detected angle using percentile-based method: {angle:.1f}°")
     Utils.log_info(f"Crop rectangle: {crop_rect}")
     
-    return angle, crop_rect
+    return {
+        'type': 'rotation',
+        'angle': angle,
+        'crop_rect': crop_rect,
+        'pixel_count': len(black_pixels),
+        'rect_dimensions': (width, height),
+        'percentile': decided_percentile
+    }
 
 
-def normalize_image_brightness(img):
+def brightness_normalization_lut(gray):
     """
-    Normalize image brightness using dynamic range stretching and gamma correction.
+    Lookup table normalizing the brightness of a page from its grayscale plane.
     Stretches the histogram to use the full 0-255 range, then applies gamma correction.
     """
-    # Convert PIL Image to OpenCV format if needed
-    if isinstance(img, Image.Image):
-        cv_img = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
-        was_pil = True
-    else:
-        cv_img = img
-        was_pil = False
-    
-    # Show original for comparison
-    # if Utils.is_debug():
-    #     show_image(cv_img, "norm_0_original_before_normalization")
-    
-    # Convert to grayscale for analysis
-    gray = cv2.cvtColor(cv_img, cv2.COLOR_BGR2GRAY)
+    hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel()
+    used_levels = np.flatnonzero(hist)
+    min_val, max_val = used_levels[0], used_levels[-1]
+    levels = np.arange(256)
     
     # Step 1: Dynamic Range Normalization - stretch histogram to use full 0-255 range
-    min_val = np.min(gray)
-    max_val = np.max(gray)
-    
     if max_val > min_val:  # Avoid division by zero
-        # Apply to all channels
-        for i in range(3):
-            cv_img[:, :, i] = ((cv_img[:, :, i] - min_val) / (max_val - min_val) * 255).astype(np.uint8)
-        
-        # if Utils.is_debug():
-        #     show_image(cv_img, "norm_1_range_stretched")
+        # Levels outside the page's range (other channels, white borders added later) saturate
+        lut = ((np.clip(levels, min_val, max_val) - min_val) / (max_val - min_val) * 255).astype(np.uint8)
         Utils.log_info(f"Dynamic range: {min_val}-{max_val} → 0-255")
     else:
+        lut = levels.astype(np.uint8)
         Utils.log_info("Image has no dynamic range to stretch")
     
     # Step 2: Gamma Correction
     # Adjust overall brightness based on image characteristics
-    mean_brightness = np.mean(cv2.cvtColor(cv_img, cv2.COLOR_BGR2GRAY))
+    mean_brightness = np.dot(hist, lut) / np.sum(hist)
     
     if mean_brightness < 100:  # Too dark
         gamma = 0.7  # Brighten
@@ -802,47 +889,66 @@ def normalize_image_brightness(img):
     if gamma != 1.0:
         # Build gamma correction lookup table
         inv_gamma = 1.0 / gamma
-        table = np.array([((i / 255.0) ** inv_gamma) * 255 for i in np.arange(0, 256)]).astype("uint8")
-        cv_img = cv2.LUT(cv_img, table)
-        
-        # if Utils.is_debug():
-        #     show_image(cv_img, f"norm_2_gamma_corrected_{gamma}")
+        table = (((np.arange(256) / 255.0) ** inv_gamma) * 255).astype("uint8")
+        lut = table[lut]
     
-    # if Utils.is_debug():
-    #     # Show before/after comparison
-    #     original_img = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR) if was_pil else img
-    #     comparison = np.hstack((original_img, cv_img))
-    #     show_image(comparison, "norm_3_before_after_comparison")
+    return lut
+
+
+def normalize_image_brightness(img):
+    """
+    Normalize image brightness using dynamic range stretching and gamma correction,
+    in a single lookup table pass (see brightness_normalization_lut).
+    """
+    # Convert PIL Image to OpenCV format if needed
+    if isinstance(img, Image.Image):
+        cv_img = to_cv_image(img)
+        was_pil = True
+    else:
+        cv_img = img
+        was_pil = False
+    
+    cv_img = cv2.LUT(cv_img, brightness_normalization_lut(to_gray(cv_img)))
     
     # Convert back to PIL if input was PIL
     if was_pil:
-        result = Image.fromarray(cv2.cvtColor(cv_img, cv2.COLOR_BGR2RGB))
-        return result
-    else:
-        return cv_img
+        return to_pil_image(cv_img)
+    return cv_img
 
 
-def apply_calibration_to_image(img: Image, padding_percent=0.005):
-    # Show original image
-    # if Utils.is_debug():
-    #     cv_original = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
-    #     show_image(cv_original, "0_original_input")
+def crop_image(cv_img, box):
+    """
+    Crop an OpenCV image like PIL's Image.crop: the box is rounded and areas outside
+    the image are filled with black.
+    """
+    x0, y0, x1, y1 = (int(round(value)) for value in box)
+    height, width = cv_img.shape[:2]
+    cropped = np.zeros((max(0, y1 - y0), max(0, x1 - x0)) + cv_img.shape[2:], dtype=cv_img.dtype)
     
+    src_x0, src_y0 = max(0, x0), max(0, y0)
+    src_x1, src_y1 = min(width, x1), min(height, y1)
+    if src_x1 > src_x0 and src_y1 > src_y0:
+        cropped[src_y0 - y0:src_y1 - y0, src_x0 - x0:src_x1 - x0] = cv_img[src_y0:src_y1, src_x0:src_x1]
+    return cropped
+
+
+def apply_calibration_to_image(img: Image, padding_percent=0.005, auto_contrast=False):
+    """
+    Straighten and crop a page, normalizing its brightness with a lookup table.
+    With `auto_contrast`, the straightened and cropped page also gets the contrast stretch of
+    Utils.automatic_brightness_and_contrast (another lookup table, computed from its histogram).
+    """
+    # Convert PIL Image to OpenCV format (grayscale pages stay single channel)
+    return to_pil_image(calibrate_image(to_cv_image(img), padding_percent, auto_contrast))
+
+def calibrate_image(cv_img, padding_percent=0.005, auto_contrast=False):
+    """apply_calibration_to_image on an OpenCV image (BGR or single plane), returning one."""
     # First, normalize brightness and contrast to handle varying lighting
-    normalized_img = normalize_image_brightness(img)
+    normalized = normalize_image_brightness(cv_img)
     Utils.log_info("Applied brightness and contrast normalization")
-    
-    # Show normalized image
-    # if Utils.is_debug():
-    #     cv_normalized = cv2.cvtColor(np.array(normalized_img), cv2.COLOR_RGB2BGR)
-    #     show_image(cv_normalized, "1_after_normalization")
-    
-    # Convert PIL Image to OpenCV format
-    cv_img = cv2.cvtColor(np.array(normalized_img), cv2.COLOR_RGB2BGR)
-
 
     # Detect rotation angle using document corners
-    transform_info = detect_shear_and_perspective(cv_img)
+    transform_info = detect_shear_and_perspective(normalized)
     
     method = transform_info.get('method', 'unknown')
     Utils.log_info(f"Using rotation correction ({transform_info['angle']:.1f}°) via {method}")
@@ -862,63 +968,36 @@ def apply_calibration_to_image(img: Image, padding_percent=0.005):
     
     # Get rotation matrix
     M = cv2.getRotationMatrix2D(center, transform_info['angle'], 1.0)
-
-    # if Utils.is_debug():
-    #     show_image(cv_img, "2_before_rotation")
     
     # Perform the rotation on the normalized image
-    rotated = cv2.warpAffine(cv_img, M, (width, height), 
+    rotated = cv2.warpAffine(normalized, M, (width, height), 
                            flags=cv2.INTER_CUBIC, 
                            borderMode=cv2.BORDER_CONSTANT, 
                            borderValue=(255, 255, 255))  # White background
-
-    # if Utils.is_debug():
-    #     show_image(rotated, "3_after_rotation")
     
     if Utils.is_debug() and abs(transform_info['angle']) > 1:
         Utils.log_info(f"Applied rotation of {transform_info['angle']:.1f}°")
-        pass
-    
-    # Convert back to PIL Image for cropping
-    rotated_pil = Image.fromarray(cv2.cvtColor(rotated, cv2.COLOR_BGR2RGB))
-    
-    # Show before cropping
-    # if Utils.is_debug():
-    #     show_image(rotated, "4_before_crop")
     
     # Use crop rectangle from angle detection if available, otherwise use auto-crop
     if transform_info['crop_rect'] is not None:
         Utils.log_info(f"Using crop rectangle from angle detection: {transform_info['crop_rect']}")
         
         # Apply the crop rectangle
-        final_img = rotated_pil.crop((
+        final_img = crop_image(rotated, (
             transform_info['crop_rect']['x'], 
             transform_info['crop_rect']['y'], 
             transform_info['crop_rect']['x'] + transform_info['crop_rect']['width'], 
             transform_info['crop_rect']['y'] + transform_info['crop_rect']['height']
         ))
-        
-        # if Utils.is_debug():
-        #     # Show the crop rectangle on the rotated image
-        #     debug_crop = rotated.copy()
-        #     cv2.rectangle(debug_crop, (transform_info['crop_rect']['x'], transform_info['crop_rect']['y']), 
-        #                  (transform_info['crop_rect']['x'] + transform_info['crop_rect']['width'], 
-        #                   transform_info['crop_rect']['y'] + transform_info['crop_rect']['height']), 
-        #                  (0, 255, 255), 3)
-        #     cv2.putText(debug_crop, f"CROP: {transform_info['crop_rect']['width']}x{transform_info['crop_rect']['height']}", 
-        #                (transform_info['crop_rect']['x'], transform_info['crop_rect']['y']-10), 
-        #                cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
-        #     show_image(debug_crop, "4_crop_rectangle_applied")
-        
     else:
         Utils.log_info("No crop rectangle available, using auto-crop")
         # Fallback to auto-crop (when using provided calibration_rect)
-        final_img = auto_crop_document(rotated_pil, padding_percent)
+        box = find_document_crop_box(rotated, padding_percent)
+        final_img = rotated if box is None else crop_image(rotated, (box[0], box[1], box[0] + box[2], box[1] + box[3]))
     
-    # Show final result
-    # if Utils.is_debug():
-    #     cv_final = cv2.cvtColor(np.array(final_img), cv2.COLOR_RGB2BGR)
-    #     show_image(cv_final, "5_final_result")
+    if auto_contrast:
+        final_img, alpha, beta = Utils.automatic_brightness_and_contrast(final_img)
+        Utils.log_info(f"Automatic contrast: alpha {alpha:.3f}, beta {beta:.1f}")
     
     return final_img
 
@@ -966,10 +1045,7 @@ def detect_shear_and_perspective(img):
     Returns rotation angle and crop rectangle.
     """
     # Convert PIL Image to OpenCV format if needed
-    if isinstance(img, Image.Image):
-        cv_img = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
-    else:
-        cv_img = img
+    cv_img = to_cv_image(img)
     
     Utils.log_info("Detecting rotation using document corners (4 most distant pixels)")
     
@@ -1153,13 +1229,16 @@ def detect_hough_line_skew(img):
     
     return final_angle
 
-def detect_contour_angle_legacy(img):
+def detect_contour_angle_legacy(img, parameter_sets=LEGACY_PARAMETER_SETS, previous_results=()):
     """
     Legacy method enhanced: Detect rotation angle and potential shear using convex hull.
     This focuses on text/content rather than document edges using convex hull.
     Can also detect perspective distortion if the hull forms a document-like quadrilateral.
     Now tries various parameters and uses the average of all valid results.
-    Returns angle/perspective info and bounding rectangle.
+    `previous_results` are the 'parameter_results' of an earlier call on the same image
+    with other parameter sets, averaged with the new ones instead of being computed again.
+    Returns angle/perspective info and bounding rectangle, plus the results of every
+    parameter set ('parameter_results').
     """
     # Convert PIL Image to OpenCV format if needed
     if isinstance(img, Image.Image):
@@ -1176,25 +1255,9 @@ def detect_contour_angle_legacy(img):
     if Utils.get_image_show_flag(FlagNames.LegacyAngleDetection):
         show_image(gray, "legacy_1_grayscale")
     
-    # Define parameter combinations to try
-    parameter_sets = [
-        # (blur_kernel, threshold, morph_kernel, description)
-        ((3, 3), 50, (3, 3), "default_aggressive"),
-        ((5, 5), 50, (3, 3), "more_blur_aggressive"), 
-        ((3, 3), 70, (3, 3), "default_moderate"),
-        ((5, 5), 70, (3, 3), "more_blur_moderate"),
-        ((3, 3), 40, (5, 5), "very_aggressive_larger_morph"),
-        ((7, 7), 60, (3, 3), "heavy_blur_balanced"),
-        ((3, 3), 80, (2, 2), "conservative_small_morph"),
-        ((5, 5), 45, (4, 4), "balanced_medium_morph"),
-        ((3, 3), 55, (6, 6), "default_large_morph"),
-        ((9, 9), 65, (3, 3), "maximum_blur_moderate")
-    ]
-    
-    valid_results = []
-    perspective_results = []
+    parameter_results = list(previous_results)
     
-    Utils.log_info(f"Legacy method: Trying {len(parameter_sets)} parameter combinations")
+    Utils.log_info(f"Legacy method: Trying {len(parameter_sets)} parameter combinations ({len(parameter_results)} results reused)")
     
     for i, (blur_kernel, threshold, morph_kernel, description) in enumerate(parameter_sets):
         Utils.log_info(f"Testing parameter set {i+1}/{len(parameter_sets)}: {description}")
@@ -1207,12 +1270,11 @@ def detect_contour_angle_legacy(img):
                 score = _score_detection_result(result, cv_img.shape)
                 result['score'] = score
                 Utils.log_info(f"  Result score: {score:.3f}")
+                parameter_results.append(result)
                 
                 if result['type'] == 'perspective':
-                    perspective_results.append(result)
                     Utils.log_info(f"  Added perspective result (distortion: {result['distortion_score']:.3f})")
                 else:
-                    valid_results.append(result)
                     Utils.log_info(f"  Added rotation result (angle: {result['angle']:.2f}°)")
             else:
                 Utils.log_info(f"  No valid result for this parameter set")
@@ -1221,6 +1283,9 @@ def detect_contour_angle_legacy(img):
             Utils.log_info(f"  Parameter set failed: {e}")
             continue
     
+    valid_results = [r for r in parameter_results if r['type'] != 'perspective']
+    perspective_results = [r for r in parameter_results if r['type'] == 'perspective']
+    
     # Handle perspective results - if we have any high-quality perspective results, prefer them
     if perspective_results:
         # Filter perspective results by quality
@@ -1231,12 +1296,12 @@ def detect_contour_angle_legacy(img):
             # Use the best perspective result
             best_perspective = max(good_perspective, key=lambda x: x['score'])
             Utils.log_info(f"Using best perspective result with score {best_perspective['score']:.3f}")
-            return best_perspective
+            return dict(best_perspective, parameter_results=parameter_results)
     
     # If no good perspective results, use rotation results
     if not valid_results:
         Utils.log_info("Legacy method: No valid rotation results found, returning default")
-        return {'type': 'rotation', 'angle': 0, 'crop_rect': None}
+        return {'type': 'rotation', 'angle': 0, 'crop_rect': None, 'parameter_results': parameter_results}
     
     Utils.log_info(f"Legacy method: Averaging {len(valid_results)} valid rotation results")
     
@@ -1313,7 +1378,8 @@ def detect_contour_angle_legacy(img):
         'angle_std': angle_std,
         'angle_range': angle_range,
         'individual_angles': angles,
-        'individual_scores': [r['score'] for r in valid_results]
+        'individual_scores': [r['score'] for r in valid_results],
+        'parameter_results': parameter_results
     }
     
     if Utils.get_image_show_flag(FlagNames.LegacyAngleDetection):
@@ -1674,9 +1740,13 @@ def find_best_4_corners(hull_points, img_size):
 
 def detect_angle_with_fallback(img):
     """
-    Detect rotation angle using multiple methods and choose the best result.
-    Compares percentile-based method with legacy convex hull method.
-    Both methods can now return either rotation or perspective correction.
+    Detect rotation angle with a cascade of detectors, cheapest first:
+    percentile method, legacy convex hull method with its first parameter set, then the
+    legacy method averaged over all its parameter sets (the first one's result is reused).
+    Each result is scored with _score_detection_result and the next tier only runs when the
+    confidence is below CASCADE_CONFIDENCE_THRESHOLD. When no tier is confident, the most
+    confident result is used.
+    Returns (angle, crop_rect, tier), or (perspective result, None, tier) for perspective corrections.
     """
     # Convert PIL Image to OpenCV format if needed
     if isinstance(img, Image.Image):
@@ -1684,83 +1754,49 @@ def detect_angle_with_fallback(img):
     else:
         cv_img = img
     
-    Utils.log_info("Running angle detection with fallback comparison")
-    
-    # Method 1: New percentile-based method (rotation only for now)
-    try:
-        percentile_angle, percentile_crop = detect_contour_angle(cv_img)
-        percentile_result = {'type': 'rotation', 'angle': percentile_angle, 'crop_rect': percentile_crop}
-        percentile_success = True
-        Utils.log_info(f"Percentile method result: {percentile_angle:.2f}° (rotation)")
-    except Exception as e:
-        Utils.log_info(f"Percentile method failed: {e}")
-        percentile_result = {'type': 'rotation', 'angle': 0, 'crop_rect': None}
-        percentile_success = False
-    
-    # Method 2: Enhanced legacy convex hull method (can return rotation or perspective)
-    try:
-        legacy_result = detect_contour_angle_legacy(cv_img)
-        legacy_success = True
-        if legacy_result['type'] == 'perspective':
-            Utils.log_info(f"Legacy method result: perspective correction (distortion: {legacy_result['distortion_score']:.3f})")
-        else:
-            Utils.log_info(f"Legacy method result: {legacy_result['angle']:.2f}° (rotation)")
-    except Exception as e:
-        Utils.log_info(f"Legacy method failed: {e}")
-        legacy_result = {'type': 'rotation', 'angle': 0, 'crop_rect': None}
-        legacy_success = False
-    
-    # If only one method succeeded, use that one
-    if percentile_success and not legacy_success:
-        Utils.log_info("Only percentile method succeeded, using its result")
-        return percentile_result['angle'], percentile_result['crop_rect'], 'percentile_only'
-    elif legacy_success and not percentile_success:
-        Utils.log_info("Only legacy method succeeded, using its result")
-        if legacy_result['type'] == 'perspective':
-            # Return the perspective info in a special format for the caller to handle
-            return legacy_result, None, 'legacy_perspective_only'
-        else:
-            return legacy_result['angle'], legacy_result['crop_rect'], 'legacy_only'
-    elif not percentile_success and not legacy_success:
-        Utils.log_info("Both methods failed, returning 0 angle")
-        return 0, None, 'both_failed'
-    
-    # Both methods succeeded, handle comparison
-    if legacy_result['type'] == 'perspective':
-        # If legacy detected perspective distortion, prefer it over simple rotation
-        Utils.log_info("Legacy method detected perspective distortion, preferring perspective correction")
-        return legacy_result, None, 'legacy_perspective_preferred'
-    
-    # Both are rotation methods, compare angles
-    percentile_angle = percentile_result['angle']
-    legacy_angle = legacy_result['angle']
+    Utils.log_info("Running angle detection cascade")
     
-    angle_difference = abs(percentile_angle - legacy_angle)
-    Utils.log_info(f"Angle difference between methods: {angle_difference:.2f}°")
+    results = {}
+    tiers = [
+        ('percentile', _detect_percentile_angle),
+        ('legacy_single', lambda tier_img: detect_contour_angle_legacy(tier_img, LEGACY_PARAMETER_SETS[:1])),
+        ('legacy_averaged', lambda tier_img: detect_contour_angle_legacy(
+            tier_img, LEGACY_PARAMETER_SETS[1:], results.get('legacy_single', {}).get('parameter_results', ()))),
+    ]
     
-    # Define threshold for "significantly different"
-    significant_difference_threshold = 2.0  # degrees
+    best_result, best_confidence, best_tier = None, -1, None
     
-    if angle_difference <= significant_difference_threshold:
-        # Results are similar, choose based on reliability criteria
-        Utils.log_info(f"Methods agree (diff: {angle_difference:.2f}°), choosing based on reliability")
+    for tier, detector in tiers:
+        try:
+            result = results[tier] = detector(cv_img)
+        except Exception as e:
+            Utils.log_info(f"Cascade tier {tier} failed: {e}")
+            continue
         
-        # Prefer the method that detected a more reasonable angle (closer to common document skew)
-        percentile_reasonableness = get_angle_reasonableness_score(percentile_angle)
-        legacy_reasonableness = get_angle_reasonableness_score(legacy_angle)
+        # The legacy method returns no crop rectangle when none of its parameter sets worked
+        if result['type'] == 'rotation' and result['crop_rect'] is None:
+            Utils.log_info(f"Cascade tier {tier} found no result")
+            continue
         
-        Utils.log_info(f"Percentile reasonableness: {percentile_reasonableness:.3f}, Legacy reasonableness: {legacy_reasonableness:.3f}")
+        confidence = _score_detection_result(result, cv_img.shape)
+        Utils.log_info(f"Cascade tier {tier}: {result['type']} result, confidence {confidence:.3f}")
         
-        if percentile_reasonableness >= legacy_reasonableness:
-            Utils.log_info("Using percentile method (similar results, better reasonableness)")
-            return percentile_angle, percentile_result['crop_rect'], 'percentile_preferred'
-        else:
-            Utils.log_info("Using legacy method (similar results, better reasonableness)")
-            return legacy_angle, legacy_result['crop_rect'], 'legacy_preferred'
-    else:
-        # Results are significantly different, choose the older method
-        Utils.log_info(f"Methods disagree significantly (diff: {angle_difference:.2f}°), using older method")
-        return legacy_angle, legacy_result['crop_rect'], 'legacy_chosen_on_disagreement'
+        if confidence > best_confidence:
+            best_result, best_confidence, best_tier = result, confidence, tier
+        
+        if confidence >= CASCADE_CONFIDENCE_THRESHOLD:
+            break
+    
+    if best_result is None:
+        Utils.log_info("All cascade tiers failed, returning 0 angle")
+        return 0, None, 'failed'
+    
+    Utils.log_info(f"Angle decided by cascade tier {best_tier} (confidence {best_confidence:.3f})")
+    
+    if best_result['type'] == 'perspective':
+        # Return the perspective info in a special format for the caller to handle
+        return best_result, None, best_tier
+    return best_result['angle'], best_result['crop_rect'], best_tier
 
 
 def get_angle_reasonableness_score(angle):
@@ -3,19 +3,26 @@ from base64 import b64decode, b64encode
 from io import BytesIO
 from typing import Dict
 from PIL import Image
-import cv2
 from fastapi import UploadFile
 import numpy as np
 import websockets
 from websockets.exceptions import ConnectionClosedError
 import json
-from queue import SimpleQueue
 import traceback
 from find_circles import find_circles_cv2, find_circles_fallback
+from page_image import PageImage
+from page_preprocessing import PagePreprocessor, page_alignment_transform
 from read_to_images import read_to_images
 from websocket_types import BoxRectangleType, WebsocketMessageCommand, WebsocketMessageStatus
-from copy import deepcopy
+from binary_protocol import ProtocolSettings, decode_frame, encode_frame
+from connection_writer import ClosedConnectionWriter, ConnectionWriter
+from content_store import ContentStore
+from memory_budget import MemoryBudget, MemoryBudgetExceeded
+from image_encoding import EncodingStats, parse_output_format
+from session_pages import SessionPageRegistry
+from worker_pool import ProcessWorkerPool, WorkerPool, WorkerPoolFullError, threadsafe_callback, threadsafe_progress
 from utils import FlagNames, Utils
+import multiprocessing
 import psutil
 import os
 import sys
@@ -53,7 +60,51 @@ from config_loader import config
 MEMORY_CONFIG = config.get_memory_config()
 MEMORY_THRESHOLD_PERCENT = MEMORY_CONFIG['threshold_percent']
 CHECK_INTERVAL = MEMORY_CONFIG['check_interval']
-CHUNK_SIZE = 1024 * 200  
+
+# CPU-bound work (PDF conversion, calibration, circle detection) runs here so the event loop stays responsive
+WORKER_POOL_CONFIG = config.get_worker_pool_config()
+worker_pool = WorkerPool(**WORKER_POOL_CONFIG)
+
+# Maximum number of pages of a batch FIND_CIRCLES job processed at the same time
+FIND_CIRCLES_CONFIG = config.get_find_circles_config()
+FIND_CIRCLES_PAGE_CONCURRENCY = FIND_CIRCLES_CONFIG['page_concurrency']
+
+# Default Hough parameter search, jobs can override it with "search_strategy" and "hough_call_budget"
+HOUGH_SEARCH_CONFIG = config.get_hough_search_config()
+
+# PDF pages rendered and kept in memory at once while reading files to images
+READ_TO_IMAGES_CONFIG = config.get_read_to_images_config()
+
+# Page calibration runs in worker processes, as many pages at once as the available memory allows
+CALIBRATION_CONFIG = config.get_calibration_config()
+calibration_pool = ProcessWorkerPool(**CALIBRATION_CONFIG)
+
+# Document corners are searched on a downscaled pyramid level and refined at full resolution
+CORNER_DETECTION_CONFIG = config.get_corner_detection_config()
+
+# Uploaded files are kept by content hash so clients can reference them in later jobs instead of uploading them again
+CONTENT_STORE_CONFIG = config.get_content_store_config()
+content_store = ContentStore(CONTENT_STORE_CONFIG['max_mb'] * 1024 * 1024)
+
+# Calibrated pages stay decoded per connection, FIND_CIRCLES jobs can reference them by image id
+SESSION_PAGES_CONFIG = config.get_session_pages_config()
+
+# Default format of the pages returned by READ_TO_IMAGES, jobs can ask for another one with "output_format"
+PAGE_ENCODING_CONFIG = config.get_page_encoding_config()
+
+# Uploads, decoded pages, running jobs and the caches above share one byte budget; the caches shrink
+# first, then new uploads and jobs get a RETRY_LATER status
+memory_budget = MemoryBudget(MEMORY_CONFIG['budget_mb'] * 1024 * 1024)
+# A stored file whose upload is still held is charged as upload bytes, the store does not count it again
+memory_budget.add_cache(
+    "content_store",
+    lambda: content_store.unshared_size(uploaded_buffers()),
+    lambda max_bytes: content_store.shrink(max_bytes, uploaded_buffers())
+)
+memory_budget.add_cache("session_pages", lambda: session_pages_size(), lambda max_bytes: shrink_session_pages(max_bytes))
+
+# Outbound messages: results first, progress coalesced per task to a maximum rate
+CONNECTION_WRITER_CONFIG = config.get_connection_writer_config()
 
 # Local server configuration
 LOCAL_CONFIG = {
@@ -65,95 +116,330 @@ LOCAL_CONFIG = {
 # Track last connection time
 last_connection_time = time.time()
 
-class InternalClientMessageType:
-    FILE_RECEIVED = "fileReceived"
+def get_client_id(websocket) -> str:
+    return f"client_{id(websocket)}"
 
-def image_as_encoded(image):
-    byte_arr = BytesIO()
-    image.save(byte_arr, format='PNG') # convert the PIL image to byte array
-    encoded_img = b64encode(byte_arr.getvalue()).decode('utf-8') # encode as base64
-    return encoded_img
+def get_writer(websocket) -> ConnectionWriter:
+    """
+    The connection's outbound writer, every message to the client goes through it.
+    Writers are created by handle_client only: jobs still running after a disconnect
+    get a closed writer, which drops their progress and fails their results.
+    """
+    return writer_per_client.get(get_client_id(websocket)) or ClosedConnectionWriter()
+
+def get_protocol_settings(websocket) -> ProtocolSettings:
+    """Return the transfer settings negotiated by this connection (legacy JSON/base64 by default)."""
+    return protocol_per_client.get(get_client_id(websocket)) or ProtocolSettings()
 
 async def send_bytes_in_chunks(websocket, task_id: str, file_data: bytes, file_id: str):
-    Utils.log_info(f"Sending file in chunks: {file_id}, size: {len(file_data)}")
-    for i in range(0, len(file_data), CHUNK_SIZE):
-        chunk = file_data[i:i+CHUNK_SIZE]
-        status = WebsocketMessageStatus.SENDING_CHUNK
-        if i + CHUNK_SIZE >= len(file_data):
-            status = WebsocketMessageStatus.FINAL_CHUNK
-        await websocket.send(json.dumps({"status": status,'data': {
+    settings = get_protocol_settings(websocket)
+    chunk_size = settings.chunk_size
+    file_view = memoryview(file_data)
+
+    Utils.log_info(f"Sending file in chunks: {file_id}, size: {len(file_data)}, binary: {settings.binary_frames}")
+    for sequence, i in enumerate(range(0, len(file_data), chunk_size)):
+        chunk = file_view[i:i+chunk_size]
+        is_final = i + chunk_size >= len(file_data)
+
+        if settings.binary_frames:
+            await get_writer(websocket).send(encode_frame(task_id, file_id, sequence, chunk, is_final), task_id=task_id)
+            continue
+
+        status = WebsocketMessageStatus.FINAL_CHUNK if is_final else WebsocketMessageStatus.SENDING_CHUNK
+        await get_writer(websocket).send(json.dumps({"status": status,'data': {
             'task_id': task_id,
             'chunk': b64encode(chunk).decode('utf-8'),
             "file_id": file_id
-        }}))
+        }}), task_id=task_id)
 
 # Storage for active connections and their data
 connected_clients = {}
+protocol_per_client: Dict[str, ProtocolSettings] = {}
+writer_per_client: Dict[str, ConnectionWriter] = {}
+pages_per_client: Dict[str, SessionPageRegistry] = {}
 chunks_per_file_id = {}
+chunk_sequence_per_file_id: Dict[str, int] = {}
 files_received: Dict[str, bytearray] = {}
-messages_per_task_id: Dict[str, SimpleQueue] = {}
+file_hash_per_file_id: Dict[str, str] = {}
+upload_bytes_per_file_id: Dict[str, int] = {}
+rejected_uploads: Dict[str, Exception] = {}  # file_id -> error, until the job referencing it is released
+dropped_uploads = set()  # rejected uploads whose remaining chunks are ignored
+uploads_per_client: Dict[str, set] = {}  # file ids uploaded by a connection, dropped when it disconnects
+jobs_per_client: Dict[str, set] = {}  # job tasks of a connection, cancelled when it disconnects
+session_page_per_file_id: Dict[str, np.ndarray] = {}
+file_received_events: Dict[str, asyncio.Event] = {}
 
-async def handle_job_received(job, websocket):
+def get_file_received_event(file_id: str) -> asyncio.Event:
+    """
+    Return the event that is set once `file_id` has been fully received.
+    Created on first use by whichever side comes first: the upload or the job waiting for it.
+    """
+    if file_id not in file_received_events:
+        file_received_events[file_id] = asyncio.Event()
+    return file_received_events[file_id]
+
+def drop_upload(file_id):
+    """Forget the buffer of an uploaded file and give its bytes back to the memory budget."""
+    files_received.pop(file_id, None)
+    chunks_per_file_id.pop(file_id, None)
+    memory_budget.release(upload_bytes_per_file_id.pop(file_id, 0))
+
+def uploaded_buffers():
+    """Buffers of the received uploads, charged to the memory budget until they are dropped."""
+    return [files_received[file_id] for file_id in upload_bytes_per_file_id if file_id in files_received]
+
+def release_files(file_ids):
+    """Drop the buffers (complete or partial) and arrival events of files."""
+    for file_id in file_ids:
+        drop_upload(file_id)
+        file_hash_per_file_id.pop(file_id, None)
+        session_page_per_file_id.pop(file_id, None)
+        rejected_uploads.pop(file_id, None)
+        dropped_uploads.discard(file_id)
+        chunk_sequence_per_file_id.pop(file_id, None)
+        file_received_events.pop(file_id, None)
+        for uploads in uploads_per_client.values():
+            uploads.discard(file_id)
+
+def release_job_files(job):
+    """Drop the buffers and arrival events of every file referenced by a job."""
+    release_files(job.get("file_ids", []))
+
+async def wait_for_files(file_ids):
+    """Wait (without polling) until every file has arrived, for at most MEMORY_CONFIG['upload_timeout'] seconds."""
+    deadline = time.monotonic() + MEMORY_CONFIG['upload_timeout']
     try:
-        files_to_wait_for: list = deepcopy(job["file_ids"])
+        for file_id in file_ids:
+            event = get_file_received_event(file_id)
+            if not event.is_set():
+                await asyncio.wait_for(event.wait(), max(0, deadline - time.monotonic()))
+    except asyncio.TimeoutError:
+        missing = [file_id for file_id in file_ids if not get_file_received_event(file_id).is_set()]
+        raise Exception(f"Files not received within {MEMORY_CONFIG['upload_timeout']} s: {', '.join(missing)}")
 
-        # Create task queue if it doesn't exist
-        if job["task_id"] not in messages_per_task_id:
-            messages_per_task_id[job["task_id"]] = SimpleQueue()
+def use_cached_files(job):
+    """
+    Resolve the files a job references by content hash ("file_hashes": {file_id: sha256})
+    from the content store, so they count as received without being uploaded.
+    """
+    for file_id, digest in (job.get("file_hashes") or {}).items():
+        if file_id in files_received:
+            continue
 
-        while True:
-            if messages_per_task_id[job["task_id"]].empty():
-                await asyncio.sleep(0.1)
-                continue
-            message = messages_per_task_id[job["task_id"]].get()
-            
-            if message["status"] == InternalClientMessageType.FILE_RECEIVED:
-                files_to_wait_for.remove(message["data"]["file_id"])     
+        data = content_store.get(digest)
+        if data is None:
+            raise Exception(f"File {file_id} is not cached anymore ({digest}), it must be uploaded again")
 
-            if len(files_to_wait_for) > 0:     
-                continue
+        files_received[file_id] = data
+        file_hash_per_file_id[file_id] = digest
+        get_file_received_event(file_id).set()
+
+def get_session_pages(websocket) -> SessionPageRegistry:
+    """Registry of the calibrated pages read for this connection."""
+    client_id = get_client_id(websocket)
+    if client_id not in pages_per_client:
+        pages_per_client[client_id] = SessionPageRegistry(
+            SESSION_PAGES_CONFIG['max_mb'] * 1024 * 1024, SESSION_PAGES_CONFIG['ttl_seconds']
+        )
+    return pages_per_client[client_id]
+
+def use_session_pages(job, websocket):
+    """
+    Resolve the FIND_CIRCLES file ids that are image ids of pages this connection read
+    (READ_TO_IMAGES) and still holds: they count as received and are already decoded.
+    """
+    if job["command"] != WebsocketMessageCommand.FIND_CIRCLES:
+        return
+
+    pages = get_session_pages(websocket)
+    for file_id in job["file_ids"]:
+        if file_id in files_received:
+            continue
+
+        page = pages.get(file_id)
+        if page is not None:
+            session_page_per_file_id[file_id] = page
+            get_file_received_event(file_id).set()
+
+def is_file_available(file_id):
+    return file_id in files_received or file_id in session_page_per_file_id
+
+async def load_page_image(file_id, file):
+    """
+    Decoded page of a received file: a page kept from READ_TO_IMAGES, reused from the
+    content store when the file was decoded before, or decoded on the worker pool.
+    """
+    if file_id in session_page_per_file_id:
+        return session_page_per_file_id[file_id]
+
+    digest = file_hash_per_file_id.get(file_id)
+    cv_image = content_store.get_image(digest) if digest else None
+    if cv_image is not None:
+        return cv_image
+
+    cv_image = await worker_pool.run(decode_page_image, file)
+    if digest:
+        content_store.set_image(digest, cv_image)
+    return cv_image
+
+def page_charge(file_id, cv_image):
+    """
+    Bytes a decoded page adds to the memory budget while it is processed: none for a
+    page kept in the session pages or the content store, their cache already counts it.
+    """
+    if session_page_per_file_id.get(file_id) is cv_image:
+        return 0
+    if content_store.holds_image(file_hash_per_file_id.get(file_id), cv_image):
+        return 0
+    return cv_image.nbytes
+
+def session_pages_size():
+    return sum(pages.size for pages in pages_per_client.values())
+
+def shrink_session_pages(max_bytes):
+    """Drop the least recently used pages of the connections until they hold at most `max_bytes` together."""
+    excess = session_pages_size() - max_bytes
+    for pages in pages_per_client.values():
+        if excess <= 0:
+            break
+        before = pages.size
+        pages.shrink(max(0, before - excess))
+        excess -= before - pages.size
+
+def check_rejected_uploads(job):
+    """Fail a job with the error its rejected upload got (RETRY_LATER when it did not fit in memory)."""
+    for file_id in job["file_ids"]:
+        if file_id in rejected_uploads:
+            raise rejected_uploads[file_id]
 
+def reject_upload(file_id, error, is_final):
+    """
+    Drop a file's partial upload, ignore its remaining chunks and wake up the job
+    waiting for it, which fails with `error`.
+    """
+    drop_upload(file_id)
+    chunk_sequence_per_file_id.pop(file_id, None)
+    rejected_uploads[file_id] = error
+    if not is_final:
+        dropped_uploads.add(file_id)
+    get_file_received_event(file_id).set()
+
+async def send_retry_later(websocket, task_id, error, file_id=None):
+    """Tell the client a job or upload did not fit in the memory budget and when to try again."""
+    Utils.log_error(f"⏳ {error} (retry in {error.retry_after} s)")
+    await get_writer(websocket).send(json.dumps({
+        "status": WebsocketMessageStatus.RETRY_LATER,
+        "data": {
+            "task_id": task_id,
+            "file_id": file_id,
+            "retry_after": error.retry_after,
+            "reason": str(error),
+            "memory": memory_budget.stats()
+        }
+    }), task_id=task_id)
+
+async def handle_job_received(job, websocket):
+    job_reserve = 0
+    try:
+        use_cached_files(job)
+        use_session_pages(job, websocket)
+
+        is_batch = job["command"] == WebsocketMessageCommand.FIND_CIRCLES and job.get("batch")
+
+        if is_batch:
+            # Batch jobs start each page as soon as its own file arrives
+            await send_progress(websocket, f"Batch job received on local server, processing {len(job['file_ids'])} pages as they arrive", job["task_id"])
+        else:
+            await wait_for_files(job["file_ids"])
+
+            check_rejected_uploads(job)
             await send_progress(websocket, "All files received on local server, starting job", job["task_id"])
-            
-            try:
-                if job["command"] == WebsocketMessageCommand.READ_TO_IMAGES:
-                    await handle_read_to_images(job, websocket)
-                elif job["command"] == WebsocketMessageCommand.FIND_CIRCLES:
-                    await handle_find_circles(job, websocket)
-            finally:
-                # Clean up resources
-                for file_id in job["file_ids"]:
-                    if file_id in files_received:
-                        del files_received[file_id]
-                    if file_id in chunks_per_file_id:
-                        del chunks_per_file_id[file_id]
-                if job["task_id"] in messages_per_task_id:
-                    del messages_per_task_id[job["task_id"]]
-            return
+
+        # Jobs wait for running ones to give memory back before they start
+        if not await memory_budget.reserve(MEMORY_CONFIG['job_reserve_mb'] * 1024 * 1024, MEMORY_CONFIG['queue_timeout']):
+            raise MemoryBudgetExceeded("Not enough memory to start the job", MEMORY_CONFIG['retry_after'])
+        job_reserve = MEMORY_CONFIG['job_reserve_mb'] * 1024 * 1024
+
+        try:
+            if job["command"] == WebsocketMessageCommand.READ_TO_IMAGES:
+                await handle_read_to_images(job, websocket)
+            elif is_batch:
+                await handle_find_circles_batch(job, websocket)
+            elif job["command"] == WebsocketMessageCommand.FIND_CIRCLES:
+                await handle_find_circles(job, websocket)
+        finally:
+            get_writer(websocket).forget_task(job["task_id"])
+    except MemoryBudgetExceeded as e:
+        try:
+            await send_retry_later(websocket, job["task_id"], e)
+        except Exception:
+            pass
     except Exception as e:
         Utils.log_error(f"Error in handle_job_received: {str(e)}")
         try:
-            await websocket.send(json.dumps({
+            await get_writer(websocket).send(json.dumps({
                 "status": WebsocketMessageStatus.ERROR,
                 "data": {
                     "task_id": job["task_id"],
                     "error": str(e)
                 }
-            }))
+            }), task_id=job["task_id"])
         except:
             pass
-        # Clean up on error
-        for file_id in job.get("file_ids", []):
-            if file_id in files_received:
-                del files_received[file_id]
-            if file_id in chunks_per_file_id:
-                del chunks_per_file_id[file_id]
-        if job.get("task_id") in messages_per_task_id:
-            del messages_per_task_id[job["task_id"]]
+    finally:
+        # Also runs when the job is cancelled because its connection closed
+        release_job_files(job)
+        memory_budget.release(job_reserve)
+
+def job_progress(websocket, task_id, prefix=""):
+    """
+    Progress callback for code running on the worker pool.
+    Messages are forwarded to the event loop that owns the websocket.
+    """
+    return threadsafe_progress(asyncio.get_running_loop(), lambda x: send_progress(websocket, f"{prefix}{x}", task_id))
+
+def page_sender(websocket, task_id, images_ids, output_format=None, encoding_stats=None):
+    """
+    Page callback for read_to_images running on the worker pool.
+    The page is encoded once, in `output_format` (image_encoding.parse_output_format, PNG by
+    default), on the worker thread and its bytes are sent from the event loop; the worker
+    waits for the send, so pages do not pile up in memory. Encode times and sizes are
+    added to `encoding_stats`.
+    Sent pages are kept in the connection's session pages for later FIND_CIRCLES jobs.
+    """
+    output_format = output_format or parse_output_format(default=PAGE_ENCODING_CONFIG)
+    encoding_stats = encoding_stats if encoding_stats is not None else EncodingStats()
+    pages = get_session_pages(websocket)
+
+    async def keep_and_send(image_id, data, page):
+        pages.add(image_id, page.array)
+        memory_budget.fit()
+        await send_bytes_in_chunks(websocket, task_id, data, image_id)
+
+    send = threadsafe_callback(asyncio.get_running_loop(), keep_and_send)
+
+    async def on_page(image_id, page):
+        try:
+            data = encoding_stats.timed_encode(page.array, output_format)
+        except Exception as e:
+            # pages that fail to encode are skipped, like before
+            Utils.log_error(f"Error encoding image {image_id}: {str(e)}")
+            return
+
+        await send(image_id, data, page)
+        images_ids.append(image_id)
+
+    return on_page
 
 async def handle_read_to_images(job, websocket):
     await send_progress(websocket, "Starting to read PDF to images.", job["task_id"])
     images = {}
+    images_ids = []
+    output_format = parse_output_format(job.get("output_format"), PAGE_ENCODING_CONFIG)
+    encoding_stats = EncodingStats()
+
+    # Every page is sent to the client as soon as it is calibrated
+    on_page = page_sender(websocket, job["task_id"], images_ids, output_format, encoding_stats)
     
     for file_id in job["file_ids"]:
         try:
@@ -168,45 +454,132 @@ async def handle_read_to_images(job, websocket):
                 filename=job["filename"]
             )
 
-            images_inner = await read_to_images(uploadFile, on_progress=lambda x: send_progress(websocket, x, job["task_id"]))
+            # PDF conversion and calibration are CPU bound, keep them off the event loop
+            images_inner = await worker_pool.run_async(
+                read_to_images, uploadFile,
+                on_progress=job_progress(websocket, job["task_id"]),
+                on_page=on_page,
+                pages_in_flight=READ_TO_IMAGES_CONFIG['pages_in_flight'],
+                grayscale=READ_TO_IMAGES_CONFIG['grayscale'],
+                extract_scans=READ_TO_IMAGES_CONFIG['extract_scans'],
+                calibration_pool=calibration_pool
+            )
+            if images_inner is None:
+                raise Exception(f"Could not convert file {file_id} to images")
+
             await send_progress(websocket, "Completed reading PDF to images.", job["task_id"])
-            
-            for image in images_inner["images"]:
-                try:
-                    images_inner["images"][image] = image_as_encoded(images_inner["images"][image])
-                except Exception as e:
-                    Utils.log_error(f"Error encoding image {image}: {str(e)}")
-                    continue
 
             for key in images_inner:
-                if key not in images:
-                    images[key] = images_inner[key]
-                else:
-                    images[key].extend(images_inner[key])
+                if key == "images":
+                    continue
+                images.setdefault(key, {}).update(images_inner[key])
 
         except Exception as e:
             Utils.log_error(f"Error processing file {file_id}: {str(e)} {traceback.format_exc()}")
             raise
-
-    await send_progress(websocket, "Sending images back to client...", job["task_id"])
-    
-    images_ids = []
-    for index, image in enumerate(images.get("images", {})):
-        images_ids.append(image)
-        await send_progress(websocket, f"Sending images back to client {index}/{len(images['images'])}...", job["task_id"])
-        await send_bytes_in_chunks(websocket, job["task_id"], b64decode(images["images"][image]), image)
-
-    if "images" in images:
-        del images["images"]
     
-    await websocket.send(json.dumps({
+    encoding_stats.log_summary()
+    await get_writer(websocket).send(json.dumps({
         "status": WebsocketMessageStatus.COMPLETED_TASK,
         "data": {
             "task_id": job["task_id"],
             "images_ids": images_ids,
+            "output_format": output_format["format"],
+            "encoding": encoding_stats.to_dict(),
             **images
         }
-    }))
+    }), task_id=job["task_id"])
+
+def decode_page_image(file):
+    image = Image.open(BytesIO(file))
+    # grayscale pages stay single channel, circle detection only needs gray planes
+    page = PageImage.from_pil(image)
+    image.close()  # Explicitly close PIL Image
+    return page.array
+
+async def find_circles_in_page(job, cv_image, page_info, on_progress):
+    """
+    Run circle detection on every box of a single page.
+    Runs on the worker pool; `on_progress` must be safe to call from a worker thread.
+    """
+    # Offset and rotation are composed with the scale and crop of each box, so only box regions get warped
+    alignment = page_alignment_transform(cv_image.shape, job.get("image_offset"), job.get("image_angle"))
+    page = PagePreprocessor(cv_image, transform=alignment)
+
+    circles_per_box = {}
+    
+    # Sort boxes with exemplo circles first
+    boxes = sorted(job.get("boxes", []), key=lambda x: 0 if x.get("rect_type") == BoxRectangleType.EXEMPLO_CIRCULO else 1)
+    total_boxes = len(boxes)
+
+    for box_index, box in enumerate(boxes):
+        try:
+            rect = box.get("rect")
+            rect_type = box.get("rect_type")
+            box_name = box.get("name")
+            
+            if not all([rect, rect_type, box_name]):
+                continue
+
+            circle_size = job.get("circle_size")
+            if rect_type == BoxRectangleType.EXEMPLO_CIRCULO:
+                circle_size = None
+
+            # Prepare rectangle info for progress tracking
+            rectangle_info = {
+                'index': box_index + 1,
+                'total': total_boxes,
+                'name': box_name,
+                'page_info': page_info  # Add page info to rectangle info
+            }
+
+            if job.get("use_fallback_method") and box.get("template_circles"):
+                circles = await find_circles_fallback("",
+                    rect,
+                    rectangle_type=rect_type,
+                    template_circles=box["template_circles"],
+                    darkness_threshold=job.get("darkness_threshold", 0),
+                    img=cv_image,
+                    on_progress=on_progress,
+                    page=page
+                )
+            else:
+                circles = await find_circles_cv2("", rect, rect_type, 
+                    img=cv_image,
+                    circle_size=circle_size,
+                    dp=job.get("inverse_ratio_accumulator_resolution", 1),
+                    darkness_threshold=job.get("darkness_threshold", 0),
+                    circle_precision_percentage=job.get("circle_precision_percentage", 1),
+                    param2=job.get("param2", 30),
+                    on_progress=on_progress,
+                    rectangle_info=rectangle_info,
+                    use_parallel=job.get("use_parallel_processing", False),
+                    max_workers=job.get("max_parallel_workers", None),
+                    page=page,
+                    search_strategy=job.get("search_strategy", HOUGH_SEARCH_CONFIG['strategy']),
+                    call_budget=job.get("hough_call_budget", HOUGH_SEARCH_CONFIG['call_budget'])
+                )
+
+            # Process circles
+            if rect_type == BoxRectangleType.EXEMPLO_CIRCULO and circles:
+                job["circle_size"] = circles[0]["radius"] / cv_image.shape[1]
+
+            # Undo the alignment for all circles at once and normalize to image dimensions
+            centers = page.to_page_coordinates([[circle["center_x"], circle["center_y"]] for circle in circles])
+            centers /= (cv_image.shape[1], cv_image.shape[0])
+
+            for circle, (center_x, center_y) in zip(circles, centers):
+                circle["center_x"] = float(center_x)
+                circle["center_y"] = float(center_y)
+                circle["radius"] /= cv_image.shape[1]
+
+            circles_per_box[box_name] = circles
+
+        except Exception as e:
+            Utils.log_error(f"Error processing box {box_name}: {str(e)}")
+            circles_per_box[box_name] = []
+
+    return circles_per_box
 
 async def handle_find_circles(job, websocket):
     await send_progress(websocket, "Starting to find circles in images.", job["task_id"])
@@ -219,116 +592,31 @@ async def handle_find_circles(job, websocket):
         await send_progress(websocket, f"Processing {total_files} pages for circle detection...", job["task_id"])
     
     for file_index, file_id in enumerate(job["file_ids"]):
+        # Create page info for progress messages
+        page_info = ""
+        if total_files > 1:
+            page_info = f"[Page {file_index + 1}/{total_files}] "
+
         try:
-            if file_id not in files_received:
+            if not is_file_available(file_id):
                 raise Exception(f"File {file_id} not found")
 
-            file = files_received[file_id]
-            
             try:
-                image = Image.open(BytesIO(file))
-                cv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-                image.close()  # Explicitly close PIL Image
+                cv_image = await load_page_image(file_id, files_received.get(file_id))
+            except WorkerPoolFullError:
+                raise
             except Exception as e:
                 Utils.log_error(f"Error loading image {file_id}: {str(e)}")
                 continue
 
-            # Create page info for progress messages
-            page_info = ""
-            if total_files > 1:
-                page_info = f"[Page {file_index + 1}/{total_files}] "
-
             await send_progress(websocket, f"{page_info}Processing image: {file_id}\nStarting page analysis...", job["task_id"])
 
-            # Apply image transformations
-            if job.get("image_offset"):
-                M = np.float32([[1, 0, job["image_offset"]["x"]], [0, 1, job["image_offset"]["y"]]])
-                cv_image = cv2.warpAffine(cv_image, M, cv_image.shape[1::-1], flags=cv2.INTER_LINEAR)
-
-            if job.get("image_angle") is not None:
-                center = (cv_image.shape[1] // 2, cv_image.shape[0] // 2)
-                M = cv2.getRotationMatrix2D(center, -job["image_angle"], 1)
-                cv_image = cv2.warpAffine(cv_image, M, cv_image.shape[1::-1])
-
-            circles_per_box = {}
-            
-            # Sort boxes with exemplo circles first
-            boxes = sorted(job.get("boxes", []), key=lambda x: 0 if x.get("rect_type") == BoxRectangleType.EXEMPLO_CIRCULO else 1)
-            total_boxes = len(boxes)
-
-            for box_index, box in enumerate(boxes):
-                try:
-                    rect = box.get("rect")
-                    rect_type = box.get("rect_type")
-                    box_name = box.get("name")
-                    
-                    if not all([rect, rect_type, box_name]):
-                        continue
-
-                    circle_size = job.get("circle_size")
-                    if rect_type == BoxRectangleType.EXEMPLO_CIRCULO:
-                        circle_size = None
-
-                    # Prepare rectangle info for progress tracking
-                    rectangle_info = {
-                        'index': box_index + 1,
-                        'total': total_boxes,
-                        'name': box_name,
-                        'page_info': page_info  # Add page info to rectangle info
-                    }
-
-                    if job.get("use_fallback_method") and box.get("template_circles"):
-                        circles = await find_circles_fallback("",
-                            rect,
-                            rectangle_type=rect_type,
-                            template_circles=box["template_circles"],
-                            darkness_threshold=job.get("darkness_threshold", 0),
-                            img=cv_image,
-                            on_progress=lambda x: send_progress(websocket, f"{page_info}{x}", job["task_id"])
-                        )
-                    else:
-                        circles = await find_circles_cv2("", rect, rect_type, 
-                            img=cv_image,
-                            circle_size=circle_size,
-                            dp=job.get("inverse_ratio_accumulator_resolution", 1),
-                            darkness_threshold=job.get("darkness_threshold", 0),
-                            circle_precision_percentage=job.get("circle_precision_percentage", 1),
-                            param2=job.get("param2", 30),
-                            on_progress=lambda x: send_progress(websocket, f"{page_info}{x}", job["task_id"]),
-                            rectangle_info=rectangle_info,
-                            use_parallel=job.get("use_parallel_processing", False),
-                            max_workers=job.get("max_parallel_workers", None)
-                        )
-
-                    # Process circles
-                    if rect_type == BoxRectangleType.EXEMPLO_CIRCULO and circles:
-                        job["circle_size"] = circles[0]["radius"] / cv_image.shape[1]
-
-                    for circle in circles:
-                        # Normalize coordinates
-                        if job.get("image_offset"):
-                            circle["center_x"] -= job["image_offset"]["x"]
-                            circle["center_y"] -= job["image_offset"]["y"]
-
-                        if job.get("image_angle") is not None:
-                            center = (cv_image.shape[1] // 2, cv_image.shape[0] // 2)
-                            M = cv2.getRotationMatrix2D(center, job["image_angle"], 1)
-                            circle["center_x"], circle["center_y"] = cv2.transform(
-                                np.array([[circle["center_x"],circle["center_y"]]]).reshape(-1,1,2),
-                                M
-                            ).reshape(2)
-
-                        # Normalize to image dimensions
-                        circle["center_x"] /= cv_image.shape[1]
-                        circle["center_y"] /= cv_image.shape[0]
-                        circle["radius"] /= cv_image.shape[1]
-
-                    circles_per_box[box_name] = circles
-
-                except Exception as e:
-                    Utils.log_error(f"Error processing box {box_name}: {str(e)}")
-                    circles_per_box[box_name] = []
-
+            # decoded pages count against the memory budget while they are processed
+            with memory_budget.holding(page_charge(file_id, cv_image)):
+                circles_per_box = await worker_pool.run_async(
+                    find_circles_in_page, job, cv_image, page_info,
+                    job_progress(websocket, job["task_id"], page_info)
+                )
             circles_final[file_id] = circles_per_box
             
             # Add page completion summary
@@ -336,6 +624,8 @@ async def handle_find_circles(job, websocket):
             page_progress = f"({file_index + 1}/{total_files})" if total_files > 1 else ""
             await send_progress(websocket, f"{page_info}✅ Page {file_index + 1} complete! {page_progress}\nFound {total_circles_on_page} total circles across {len(circles_per_box)} regions", job["task_id"])
 
+        except WorkerPoolFullError:
+            raise
         except Exception as e:
             Utils.log_error(f"Error processing file {file_id}: {str(e)}")
             circles_final[file_id] = {}
@@ -351,17 +641,103 @@ async def handle_find_circles(job, websocket):
         )
         await send_progress(websocket, f"🎉 All {total_files} pages processed!\nTotal circles found: {total_circles_all_pages} across all pages", job["task_id"])
 
-    await websocket.send(json.dumps({
+    await get_writer(websocket).send(json.dumps({
         "status": WebsocketMessageStatus.COMPLETED_TASK,
         "data": {
             "task_id": job["task_id"],
             "circles": circles_final
         }
-    }))
+    }), task_id=job["task_id"])
+
+async def handle_find_circles_batch(job, websocket):
+    """
+    Find circles in a multi-page job ("batch": true).
+
+    Pages share the job's box template and are processed concurrently, up to
+    FIND_CIRCLES_PAGE_CONCURRENCY (or the job's smaller "page_concurrency").
+    Each page starts as soon as its file is received and its circles are sent
+    in a PAGE_COMPLETED message when done; COMPLETED_TASK only carries a summary.
+    """
+    task_id = job["task_id"]
+    total_files = len(job["file_ids"])
+    page_concurrency = max(1, min(job.get("page_concurrency") or FIND_CIRCLES_PAGE_CONCURRENCY, FIND_CIRCLES_PAGE_CONCURRENCY))
+    semaphore = asyncio.Semaphore(page_concurrency)
+    started_at = time.time()
+
+    await send_progress(websocket, f"Processing {total_files} pages for circle detection ({page_concurrency} at a time)...", task_id)
+
+    async def process_page(file_index, file_id):
+        page_info = f"[Page {file_index + 1}/{total_files}] "
+        error = None
+        circles_per_box = {}
+
+        try:
+            await wait_for_files([file_id])
+
+            async with semaphore:
+                check_rejected_uploads({"file_ids": [file_id]})
+                file = files_received.get(file_id)
+                if file is None and file_id not in session_page_per_file_id:
+                    raise Exception(f"File {file_id} not found")
+
+                cv_image = await load_page_image(file_id, file)
+                # The buffer is not needed anymore once the page is decoded
+                del file
+                drop_upload(file_id)
+
+                # Every page gets its own copy of the job: the example circle box updates "circle_size"
+                with memory_budget.holding(page_charge(file_id, cv_image)):
+                    circles_per_box = await worker_pool.run_async(
+                        find_circles_in_page, dict(job), cv_image, page_info,
+                        job_progress(websocket, task_id, page_info)
+                    )
+        except Exception as e:
+            Utils.log_error(f"Error processing file {file_id}: {str(e)}")
+            error = str(e)
+
+        await get_writer(websocket).send(json.dumps({
+            "status": WebsocketMessageStatus.PAGE_COMPLETED,
+            "data": {
+                "task_id": task_id,
+                "file_id": file_id,
+                "page_index": file_index,
+                "circles": circles_per_box,
+                "error": error
+            }
+        }), task_id=task_id)
+
+        return error is None, sum(len(circles) for circles in circles_per_box.values())
+
+    results = await asyncio.gather(*(process_page(index, file_id) for index, file_id in enumerate(job["file_ids"])))
+
+    failed_file_ids = [file_id for file_id, (succeeded, _) in zip(job["file_ids"], results) if not succeeded]
+    total_circles = sum(circle_count for _, circle_count in results)
+
+    await send_progress(websocket, f"🎉 All {total_files} pages processed!\nTotal circles found: {total_circles} across all pages", task_id)
+
+    await get_writer(websocket).send(json.dumps({
+        "status": WebsocketMessageStatus.COMPLETED_TASK,
+        "data": {
+            "task_id": task_id,
+            "summary": {
+                "total_pages": total_files,
+                "completed_pages": total_files - len(failed_file_ids),
+                "failed_file_ids": failed_file_ids,
+                "total_circles": total_circles,
+                "page_concurrency": page_concurrency,
+                "elapsed_seconds": round(time.time() - started_at, 3)
+            }
+        }
+    }), task_id=task_id)
 
 async def send_progress(websocket, message, task_id):
-    Utils.log_info(f"Sending progress: {message}")
-    await websocket.send(json.dumps({"status": WebsocketMessageStatus.PROGRESS,'data': {
+    """
+    Queue a progress message of a task. It never waits on the socket: the connection
+    writer sends the latest message of each task at most every PROGRESS_MIN_INTERVAL.
+    """
+    if Utils.is_debug():
+        Utils.log_info(f"Sending progress: {message}")
+    get_writer(websocket).progress(task_id, json.dumps({"status": WebsocketMessageStatus.PROGRESS,'data': {
         'task_id': task_id,
         'message': message
     }}))
@@ -384,37 +760,110 @@ async def check_inactivity():
             Utils.log_info(f"⚠️ No connections for {LOCAL_CONFIG['inactivity_timeout']} seconds. Shutting down server...")
             os._exit(0)
 
+async def receive_file_chunk(websocket, task_id: str, file_id: str, chunk, is_final: bool):
+    """
+    Append an uploaded chunk to its file buffer and notify the task once the file is complete.
+    Uploads that do not fit in the memory budget are dropped, with a RETRY_LATER status.
+    """
+    if file_id in dropped_uploads:
+        if is_final:
+            dropped_uploads.discard(file_id)
+        return
+
+    if not memory_budget.try_reserve(len(chunk)):
+        error = MemoryBudgetExceeded(f"Upload of {file_id} does not fit in the memory budget", MEMORY_CONFIG['retry_after'])
+        # the job waiting for the file fails with the same status
+        reject_upload(file_id, error, is_final)
+        await send_retry_later(websocket, task_id, error, file_id)
+        return
+
+    upload_bytes_per_file_id[file_id] = upload_bytes_per_file_id.get(file_id, 0) + len(chunk)
+    uploads_per_client.setdefault(get_client_id(websocket), set()).add(file_id)
+    if file_id not in chunks_per_file_id:
+        chunks_per_file_id[file_id] = bytearray()
+    chunks_per_file_id[file_id] += chunk
+
+    if not is_final:
+        return
+
+    Utils.log_info(f"📁 Received complete file: {file_id}")
+    files_received[file_id] = chunks_per_file_id[file_id]
+    del chunks_per_file_id[file_id]
+    file_hash_per_file_id[file_id] = content_store.put(files_received[file_id])
+    memory_budget.fit()
+    chunk_sequence_per_file_id.pop(file_id, None)
+
+    get_file_received_event(file_id).set()
+
+    await send_progress(websocket, f'📁 File received: {len(files_received[file_id])} bytes', task_id)
+
+async def handle_binary_message(websocket, message):
+    """Handle a file chunk sent as a binary frame by a client that negotiated binary transfers."""
+    frame = decode_frame(message)
+    if frame.file_id in dropped_uploads:
+        await receive_file_chunk(websocket, frame.task_id, frame.file_id, frame.payload, frame.is_final)
+        return
+
+    expected_sequence = chunk_sequence_per_file_id.get(frame.file_id, 0)
+    if frame.sequence != expected_sequence:
+        error = Exception(f"Out of order chunk for file {frame.file_id}: expected {expected_sequence}, got {frame.sequence}")
+        Utils.log_error(f"❌ {error}")
+        reject_upload(frame.file_id, error, frame.is_final)
+        await get_writer(websocket).send(json.dumps({
+            "status": WebsocketMessageStatus.ERROR,
+            "data": {
+                "task_id": frame.task_id,
+                "file_id": frame.file_id,
+                "error": str(error)
+            }
+        }), task_id=frame.task_id)
+        return
+    chunk_sequence_per_file_id[frame.file_id] = expected_sequence + 1
+
+    await receive_file_chunk(websocket, frame.task_id, frame.file_id, frame.payload, frame.is_final)
+
+async def handle_query_cached_files(websocket, data):
+    """Tell the client which of the file hashes it asks about are cached and need no upload."""
+    hashes = content_store.held(data.get("hashes") or [])
+    Utils.log_info(f"🗄️ {len(hashes)} of {len(data.get('hashes') or [])} queried files are cached ({content_store.size / 1024 / 1024:.1f} MB held)")
+    await get_writer(websocket).send(json.dumps({
+        "status": WebsocketMessageStatus.CACHED_FILES,
+        "data": {
+            "task_id": data.get("task_id"),
+            "hashes": hashes
+        }
+    }))
+
 async def handle_client(websocket, path=None):
     """Handle incoming WebSocket connections from desktop clients."""
     global last_connection_time
-    client_id = f"client_{id(websocket)}"
+    client_id = get_client_id(websocket)
     connected_clients[client_id] = websocket
+    writer_per_client[client_id] = ConnectionWriter(websocket, **CONNECTION_WRITER_CONFIG)
     last_connection_time = time.time()
     
     Utils.log_info(f"🔗 Client connected: {client_id} from {websocket.remote_address}")
     
     try:
         # Send welcome message
-        await websocket.send(json.dumps({
+        await get_writer(websocket).send(json.dumps({
             "status": WebsocketMessageStatus.CONNECTED,
             "data": {
                 "message": "Connected to local processing server",
                 "server_version": Utils.get_version(),
-                "client_id": client_id
+                "client_id": client_id,
+                "protocol": ProtocolSettings.capabilities()
             }
         }))
         
         async for message in websocket:
             try:
-                response = json.loads(message)
+                if isinstance(message, bytes):
+                    await handle_binary_message(websocket, message)
+                    continue
 
-                
+                response = json.loads(message)
 
-                # Handle different message types
-                if type(response["data"]) == dict and response["data"].get("task_id"):
-                    task_id = response["data"]["task_id"]
-                    if task_id not in messages_per_task_id:
-                        messages_per_task_id[task_id] = SimpleQueue()
                 
                 if "command" in response:
                     if response.get("command") != WebsocketMessageCommand.PING:
@@ -422,55 +871,53 @@ async def handle_client(websocket, path=None):
 
                     if response["command"] == WebsocketMessageCommand.READ_TO_IMAGES or response["command"] == WebsocketMessageCommand.FIND_CIRCLES:
                         Utils.log_info(f"🎯 Processing {response['command']} command")
-                        asyncio.create_task(handle_job_received({
+                        job_task = asyncio.create_task(handle_job_received({
                             "command": response["command"],
                             **response["data"]
                         }, websocket))
+                        jobs = jobs_per_client.setdefault(client_id, set())
+                        jobs.add(job_task)
+                        job_task.add_done_callback(jobs.discard)
                     
                     elif response["command"] == WebsocketMessageCommand.PING:
-                        await websocket.send(json.dumps({"status": WebsocketMessageStatus.PONG}))
+                        await get_writer(websocket).send(json.dumps({"status": WebsocketMessageStatus.PONG}))
                         #Utils.log_info(f"🏓 Ping/Pong with {client_id}")
+
+                    elif response["command"] == WebsocketMessageCommand.QUERY_CACHED_FILES:
+                        await handle_query_cached_files(websocket, response.get("data") or {})
+
+                    elif response["command"] == WebsocketMessageCommand.NEGOTIATE_PROTOCOL:
+                        settings = ProtocolSettings.negotiate(response.get("data"))
+                        protocol_per_client[client_id] = settings
+                        Utils.log_info(f"🤝 Negotiated protocol with {client_id}: {settings.to_dict()}")
+                        await get_writer(websocket).send(json.dumps({
+                            "status": WebsocketMessageStatus.PROTOCOL_NEGOTIATED,
+                            "data": settings.to_dict()
+                        }))
                 
                 else:
                     # Handle chunk messages
-                    if response["status"] == WebsocketMessageStatus.SENDING_CHUNK:
-                        task_id = response["data"]["task_id"]
-                        file_id = response["data"]["file_id"]
-                        
-                        if file_id not in chunks_per_file_id:
-                            chunks_per_file_id[file_id] = bytearray()
-                        chunks_per_file_id[file_id] += bytearray(b64decode(response["data"]["chunk"]))
-                        
-                    elif response["status"] == WebsocketMessageStatus.FINAL_CHUNK:
-                        task_id = response["data"]["task_id"]
-                        file_id = response["data"]["file_id"]
-                        
-                        if file_id not in chunks_per_file_id:
-                            chunks_per_file_id[file_id] = bytearray()
-                        
-                        Utils.log_info(f"📁 Received complete file: {file_id}")
-                        chunks_per_file_id[file_id] += bytearray(b64decode(response["data"]["chunk"]))
-                        files_received[file_id] = chunks_per_file_id[file_id]
-                        del chunks_per_file_id[file_id]
-                        
-                        await send_progress(websocket, f'📁 File received: {len(files_received[file_id])} bytes', task_id)
-                        
-                        messages_per_task_id[task_id].put({"status": InternalClientMessageType.FILE_RECEIVED, "data": {
-                            "file_id": file_id
-                        }})
+                    if response["status"] in (WebsocketMessageStatus.SENDING_CHUNK, WebsocketMessageStatus.FINAL_CHUNK):
+                        await receive_file_chunk(
+                            websocket,
+                            response["data"]["task_id"],
+                            response["data"]["file_id"],
+                            b64decode(response["data"]["chunk"]),
+                            response["status"] == WebsocketMessageStatus.FINAL_CHUNK
+                        )
                     
                     elif response["status"] == WebsocketMessageStatus.ERROR:
                         Utils.log_error(f"❌ Client error: {response.get('error', 'Unknown error')}")
                         
             except json.JSONDecodeError as e:
                 Utils.log_error(f"❌ Invalid JSON from {client_id}: {e}")
-                await websocket.send(json.dumps({
+                await get_writer(websocket).send(json.dumps({
                     "status": WebsocketMessageStatus.ERROR,
                     "data": {"error": "Invalid JSON format"}
                 }))
             except Exception as e:
                 Utils.log_error(f"❌ Error processing message from {client_id}: {str(e)}")
-                await websocket.send(json.dumps({
+                await get_writer(websocket).send(json.dumps({
                     "status": WebsocketMessageStatus.ERROR,
                     "data": {"error": str(e)}
                 }))
@@ -483,12 +930,21 @@ async def handle_client(websocket, path=None):
         # Clean up client data
         if client_id in connected_clients:
             del connected_clients[client_id]
+        protocol_per_client.pop(client_id, None)
+        writer = writer_per_client.pop(client_id, None)
+        if writer is not None:
+            await writer.close()
+        pages_per_client.pop(client_id, None)
+        # Jobs of the connection give their memory back, partial uploads are dropped
+        for job_task in jobs_per_client.pop(client_id, set()):
+            job_task.cancel()
+        release_files(list(uploads_per_client.pop(client_id, set())))
         Utils.log_info(f"🧹 Cleaned up client: {client_id}")
 
 async def monitor_memory():
     """
-    Monitors the memory usage and restarts the script if memory exceeds a threshold.
-    Prints memory usage stats every 5 minutes.
+    Monitors the memory usage and empties the caches if memory exceeds a threshold.
+    Prints memory usage stats every 10 minutes.
     """
     process = psutil.Process(os.getpid())  # Get current process info
     print_counter = 0  # Counter for printing memory stats
@@ -500,31 +956,26 @@ async def monitor_memory():
         
         # Print memory stats every 10 minutes (120 iterations with 5-second sleep)
         if print_counter >= 120:
+            budget_stats = memory_budget.stats()
             print("\n💾 Memory Usage Stats:")
             print(f"Process RSS (Physical RAM Used): {mem_info.rss / 1024 / 1024:.2f} MB")
             print(f"Process VMS (Total Virtual Memory): {mem_info.vms / 1024 / 1024:.2f} MB")
             print(f"System Memory Used: {used_memory_percent:.1f}%")
             print(f"System Memory Available: {system_memory.available / 1024 / 1024:.2f} MB")
+            print(f"Memory Budget Used: {budget_stats['used_bytes'] / 1024 / 1024:.2f} / {budget_stats['max_bytes'] / 1024 / 1024:.0f} MB "
+                  f"(caches {sum(budget_stats['cached_bytes'].values()) / 1024 / 1024:.2f} MB, {budget_stats['rejected']} rejected)")
             print(f"Connected Clients: {len(connected_clients)}")
             print("-" * 60)
             print_counter = 0  # Reset counter
         
         if used_memory_percent > MEMORY_THRESHOLD_PERCENT:
-            print(f"⚠️  Memory usage is too high ({used_memory_percent}%). Restarting the script.")
-            await reset_script()
+            # Running jobs keep their memory, new uploads and jobs are turned away by the budget
+            freed = memory_budget.reclaim(memory_budget.cached)
+            print(f"⚠️  Memory usage is too high ({used_memory_percent}%). Emptied the caches ({freed / 1024 / 1024:.2f} MB).")
 
         await asyncio.sleep(CHECK_INTERVAL)  # Check based on config
         print_counter += 1
 
-async def reset_script():
-    """
-    Resets the script by terminating the current process and restarting it.
-    """
-    print("🔄 Resetting the script...")
-
-    if sys.executable:
-        os.execv(sys.executable, [sys.executable] + sys.argv)
-
 async def main():
     # Start memory monitoring task
     asyncio.create_task(monitor_memory())
@@ -536,6 +987,18 @@ async def main():
     Utils.log_info(f"🏠 Host: {LOCAL_CONFIG['host']}")
     Utils.log_info(f"🔌 Port: {LOCAL_CONFIG['port']}")
     Utils.log_info(f"⏰ Inactivity Timeout: {LOCAL_CONFIG['inactivity_timeout']} seconds")
+    Utils.log_info(f"🧵 Worker Pool: {WORKER_POOL_CONFIG['max_workers']} workers, queue depth {WORKER_POOL_CONFIG['max_queue_depth']}")
+    Utils.log_info(f"📄 Batch Page Concurrency: {FIND_CIRCLES_PAGE_CONCURRENCY}")
+    Utils.log_info(f"🔎 Hough Search: {HOUGH_SEARCH_CONFIG['strategy']} (call budget: {HOUGH_SEARCH_CONFIG['call_budget'] or 'unlimited'})")
+    Utils.log_info(f"📚 PDF Pages In Flight: {READ_TO_IMAGES_CONFIG['pages_in_flight']} ({'grayscale' if READ_TO_IMAGES_CONFIG['grayscale'] else 'color'} rendering)")
+    Utils.log_info(f"📠 Scanned PDF Image Extraction: {'Enabled' if READ_TO_IMAGES_CONFIG['extract_scans'] else 'Disabled'}")
+    Utils.log_info(f"🪄 Calibration Workers: {CALIBRATION_CONFIG['max_workers']} processes, {CALIBRATION_CONFIG['memory_per_worker_mb']} MB each")
+    Utils.log_info(f"🔺 Corner Detection Pyramid: 1/{CORNER_DETECTION_CONFIG['pyramid_factor']} scale (tolerance {CORNER_DETECTION_CONFIG['tolerance_px']} px)")
+    Utils.log_info(f"🗄️ Content Store: {CONTENT_STORE_CONFIG['max_mb']} MB")
+    Utils.log_info(f"🖼️ Page Output Format: {PAGE_ENCODING_CONFIG['format']} (quality {PAGE_ENCODING_CONFIG['quality']}, PNG compression {PAGE_ENCODING_CONFIG['png_compression']})")
+    Utils.log_info(f"📨 Progress Messages: at most one every {CONNECTION_WRITER_CONFIG['progress_interval']} s per task, {CONNECTION_WRITER_CONFIG['max_queue']} queued results")
+    Utils.log_info(f"🗂️ Session Pages: {SESSION_PAGES_CONFIG['max_mb']} MB per connection, {SESSION_PAGES_CONFIG['ttl_seconds']} s TTL")
+    Utils.log_info(f"🧮 Memory Budget: {MEMORY_CONFIG['budget_mb']} MB, job reserve {MEMORY_CONFIG['job_reserve_mb']} MB (queued up to {MEMORY_CONFIG['queue_timeout']} s), files awaited up to {MEMORY_CONFIG['upload_timeout']} s")
     Utils.log_info(f"📖 Version: {Utils.get_version()}")
     Utils.log_info(f"🔧 Debug Mode: {'Enabled' if Utils.is_debug() else 'Disabled'}")
     
@@ -549,6 +1012,9 @@ async def main():
         await asyncio.Future()  # run forever
 
 if __name__ == "__main__":
+    # Calibration worker processes are spawned from the frozen executable too
+    multiprocessing.freeze_support()
+
     # Load and apply configuration
     if config.is_debug_mode():
         config.print_config_summary()
@@ -560,6 +1026,7 @@ if __name__ == "__main__":
         asyncio.run(main())
     except KeyboardInterrupt:
         print("\n👋 Server shutting down...")
+        calibration_pool.shutdown(wait=False)
     except Exception as e:
         Utils.log_error(f"❌ Server error: {str(e)}")
         sys.exit(1) 
\ No newline at end of file
@@ -0,0 +1,139 @@
+"""
+Byte budget of the memory the local processing server holds on to.
+
+Upload buffers, decoded pages and the memory reserved by running jobs are
+charged against one budget, together with the caches (content store, session
+pages). When something new would not fit, the caches shrink first (least
+recently used entries go); when that is not enough, the new upload or job is
+turned away with a RETRY_LATER status instead of the server running out of
+memory, and jobs wait for running ones to release their memory first.
+"""
+
+import asyncio
+import time
+from contextlib import contextmanager
+
+
+class MemoryBudgetExceeded(Exception):
+    """Raised when an upload or job does not fit in the memory budget, the client should retry after `retry_after` seconds."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class MemoryBudget:
+    """
+    Charged bytes plus registered cache sizes, kept within `max_bytes`.
+    Meant to be used from the event loop only.
+    """
+
+    def __init__(self, max_bytes):
+        """
+        Args:
+            max_bytes: Bytes that uploads, decoded pages, job reserves and caches may hold in total
+        """
+        self.max_bytes = max_bytes
+        self.charged = 0
+        self.rejected = 0
+        self._caches = []
+        self._freed = asyncio.Event()
+
+    def add_cache(self, name, size, shrink):
+        """
+        Register a cache that shrinks before anything is rejected, in registration order.
+
+        Args:
+            name: Name used in the stats
+            size: Callable returning the bytes the cache holds
+            shrink: Callable evicting entries until the cache holds at most the given bytes
+        """
+        self._caches.append((name, size, shrink))
+
+    @property
+    def cached(self):
+        return sum(size() for _, size, _ in self._caches)
+
+    @property
+    def used(self):
+        return self.charged + self.cached
+
+    def reclaim(self, nbytes):
+        """Shrink the caches by up to `nbytes`, returns the bytes freed."""
+        freed = 0
+        for _, size, shrink in self._caches:
+            if freed >= nbytes:
+                break
+            before = size()
+            shrink(max(0, before - (nbytes - freed)))
+            freed += before - size()
+        return freed
+
+    def fit(self):
+        """Shrink the caches after one of them grew past the budget."""
+        overflow = self.used - self.max_bytes
+        if overflow > 0:
+            self.reclaim(overflow)
+
+    def try_reserve(self, nbytes):
+        """Charge `nbytes` if they fit, shrinking the caches when needed. False when they do not fit."""
+        overflow = self.used + nbytes - self.max_bytes
+        if overflow > 0:
+            self.reclaim(overflow)
+            if self.used + nbytes > self.max_bytes:
+                self.rejected += 1
+                return False
+
+        self.charged += nbytes
+        return True
+
+    def charge(self, nbytes):
+        """Charge memory that is already allocated (e.g. a decoded page), shrinking the caches to make room."""
+        overflow = self.used + nbytes - self.max_bytes
+        if overflow > 0:
+            self.reclaim(overflow)
+        self.charged += nbytes
+
+    @contextmanager
+    def holding(self, nbytes):
+        """Charge `nbytes` for the duration of a block (see `charge`)."""
+        self.charge(nbytes)
+        try:
+            yield
+        finally:
+            self.release(nbytes)
+
+    def release(self, nbytes):
+        """Give back charged bytes and wake up the reservations waiting for memory."""
+        if nbytes <= 0:
+            return
+        self.charged = max(0, self.charged - nbytes)
+        self._freed.set()
+        self._freed = asyncio.Event()
+
+    async def reserve(self, nbytes, timeout):
+        """
+        Charge `nbytes`, waiting up to `timeout` seconds for charged memory to be released.
+        Returns False when they still do not fit.
+        """
+        deadline = time.monotonic() + timeout
+        while not self.try_reserve(nbytes):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(self._freed.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return False
+            # the failed attempt above is not a rejection yet
+            self.rejected -= 1
+        return True
+
+    def stats(self):
+        return {
+            "max_bytes": self.max_bytes,
+            "used_bytes": self.used,
+            "charged_bytes": self.charged,
+            "cached_bytes": {name: size() for name, size, _ in self._caches},
+            "rejected": self.rejected,
+        }
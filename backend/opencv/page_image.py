@@ -0,0 +1,103 @@
+"""
+In-memory page representation shared by reading, calibration and circle detection.
+
+A page is a contiguous uint8 array, (height, width) for grayscale pages and
+(height, width, 3) BGR for color ones, as OpenCV expects it. PIL images only
+appear at the edges: decoding rendered or uploaded pages (`PageImage.from_pil`)
+and encoding pages sent to the client (`PageImage.to_pil`).
+
+Every full-page buffer a page goes through is counted in its `stats`, so the
+allocations and bytes copied per page can be reported (see `PageImage.report`).
+"""
+
+import numpy as np
+import cv2
+from PIL import Image
+
+
+class PageImage:
+    """A page as a contiguous uint8 array plus metadata (page number, source, ...)."""
+
+    def __init__(self, array, metadata=None, stats=None):
+        """
+        Args:
+            array: uint8 array, (height, width) grayscale or (height, width, 3) BGR
+            metadata: Free-form page information, carried over to derived pages
+            stats: Buffer accounting of the page so far (new pages start empty)
+        """
+        if array.dtype != np.uint8 or array.ndim not in (2, 3):
+            raise ValueError(f"Pages are 2D or BGR uint8 arrays, got {array.dtype} with shape {array.shape}")
+        if not array.flags['C_CONTIGUOUS']:
+            raise ValueError("Page arrays must be contiguous")
+
+        self.array = array
+        self.metadata = dict(metadata or {})
+        self.stats = stats if stats is not None else {"allocations": 0, "copied_bytes": 0, "steps": []}
+
+    @classmethod
+    def from_pil(cls, image, **metadata):
+        """Decode a PIL image: 'L' pages stay single channel, anything else becomes BGR."""
+        if image.mode not in ('L', 'RGB'):
+            image = image.convert('L' if image.mode in ('1', 'I', 'I;16', 'F') else 'RGB')
+
+        array = np.array(image)
+        if array.ndim == 3:
+            # in place, the copy out of PIL is the only buffer
+            cv2.cvtColor(array, cv2.COLOR_RGB2BGR, dst=array)
+
+        page = cls(array, metadata)
+        page.record("decode", array)
+        return page
+
+    def to_pil(self):
+        """PIL image of the page, for encoding it at the edge."""
+        if self.array.ndim == 2:
+            return Image.fromarray(self.array)
+        rgb = cv2.cvtColor(self.array, cv2.COLOR_BGR2RGB)
+        self.record("to_pil", rgb)
+        return Image.fromarray(rgb)
+
+    @property
+    def width(self):
+        return self.array.shape[1]
+
+    @property
+    def height(self):
+        return self.array.shape[0]
+
+    @property
+    def size(self):
+        """(width, height), like PIL's Image.size."""
+        return self.width, self.height
+
+    @property
+    def is_gray(self):
+        return self.array.ndim == 2
+
+    def record(self, step, array):
+        """Count a full-page buffer allocated by `step`."""
+        self.stats["allocations"] += 1
+        self.stats["copied_bytes"] += array.nbytes
+        self.stats["steps"].append((step, array.nbytes))
+
+    def derive(self, array, step):
+        """
+        A new page holding `array`, the result of `step` on this one.
+        It keeps the metadata and the buffer accounting, plus the new buffer.
+        """
+        if array is self.array:
+            return self
+        page = PageImage(np.ascontiguousarray(array), self.metadata, {
+            "allocations": self.stats["allocations"],
+            "copied_bytes": self.stats["copied_bytes"],
+            "steps": list(self.stats["steps"]),
+        })
+        page.record(step, array)
+        return page
+
+    def report(self):
+        """One line summary of the buffers allocated for this page."""
+        steps = ", ".join(f"{step} {nbytes / 1024:.0f} KB" for step, nbytes in self.stats["steps"])
+        return (f"{self.width}x{self.height} {'gray' if self.is_gray else 'BGR'}: "
+                f"{self.stats['allocations']} buffers, {self.stats['copied_bytes'] / (1024 * 1024):.2f} MB copied"
+                + (f" ({steps})" if steps else ""))
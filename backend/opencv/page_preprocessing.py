@@ -0,0 +1,149 @@
+"""
+Page-level preprocessing shared by every box detector of a page.
+
+Circle detection works on a page aligned with the job's `image_offset` and
+`image_angle` and scaled to 4000 px width. Instead of warping and upscaling the
+whole page, a `PagePreprocessor` composes alignment, scale and crop into a
+single affine matrix per box and only warps the pixels of that box. Blurred and
+grayscale planes are computed lazily for each region the first time a box asks
+for them, and detected coordinates are mapped back to the original page with
+one vectorized inverse transform.
+"""
+
+import cv2
+import numpy as np
+
+# Width every page is scaled to before running circle detection
+PAGE_TARGET_WIDTH = 4000
+
+# Blur applied to box crops before the Hough transform
+BLUR_KERNEL_SIZE = (17, 17)
+BLUR_SIGMA = 1.5
+
+
+def page_alignment_transform(shape, image_offset=None, image_angle=None):
+    """
+    Build the 2x3 affine matrix that aligns a page: translate by `image_offset`
+    ({x, y} in pixels), then rotate by `image_angle` degrees around the page center.
+
+    Returns None when the page needs no alignment.
+    """
+    if not image_offset and image_angle is None:
+        return None
+
+    transform = np.eye(3)
+
+    if image_offset:
+        transform[:2, 2] = (image_offset["x"], image_offset["y"])
+
+    if image_angle is not None:
+        center = (shape[1] // 2, shape[0] // 2)
+        rotation = np.vstack([cv2.getRotationMatrix2D(center, -image_angle, 1), [0, 0, 1]])
+        transform = rotation @ transform
+
+    return transform[:2]
+
+
+class PagePreprocessor:
+    """Aligned, scaled page regions with cached blurred and gray planes."""
+
+    def __init__(self, img, target_width=PAGE_TARGET_WIDTH, transform=None):
+        """
+        Args:
+            img: The page as a BGR or single channel grayscale image
+            target_width: Width the page is scaled to before detection
+            transform: Optional 2x3 alignment matrix (see `page_alignment_transform`)
+        """
+        self.original = img
+        self.target_width = target_width
+        self.width_ratio = target_width / img.shape[1]
+        self.transform = None if transform is None else np.asarray(transform, dtype=np.float64)
+        self._blurred = {}
+        self._gray = {}
+
+    @property
+    def shape(self):
+        """Shape of the aligned page scaled to `target_width`, as cv2.resize would produce it."""
+        height, width = self.original.shape[:2]
+        return (int(round(height * self.width_ratio)), int(round(width * self.width_ratio))) + self.original.shape[2:]
+
+    def to_pixels(self, rectangle):
+        """
+        Convert a relative rectangle ({left, top, width, height} in 0..1) to
+        absolute (x, y, width, height) in the scaled page.
+        """
+        old_x, old_y, width, height = rectangle.values()
+
+        if old_x > 1 or old_y > 1 or width > 1 or height > 1 or old_x < 0 or old_y < 0 or width < 0 or height < 0:
+            raise ValueError("The rectangle values must be between 0 and 1.")
+
+        img_height, img_width = self.shape[:2]
+        return (
+            int(old_x * img_width),
+            int(old_y * img_height),
+            int(width * img_width),
+            int(height * img_height)
+        )
+
+    def region_transform(self, region):
+        """
+        Affine matrix mapping original page pixels to pixels of `region` in the
+        aligned, scaled page: alignment, then scale (with cv2.resize's pixel-center
+        convention), then crop.
+        """
+        x, y = region[:2]
+        ratio = self.width_ratio
+
+        scale_and_crop = np.array([
+            [ratio, 0, 0.5 * ratio - 0.5 - x],
+            [0, ratio, 0.5 * ratio - 0.5 - y],
+            [0, 0, 1]
+        ])
+
+        if self.transform is not None:
+            scale_and_crop = scale_and_crop @ np.vstack([self.transform, [0, 0, 1]])
+
+        return scale_and_crop[:2]
+
+    def crop(self, region):
+        """Crop of `region` (x, y, width, height) in the aligned, scaled page. Only the region's pixels are warped."""
+        x, y, width, height = region
+        img_height, img_width = self.shape[:2]
+
+        # Regions hanging over the page border are clipped, like slicing the full page would
+        width = max(0, min(width, img_width - x))
+        height = max(0, min(height, img_height - y))
+
+        # Without alignment, replicate the border like cv2.resize; aligned pages get the black fill of the old full-page warps
+        border_mode = cv2.BORDER_REPLICATE if self.transform is None else cv2.BORDER_CONSTANT
+
+        return cv2.warpAffine(
+            self.original, self.region_transform(region), (width, height),
+            flags=cv2.INTER_LINEAR, borderMode=border_mode
+        )
+
+    def blurred(self, region):
+        """Gaussian blurred crop of `region`, cached per region."""
+        if region not in self._blurred:
+            self._blurred[region] = cv2.GaussianBlur(self.crop(region), BLUR_KERNEL_SIZE, BLUR_SIGMA)
+        return self._blurred[region]
+
+    def gray(self, region):
+        """Grayscale version of the blurred crop of `region`, cached per region."""
+        if region not in self._gray:
+            blurred = self.blurred(region)
+            self._gray[region] = blurred if blurred.ndim == 2 else cv2.cvtColor(blurred, cv2.COLOR_BGR2GRAY)
+        return self._gray[region]
+
+    def to_page_coordinates(self, points):
+        """
+        Map (N, 2) points from the aligned page (original resolution) back to the
+        original page, undoing the alignment transform in a single call.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+
+        if self.transform is None or len(points) == 0:
+            return points
+
+        inverse = cv2.invertAffineTransform(self.transform)
+        return cv2.transform(points.reshape(-1, 1, 2), inverse).reshape(-1, 2)
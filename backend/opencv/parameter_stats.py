@@ -0,0 +1,267 @@
+"""
+Parameter statistics sink for circle detection.
+
+Every processed box records how many circles each Hough parameter combination
+found. Instead of rewriting the aggregated JSON file for every box, records are
+queued in memory and a background thread appends them as compact JSON lines to
+a log file. From time to time the log is compacted into the aggregated
+per-type view (`parameter_circle_counts_all_types.json`, last 50 entries per
+rectangle type).
+
+Appends and compaction take a lock file created with O_EXCL, so several
+processes can share the same files, and the aggregated file is replaced
+atomically (temp file + os.replace).
+"""
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from utils import Utils
+
+# Aggregated per-type view read by the tooling
+STATS_FILENAME = "parameter_circle_counts_all_types.json"
+
+# Append-only log of records not compacted yet
+STATS_LOG_FILENAME = "parameter_circle_counts.jsonl"
+
+# Entries kept per rectangle type in the aggregated view
+MAX_ENTRIES_PER_TYPE = 50
+
+# A lock older than this is considered left behind by a dead process
+LOCK_STALE_SECONDS = 30
+
+# How long a flush waits for the lock before keeping its records for the next one
+LOCK_TIMEOUT_SECONDS = 5
+
+
+def build_entry(param_circle_counts, rectangle_type, rectangle_info=None):
+    """Build the statistics record of one box."""
+    entry = {
+        'rectangle_type': rectangle_type.value if hasattr(rectangle_type, 'value') else str(rectangle_type),
+        'timestamp': datetime.now().isoformat(),
+        'parameter_combinations': param_circle_counts
+    }
+
+    if rectangle_info:
+        entry['rectangle_info'] = {
+            'name': rectangle_info.get('name', 'Unknown'),
+            'index': rectangle_info.get('index', 1),
+            'total': rectangle_info.get('total', 1),
+            'page_info': rectangle_info.get('page_info', '')
+        }
+
+    return entry
+
+
+class FileLock:
+    """Cross-process lock based on creating a lock file with O_EXCL."""
+
+    def __init__(self, path, timeout=LOCK_TIMEOUT_SECONDS, stale_after=LOCK_STALE_SECONDS):
+        self.path = path
+        self.timeout = timeout
+        self.stale_after = stale_after
+        self._fd = None
+
+    def acquire(self):
+        """Try to take the lock until `timeout`, returns whether it was taken."""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                self._fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(self._fd, str(os.getpid()).encode())
+                return True
+            except FileExistsError:
+                self._remove_if_stale()
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.05)
+
+    def release(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def _remove_if_stale(self):
+        try:
+            if time.time() - os.path.getmtime(self.path) > self.stale_after:
+                os.remove(self.path)
+                Utils.log_error(f"Removed stale parameter stats lock {self.path}")
+        except FileNotFoundError:
+            pass
+
+
+def append_records(records, log_path=STATS_LOG_FILENAME):
+    """Append records as JSON lines with a single write."""
+    data = "".join(json.dumps(record, separators=(',', ':')) + "\n" for record in records)
+    fd = os.open(log_path, os.O_CREAT | os.O_APPEND | os.O_WRONLY, 0o644)
+    try:
+        os.write(fd, data.encode('utf-8'))
+    finally:
+        os.close(fd)
+
+
+def read_records(log_path=STATS_LOG_FILENAME):
+    """Read the records of the log, skipping lines that are not valid JSON."""
+    records = []
+    if not os.path.exists(log_path):
+        return records
+
+    with open(log_path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                Utils.log_error(f"Skipping invalid parameter stats record in {log_path}")
+    return records
+
+
+def merge_records(existing_data, records, max_entries=MAX_ENTRIES_PER_TYPE):
+    """Append records to the aggregated per-type view, keeping the last `max_entries` per type."""
+    for record in records:
+        record = dict(record)
+        rect_type_name = record.pop('rectangle_type', 'Unknown')
+        existing_data.setdefault(rect_type_name, []).append(record)
+
+    for rect_type_name, entries in existing_data.items():
+        if len(entries) > max_entries:
+            existing_data[rect_type_name] = entries[-max_entries:]
+
+    return existing_data
+
+
+def compact_parameter_stats(log_path=STATS_LOG_FILENAME, stats_path=STATS_FILENAME, max_entries=MAX_ENTRIES_PER_TYPE):
+    """
+    Fold the log into the aggregated view and empty the log.
+    Must be called with the stats lock held. Returns the number of compacted records.
+    """
+    records = read_records(log_path)
+    if not records:
+        return 0
+
+    existing_data = {}
+    if os.path.exists(stats_path):
+        try:
+            with open(stats_path, 'r') as f:
+                existing_data = json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            Utils.log_error(f"Failed to load existing data from {stats_path}: {e}")
+            existing_data = {}
+
+    merge_records(existing_data, records, max_entries)
+
+    temp_path = f"{stats_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(existing_data, f, indent=2)
+    os.replace(temp_path, stats_path)
+
+    os.remove(log_path)
+    return len(records)
+
+
+class ParameterStatsWriter:
+    """Queues statistics records and writes them from a background thread."""
+
+    def __init__(self, log_path=STATS_LOG_FILENAME, stats_path=STATS_FILENAME,
+                 flush_interval=1.0, compact_interval=30.0, max_entries=MAX_ENTRIES_PER_TYPE):
+        """
+        Args:
+            log_path: Append-only JSONL log
+            stats_path: Aggregated per-type JSON view
+            flush_interval: Seconds between appends of the queued records
+            compact_interval: Seconds between compactions of the log into the aggregated view
+            max_entries: Entries kept per rectangle type in the aggregated view
+        """
+        self.log_path = log_path
+        self.stats_path = stats_path
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self.max_entries = max_entries
+
+        self._queue = queue.Queue()
+        self._pending = []
+        self._last_compaction = time.monotonic()
+        self._stop = threading.Event()
+        self._io_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="parameter-stats-writer", daemon=True)
+        self._thread.start()
+
+    def record(self, entry):
+        """Queue a record, never blocks."""
+        self._queue.put_nowait(entry)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self._flush(compact=time.monotonic() - self._last_compaction >= self.compact_interval)
+
+    def _flush(self, compact=False):
+        """Append the queued records to the log and optionally compact it."""
+        with self._io_lock:
+            while True:
+                try:
+                    self._pending.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if not self._pending and not compact:
+                return
+
+            lock = FileLock(f"{self.stats_path}.lock")
+            if not lock.acquire():
+                # Records stay pending until the next flush
+                Utils.log_error(f"Parameter stats lock busy, keeping {len(self._pending)} records for later")
+                return
+
+            try:
+                if self._pending:
+                    append_records(self._pending, self.log_path)
+                    self._pending = []
+                if compact:
+                    compacted = compact_parameter_stats(self.log_path, self.stats_path, self.max_entries)
+                    self._last_compaction = time.monotonic()
+                    if compacted:
+                        Utils.log_info(f"🗂️ Compacted {compacted} parameter stats records into {self.stats_path}")
+            except Exception as e:
+                Utils.log_error(f"Failed to write parameter stats: {e}")
+            finally:
+                lock.release()
+
+    def flush(self, compact=True):
+        """Write everything queued so far (and compact) from the calling thread."""
+        self._flush(compact=compact)
+
+    def close(self):
+        """Stop the background thread and write the remaining records."""
+        self._stop.set()
+        self._thread.join()
+        self.flush(compact=True)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_parameter_stats_writer():
+    """Process-wide writer, started on first use and flushed at exit."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            from config_loader import config
+            stats_config = config.get_parameter_stats_config()
+            _writer = ParameterStatsWriter(
+                flush_interval=stats_config['flush_interval'],
+                compact_interval=stats_config['compact_interval']
+            )
+            atexit.register(_writer.close)
+        return _writer
@@ -0,0 +1,230 @@
+"""
+Fast path for PDFs produced by document scanners.
+
+Scanner PDFs hold one embedded JPEG/CCITT/raw image per page covering the whole
+page. Rasterizing them with pdftoppm decodes the image at full resolution and
+draws it again at the render DPI; `pdfimages` writes the embedded images out
+directly instead, and JPEGs are decoded at reduced scale (libjpeg DCT scaling
+through PIL's `draft`).
+
+A PDF takes the fast path only when every page holds exactly one image without
+a soft mask whose size matches the page. Anything else is rasterized as before.
+Every extracted page is then compared with a low resolution render of its page
+(`unmatched_pages`), which catches images stored inverted or with vector
+content drawn on top: those pages are rasterized instead.
+"""
+
+import glob
+import itertools
+import math
+import os
+import platform
+import re
+import subprocess
+
+import numpy as np
+from PIL import Image
+from pdf2image import convert_from_path
+
+from utils import Utils
+
+# Relative difference allowed between the page size and the size of its image
+PAGE_COVERAGE_TOLERANCE = 0.03
+
+# Resolution of the renders the extracted pages are checked against
+CHECK_RENDER_DPI = 12
+
+# Mean absolute gray level difference above which the extracted page does not match its render
+CHECK_MAX_MEAN_DIFFERENCE = 40
+
+# Seconds a poppler tool may run before the fast path gives up
+POPPLER_TIMEOUT_SECONDS = 60
+
+# PDF /Rotate (clockwise) -> PIL transpose turning the embedded image like the displayed page
+PAGE_ROTATIONS = {
+    90: Image.Transpose.ROTATE_270,
+    180: Image.Transpose.ROTATE_180,
+    270: Image.Transpose.ROTATE_90,
+}
+
+
+def run_poppler(command, args, poppler_path=None):
+    """Run a poppler tool (from `poppler_path` when bundled) and return its stdout."""
+    if platform.system() == "Windows":
+        command += ".exe"
+    if poppler_path:
+        command = os.path.join(poppler_path, command)
+
+    env = os.environ.copy()
+    if poppler_path:
+        env["LD_LIBRARY_PATH"] = poppler_path + ":" + env.get("LD_LIBRARY_PATH", "")
+
+    result = subprocess.run([command] + args, env=env, capture_output=True, timeout=POPPLER_TIMEOUT_SECONDS)
+    if result.returncode != 0:
+        raise Exception(f"{os.path.basename(command)} failed: {result.stderr.decode('utf-8', 'ignore').strip()}")
+    return result.stdout.decode("utf-8", "ignore")
+
+
+def parse_image_list(output):
+    """Parse `pdfimages -list` output into one dictionary per image."""
+    images = []
+    for line in output.splitlines()[2:]:
+        fields = line.split()
+        if len(fields) < 14:
+            continue
+        try:
+            images.append({
+                'page': int(fields[0]),
+                'num': int(fields[1]),
+                'type': fields[2],
+                'width': int(fields[3]),
+                'height': int(fields[4]),
+                'color': fields[5],
+                'enc': fields[8],
+                'x_ppi': float(fields[12]),
+                'y_ppi': float(fields[13]),
+            })
+        except ValueError:
+            continue
+    return images
+
+
+def parse_page_sizes(output):
+    """Parse `pdfinfo -f 1 -l N` output into {page: {'width', 'height', 'rotation'}} (sizes in points)."""
+    pages = {}
+    for match in re.finditer(r"^Page\s+(\d+)\s+(size|rot):\s+(.*)$", output, re.MULTILINE):
+        page = pages.setdefault(int(match.group(1)), {'width': None, 'height': None, 'rotation': 0})
+        if match.group(2) == "size":
+            size = re.match(r"([\d.]+) x ([\d.]+)", match.group(3))
+            if size:
+                page['width'], page['height'] = float(size.group(1)), float(size.group(2))
+        else:
+            page['rotation'] = int(float(match.group(3))) % 360
+    return pages
+
+
+def covers_page(image, page, tolerance=PAGE_COVERAGE_TOLERANCE):
+    """Whether the image, at its placed resolution, has the size of the (unrotated) page."""
+    if not page['width'] or not page['height'] or image['x_ppi'] <= 0 or image['y_ppi'] <= 0:
+        return False
+    placed_width = image['width'] / image['x_ppi'] * 72
+    placed_height = image['height'] / image['y_ppi'] * 72
+    return (abs(placed_width - page['width']) <= tolerance * page['width']
+            and abs(placed_height - page['height']) <= tolerance * page['height'])
+
+
+def find_scan_pages(images, page_sizes, page_count):
+    """
+    The embedded image of every page when each page is one full-page image, else None.
+
+    Returns:
+        {page: image entry of `parse_image_list` plus the page 'rotation'}
+    """
+    images_per_page = {}
+    for image in images:
+        images_per_page.setdefault(image['page'], []).append(image)
+
+    scan_pages = {}
+    for page in range(1, page_count + 1):
+        page_images = images_per_page.get(page, [])
+        if len(page_images) != 1 or page_images[0]['type'] != "image" or page not in page_sizes:
+            return None
+        if not covers_page(page_images[0], page_sizes[page]):
+            return None
+        scan_pages[page] = dict(page_images[0], rotation=page_sizes[page]['rotation'])
+    return scan_pages
+
+
+def load_scan_image(path, scan_page, target_width, grayscale=False):
+    """
+    Load an extracted image turned like the displayed page. JPEGs are decoded at
+    the smallest DCT scale that keeps the page at least `target_width` wide.
+    """
+    image = Image.open(path)
+    mode = "L" if grayscale else "RGB"
+
+    if image.format == "JPEG" and target_width:
+        # displayed width is the image height on pages turned by 90 or 270 degrees
+        displayed_width = image.height if scan_page['rotation'] in (90, 270) else image.width
+        scale = min(1.0, target_width / displayed_width)
+        image.draft(mode, (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+
+    image.load()
+    if image.mode != mode:
+        image = image.convert(mode)
+    if scan_page['rotation'] in PAGE_ROTATIONS:
+        image = image.transpose(PAGE_ROTATIONS[scan_page['rotation']])
+    return image
+
+
+def extract_scan_pages(pdf_path, first_page, last_page, scan_pages, work_dir, target_width, grayscale=False, poppler_path=None):
+    """Extract the embedded images of pages `first_page`..`last_page`, in page order."""
+    prefix = os.path.join(work_dir, f"scan-{first_page}")
+    run_poppler("pdfimages", ["-j", "-p", "-f", str(first_page), "-l", str(last_page), pdf_path, prefix], poppler_path)
+
+    # pdfimages names files <prefix>-<page>-<image number>.<ext>
+    extracted = {}
+    for path in glob.glob(f"{glob.escape(prefix)}-*"):
+        match = re.search(r"-(\d+)-(\d+)\.\w+$", path)
+        if match:
+            extracted[int(match.group(1))] = path
+
+    images = []
+    try:
+        for page in range(first_page, last_page + 1):
+            if page not in extracted:
+                raise Exception(f"pdfimages did not extract the image of page {page}")
+            images.append(load_scan_image(extracted[page], scan_pages[page], target_width, grayscale))
+    finally:
+        for path in extracted.values():
+            os.remove(path)
+    return images
+
+
+def matches_render(image, rendered, page):
+    """Compare an extracted page with a low resolution render of the same page."""
+    expected = np.asarray(rendered, dtype=np.int16)
+    actual = np.asarray(image.convert("L").resize(rendered.size, Image.BILINEAR), dtype=np.int16)
+    difference = np.abs(expected - actual).mean()
+    Utils.log_info(f"Extracted page {page} differs from its render by {difference:.1f} gray levels")
+    return difference <= CHECK_MAX_MEAN_DIFFERENCE
+
+
+def unmatched_pages(images, pdf_path, first_page, poppler_path=None):
+    """
+    Pages of `images` (extracted from `first_page` on) that do not look like a low
+    resolution render of their page, and must be rasterized. All pages of the
+    range are rendered in a single poppler call.
+    """
+    last_page = first_page + len(images) - 1
+    if poppler_path:
+        renders = convert_from_path(pdf_path, dpi=CHECK_RENDER_DPI, first_page=first_page, last_page=last_page, grayscale=True, poppler_path=poppler_path)
+    else:
+        renders = convert_from_path(pdf_path, dpi=CHECK_RENDER_DPI, first_page=first_page, last_page=last_page, grayscale=True)
+
+    return [
+        page for page, image, rendered in zip(itertools.count(first_page), images, renders)
+        if not matches_render(image, rendered, page)
+    ]
+
+
+def detect_scan_pages(pdf_path, page_count, poppler_path=None):
+    """
+    Decide whether `pdf_path` can take the embedded image fast path.
+    Returns the `find_scan_pages` mapping, or None to rasterize the PDF.
+    """
+    try:
+        images = parse_image_list(run_poppler("pdfimages", ["-list", pdf_path], poppler_path))
+        page_sizes = parse_page_sizes(run_poppler("pdfinfo", ["-f", "1", "-l", str(page_count), pdf_path], poppler_path))
+
+        scan_pages = find_scan_pages(images, page_sizes, page_count)
+        if scan_pages is None:
+            Utils.log_info("PDF pages are not single full-page images, rasterizing")
+            return None
+
+        encodings = sorted({image['enc'] for image in scan_pages.values()})
+        Utils.log_info(f"📠 Scanned PDF detected ({', '.join(encodings)}), extracting embedded page images")
+        return scan_pages
+    except Exception as e:
+        Utils.log_error(f"Scanned PDF detection failed, rasterizing: {e}")
+        return None
@@ -1,5 +1,8 @@
 import argparse
+import asyncio
+import collections
 import io
+import math
 import os
 import random
 import tempfile
@@ -9,12 +12,14 @@ import subprocess
 from pathlib import Path
 from PIL import Image
 import cv2
-from pdf2image import convert_from_bytes
+from pdf2image import convert_from_bytes, pdfinfo_from_bytes
 import json
 from find_circles import find_circles, find_circles_cv2
 from internal_calibrate import (
-    apply_calibration_to_image,
+    calibrate_image,
 )
+from page_image import PageImage
+from pdf_scan_images import detect_scan_pages, extract_scan_pages, unmatched_pages
 from fastapi import UploadFile
 
 from utils import Utils
@@ -82,99 +87,264 @@ def get_poppler_path():
         Utils.log_info(f"Bundled poppler not found at {poppler_path}, falling back to system poppler")
         return None
 
-async def read_to_images(file: UploadFile, needs_calibration=True, on_progress=None):
-    Utils.log_info("Reading data to images...")
+# Pages rendered at once when converting a PDF (bounds memory on large scan batches)
+DEFAULT_PAGES_IN_FLIGHT = 4
 
-    # Read file bytes
-    bytes_arr = await file.read()
+# Width pages are scaled down to before calibration
+MAX_PAGE_WIDTH = 800
 
-    if file.filename.endswith(".pdf"):
+# pdf2image's default resolution, pages narrower than MAX_PAGE_WIDTH at this DPI are not upscaled
+MAX_RENDER_DPI = 200
+
+def get_pdf_info(bytes_arr, poppler_path=None):
+    """Read the page count and the first page size of a PDF without rendering it."""
+    if poppler_path:
+        return pdfinfo_from_bytes(bytes_arr, poppler_path=poppler_path)
+    return pdfinfo_from_bytes(bytes_arr)
+
+def get_pdf_page_width(info):
+    """Width in points of the first page as displayed (rotation applied), None when pdfinfo does not report it."""
+    # e.g. "595.276 x 841.89 pts (A4)"
+    try:
+        width, height = (float(value) for value in str(info["Page size"]).split(" pts")[0].split(" x "))
+    except (KeyError, ValueError):
+        return None
+
+    if int(float(info.get("Page rot", 0))) % 180 == 90:
+        width, height = height, width
+    return width
+
+def get_render_dpi(page_width_pts, max_width=MAX_PAGE_WIDTH, max_dpi=MAX_RENDER_DPI):
+    """
+    DPI at which a page of `page_width_pts` points renders at most `max_width` pixels wide,
+    so poppler produces the final resolution instead of rendering big and resizing.
+    """
+    if not page_width_pts or page_width_pts <= 0:
+        return max_dpi
+    # Rounded down so poppler's rounding up of the page size stays within max_width
+    return min(max_dpi, math.floor(max_width * 72 / page_width_pts * 100) / 100)
+
+def rasterize_pages(bytes_arr, dpi, grayscale, first_page, last_page, poppler_path=None):
+    """Render pages `first_page`..`last_page` of a PDF with pdftoppm."""
+    thread_count = min(4, last_page - first_page + 1)
+    if poppler_path:
+        # Use bundled poppler
+        return convert_from_bytes(bytes_arr, dpi=dpi, grayscale=grayscale, first_page=first_page, last_page=last_page, thread_count=thread_count, poppler_path=poppler_path)
+    # Use system poppler
+    return convert_from_bytes(bytes_arr, dpi=dpi, grayscale=grayscale, first_page=first_page, last_page=last_page, thread_count=thread_count)
+
+def render_pdf_in_ranges(bytes_arr, pages_in_flight, poppler_path=None, grayscale=False, extract_scans=True):
+    """
+    Render a PDF `pages_in_flight` pages at a time, yielding (first_page, page_count, images) per range.
+    Pages are rendered at the DPI matching MAX_PAGE_WIDTH, as single channel ('L') images when `grayscale`.
+
+    With `extract_scans`, PDFs made of one full-page scan per page skip rendering: the
+    embedded images are extracted with pdfimages (see pdf_scan_images), and only the
+    pages whose image does not look like the rendered page are rasterized.
+    """
+    info = get_pdf_info(bytes_arr, poppler_path)
+    page_count = int(info["Pages"])
+    dpi = get_render_dpi(get_pdf_page_width(info))
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        scan_pages = None
+        if extract_scans:
+            # poppler's command line tools need the PDF on disk
+            pdf_path = os.path.join(work_dir, "document.pdf")
+            with open(pdf_path, "wb") as f:
+                f.write(bytes_arr)
+            scan_pages = detect_scan_pages(pdf_path, page_count, poppler_path)
+
+        if not scan_pages:
+            Utils.log_info(f"Rendering {page_count} PDF pages at {dpi} DPI ({'grayscale' if grayscale else 'color'})")
+
+        for first_page in range(1, page_count + 1, pages_in_flight):
+            last_page = min(first_page + pages_in_flight - 1, page_count)
+
+            images = None
+            if scan_pages:
+                try:
+                    images = extract_scan_pages(pdf_path, first_page, last_page, scan_pages, work_dir, MAX_PAGE_WIDTH, grayscale, poppler_path)
+                    # Content drawn over a scan (or a scan stored inverted) only shows on the rendered page
+                    for page in unmatched_pages(images, pdf_path, first_page, poppler_path):
+                        Utils.log_info(f"Extracted scan image of page {page} does not match the rendered page, rasterizing it")
+                        images[page - first_page].close()
+                        images[page - first_page] = rasterize_pages(bytes_arr, dpi, grayscale, page, page, poppler_path)[0]
+                except Exception as e:
+                    # Rasterize the rest of the document
+                    Utils.log_error(f"Extracting scan images of pages {first_page}-{last_page} failed, rasterizing: {e}")
+                    scan_pages = None
+                    images = None
+
+            if images is None:
+                images = rasterize_pages(bytes_arr, dpi, grayscale, first_page, last_page, poppler_path)
+
+            yield first_page, page_count, images
+
+async def report_pdf_error(e, on_progress=None):
+    error_msg = f"Error converting PDF to images: {str(e)}"
+    print(error_msg)
+    Utils.log_error(error_msg)
+    
+    # Provide helpful error message for poppler issues
+    if "poppler" in str(e).lower() or "Unable to get page count" in str(e):
+        poppler_error = "PDF conversion failed - poppler not found. "
+        if getattr(sys, 'frozen', False):
+            poppler_error += "This executable was built without poppler support. Please rebuild with poppler included."
+        else:
+            poppler_error += "Please install poppler-utils for your system."
+        Utils.log_error(poppler_error)
         if on_progress:
-            await on_progress("Converting PDF to images...")
+            await on_progress(poppler_error)
 
-        try:
-            # Get poppler path for PyInstaller builds
-            poppler_path = get_poppler_path()
-            
-            if poppler_path:
-                # Use bundled poppler
-                images = convert_from_bytes(bytes_arr, thread_count=4, poppler_path=poppler_path)
-            else:
-                # Use system poppler
-                images = convert_from_bytes(bytes_arr, thread_count=4)
-
-            if on_progress:
-                await on_progress(f"Converted PDF, {len(images)} pages")
-        except Exception as e:
-            error_msg = f"Error converting PDF to images: {str(e)}"
-            print(error_msg)
-            Utils.log_error(error_msg)
-            
-            # Provide helpful error message for poppler issues
-            if "poppler" in str(e).lower() or "Unable to get page count" in str(e):
-                poppler_error = "PDF conversion failed - poppler not found. "
-                if getattr(sys, 'frozen', False):
-                    poppler_error += "This executable was built without poppler support. Please rebuild with poppler included."
-                else:
-                    poppler_error += "Please install poppler-utils for your system."
-                Utils.log_error(poppler_error)
-                if on_progress:
-                    await on_progress(poppler_error)
-            
-            return None
+def calibrate_page(page):
+    """Calibrate a page (PageImage) and normalize its brightness. Top-level so it can run in a worker process."""
+    return page.derive(calibrate_image(page.array, auto_contrast=True), "calibration")
+
+async def prepare_page(image, i, needs_calibration=True, on_progress=None, calibration_pool=None, calibration_slots=None):
+    """
+    Decode, resize and calibrate one page. Returns (image_id, page, calibration_rect or None),
+    the page being a PageImage: PIL is only used to hand the page over.
+    With a `calibration_pool`, calibration runs in a worker process once one of the
+    `calibration_slots` (asyncio.Semaphore) is free.
+    """
+    if on_progress:
+        await on_progress(f"Processing image {i}...")
+
+    random_hash = random.randbytes(8).hex()
+    page = PageImage.from_pil(image, page=i)
+    # the rendered page is not needed once decoded
+    image.close()
+
+    # Resize if width is greater than 800 (PDF pages are normally rendered at this width already)
+    if page.width > MAX_PAGE_WIDTH:
+        width_ratio = MAX_PAGE_WIDTH / page.width
+        page = page.derive(cv2.resize(
+            page.array, (int(page.width * width_ratio), int(page.height * width_ratio)),
+            interpolation=cv2.INTER_AREA
+        ), "resize")
+
+    if not needs_calibration:
+        return random_hash, page, None
+
+    if on_progress:
+        await on_progress(f"Applying calibration to image {i}")
+
+    if calibration_pool:
+        async with calibration_slots:
+            page = await calibration_pool.run(calibrate_page, page)
     else:
-        images = [Image.open(io.BytesIO(bytes_arr))]
-        if on_progress:
-            await on_progress("Read image")
+        page = calibrate_page(page)
+
+    if on_progress:
+        await on_progress(f"Applied calibration to image {i}")
+
+    return random_hash, page, {"x": 0.0, "y": 0.0}
+
+async def read_to_images(file: UploadFile, needs_calibration=True, on_progress=None, on_page=None, pages_in_flight=DEFAULT_PAGES_IN_FLIGHT, grayscale=True, extract_scans=True, calibration_pool=None):
+    """
+    Convert an uploaded PDF or image into (calibrated) pages, as PageImages.
+
+    PDF pages are rendered `pages_in_flight` at a time and each page is calibrated as
+    soon as its range is rendered. When `on_page` is given, every finished page is
+    passed to `await on_page(image_id, image)` right away instead of being kept in
+    the result, so memory stays bounded by the pages in flight.
+
+    With `grayscale`, PDF pages that get calibrated are rendered single channel, as
+    calibration and circle detection only use their gray levels. With `extract_scans`,
+    the embedded images of scanned PDFs are used instead of rendering their pages.
+
+    With a `calibration_pool` (worker_pool.ProcessWorkerPool), pages are calibrated in
+    parallel, as many at once as the pool's memory-bound concurrency allows, and handed on
+    in page order. Calibration runs across ranges: the next range is rendered while the
+    pages of the previous ones calibrate, up to that concurrency (or `pages_in_flight`,
+    when larger) pages being calibrated or waiting to be handed on.
+    """
+    Utils.log_info("Reading data to images...")
+
+    # Read file bytes
+    bytes_arr = await file.read()
 
     final_json = {
         "images": {},
         "image_calibration_rects": {},
         "image_sizes": {},
     }
+    image_ids = []
 
-    with tempfile.TemporaryDirectory() as temp_dir:
-        for i, image in enumerate(images):
-            if on_progress:
-                await on_progress(f"Processing image {i}...")
+    async def add_page(prepared):
+        random_hash, page, calibration_rect = await prepared
+        Utils.log_info(f"📐 Page {page.metadata['page'] + 1}: {page.report()}")
 
-            random_hash = random.randbytes(8).hex()
-            image_path = os.path.join(temp_dir, f"image_{random_hash}.png")
+        image_ids.append(random_hash)
+        if calibration_rect is not None:
+            final_json["image_calibration_rects"][random_hash] = calibration_rect
+        final_json["image_sizes"][random_hash] = {
+            "width": float(page.width),
+            "height": float(page.height),
+        }
 
-            print(f"Saving image to {image_path}")
+        if on_page:
+            await on_page(random_hash, page)
+        else:
+            final_json["images"][random_hash] = page
 
-            # Resize if width is greater than 800
-            if image.width > 800:
-                width_ratio = 800 / image.width
-                image = image.resize(
-                    (int(image.width * width_ratio), int(image.height * width_ratio))
-                )
+    if file.filename.endswith(".pdf"):
+        if on_progress:
+            await on_progress("Converting PDF to images...")
 
-            # save to file
-            image.save(image_path)
+        # Get poppler path for PyInstaller builds
+        pages_in_flight = max(1, pages_in_flight or 1)
+        page_ranges = render_pdf_in_ranges(bytes_arr, pages_in_flight, get_poppler_path(), grayscale and needs_calibration, extract_scans)
+        loop = asyncio.get_running_loop()
 
-            if needs_calibration:
-                if on_progress:
-                    await on_progress(f"Applying calibration to image {i}")
+        calibrate_in_pool = calibration_pool and needs_calibration
+        if calibrate_in_pool:
+            calibration_slots = asyncio.Semaphore(calibration_pool.concurrency())
+            # Pages calibrating (or waiting to be handed on) while the next range renders
+            max_pending = max(pages_in_flight, calibration_pool.concurrency())
+        pending_pages = collections.deque()
 
-                img = apply_calibration_to_image(image)
-                img, _alpha, _beta = Utils.automatic_brightness_and_contrast(img)
-                img = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+        try:
+            while True:
+                try:
+                    # Rendered off the event loop, so the pages of earlier ranges keep calibrating meanwhile
+                    page_range = await loop.run_in_executor(None, next, page_ranges, None)
+                except Exception as e:
+                    await report_pdf_error(e, on_progress)
+                    return None
+                if page_range is None:
+                    break
+                first_page, page_count, images = page_range
 
                 if on_progress:
-                    await on_progress(f"Applied calibration to image {i}")
+                    await on_progress(f"Converted PDF pages {first_page}-{first_page + len(images) - 1} of {page_count}")
 
-                final_json["image_calibration_rects"][random_hash] = {"x": 0.0, "y": 0.0}
-            else:
-                img = image
+                if calibrate_in_pool:
+                    # Calibrate in parallel across ranges, then hand the pages on in order
+                    pending_pages.extend(
+                        asyncio.ensure_future(prepare_page(image, first_page - 1 + offset, needs_calibration, on_progress, calibration_pool, calibration_slots))
+                        for offset, image in enumerate(images)
+                    )
+                    while len(pending_pages) > max_pending:
+                        await add_page(pending_pages.popleft())
+                else:
+                    for offset, image in enumerate(images):
+                        await add_page(prepare_page(image, first_page - 1 + offset, needs_calibration, on_progress))
+                del images
 
-            final_json["images"][random_hash] = img
-            final_json["image_sizes"][random_hash] = {
-                "width": float(img.width),
-                "height": float(img.height),
-            }
+            while pending_pages:
+                await add_page(pending_pages.popleft())
+        finally:
+            for prepared in pending_pages:
+                prepared.cancel()
+    else:
+        image = Image.open(io.BytesIO(bytes_arr))
+        if on_progress:
+            await on_progress("Read image")
+        await add_page(prepare_page(image, 0, needs_calibration, on_progress, calibration_pool, asyncio.Semaphore(1)))
 
     if not needs_calibration:
-        return list(final_json["images"].keys())
+        return image_ids
 
     return final_json
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Benchmark of PDF rasterization before and after rendering at the target resolution.
+Compares pdf2image's default rendering (200 DPI, RGB, then resized to 800 px) with
+rendering directly at the DPI of an 800 px page in grayscale, and with extracting the
+embedded images of scanned PDFs, as read_to_images does.
+
+Usage: python render_benchmark.py [file.pdf] [--pages N]
+Without a file, a synthetic answer sheet PDF is generated.
+"""
+
+import argparse
+import io
+import time
+import cv2
+import numpy as np
+from PIL import Image
+from pdf2image import convert_from_bytes
+from read_to_images import (
+    MAX_PAGE_WIDTH,
+    get_pdf_info,
+    get_pdf_page_width,
+    get_poppler_path,
+    get_render_dpi,
+    render_pdf_in_ranges,
+)
+
+def create_synthetic_pdf(pages):
+    """Create an A4 answer sheet PDF (scanned at 300 DPI) with a grid of bubbles on every page."""
+    print(f"📷 Creating synthetic {pages} page PDF...")
+    sheets = []
+    for _ in range(pages):
+        sheet = np.full((3508, 2480, 3), 240, dtype=np.uint8)
+        cv2.rectangle(sheet, (150, 150), (2330, 3358), (20, 20, 20), 12)
+        for row in range(30):
+            for col in range(20):
+                center = (300 + col * 95, 500 + row * 90)
+                if np.random.random() > 0.8:
+                    cv2.circle(sheet, center, 30, (40, 40, 40), -1)  # Filled
+                else:
+                    cv2.circle(sheet, center, 30, (90, 90, 90), 3)  # Empty
+        sheets.append(Image.fromarray(sheet))
+
+    pdf = io.BytesIO()
+    sheets[0].save(pdf, format="PDF", resolution=300, save_all=True, append_images=sheets[1:])
+    return pdf.getvalue()
+
+def render(bytes_arr, poppler_path, **kwargs):
+    if poppler_path:
+        return convert_from_bytes(bytes_arr, poppler_path=poppler_path, **kwargs)
+    return convert_from_bytes(bytes_arr, **kwargs)
+
+def render_before(bytes_arr, poppler_path):
+    """pdf2image defaults, then the resize read_to_images used to do."""
+    pages = []
+    for image in render(bytes_arr, poppler_path):
+        if image.width > MAX_PAGE_WIDTH:
+            width_ratio = MAX_PAGE_WIDTH / image.width
+            image = image.resize((int(image.width * width_ratio), int(image.height * width_ratio)))
+        pages.append(image)
+    return pages
+
+def render_after(bytes_arr, poppler_path):
+    """Rendered at the final width, single channel."""
+    dpi = get_render_dpi(get_pdf_page_width(get_pdf_info(bytes_arr, poppler_path)))
+    return render(bytes_arr, poppler_path, dpi=dpi, grayscale=True)
+
+def render_extracted(bytes_arr, poppler_path):
+    """read_to_images' path: embedded scan images when possible, rendering otherwise."""
+    pages = []
+    for _first_page, _page_count, images in render_pdf_in_ranges(bytes_arr, 4, poppler_path, grayscale=True):
+        pages.extend(images)
+    return pages
+
+def run_benchmark(bytes_arr, poppler_path, label, render_pages):
+    print(f"\n🏃 Rendering {label}...")
+    print("-" * 40)
+
+    start_time = time.time()
+    pages = render_pages(bytes_arr, poppler_path)
+    elapsed = time.time() - start_time
+
+    bytes_per_page = sum(len(page.tobytes()) for page in pages) / max(len(pages), 1)
+    print(f"✅ {len(pages)} pages in {elapsed:.2f}s ({elapsed / max(len(pages), 1) * 1000:.0f} ms/page)")
+    print(f"   Page: {pages[0].size[0]}x{pages[0].size[1]} {pages[0].mode}, {bytes_per_page / 1024:.0f} KiB/page")
+
+    return {'time': elapsed, 'bytes_per_page': bytes_per_page}
+
+def run_render_comparison(pdf_path=None, pages=5):
+    print("🔬 PDF Rendering Benchmark")
+    print("=" * 60)
+
+    if pdf_path:
+        with open(pdf_path, "rb") as f:
+            bytes_arr = f.read()
+    else:
+        bytes_arr = create_synthetic_pdf(pages)
+
+    poppler_path = get_poppler_path()
+    info = get_pdf_info(bytes_arr, poppler_path)
+    page_width = get_pdf_page_width(info)
+    print(f"📄 {info['Pages']} pages, {page_width} pts wide, rendered at {get_render_dpi(page_width)} DPI")
+
+    before = run_benchmark(bytes_arr, poppler_path, "200 DPI RGB + resize (before)", render_before)
+    after = run_benchmark(bytes_arr, poppler_path, "target DPI grayscale (after)", render_after)
+    extracted = run_benchmark(bytes_arr, poppler_path, "embedded scan images", render_extracted)
+
+    print("\n📊 Performance Analysis")
+    print("=" * 60)
+    if after['time'] > 0:
+        print(f"🏆 Render time: {before['time'] / after['time']:.2f}x faster")
+    if extracted['time'] > 0:
+        print(f"📠 Embedded scan images: {before['time'] / extracted['time']:.2f}x faster than before")
+    print(f"💾 Bytes per page: {before['bytes_per_page'] / 1024:.0f} KiB → {after['bytes_per_page'] / 1024:.0f} KiB "
+          f"({before['bytes_per_page'] / max(after['bytes_per_page'], 1):.1f}x smaller)")
+
+    return {'before': before, 'after': after, 'extracted': extracted}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark PDF rasterization")
+    parser.add_argument("pdf", nargs="?", help="PDF to render (a synthetic one is generated otherwise)")
+    parser.add_argument("--pages", type=int, default=5, help="Pages of the synthetic PDF")
+    args = parser.parse_args()
+
+    try:
+        run_render_comparison(args.pdf, args.pages)
+        print("\n🎉 Benchmark completed successfully!")
+    except Exception as e:
+        print(f"❌ Benchmark failed: {e}")
+        import traceback
+        traceback.print_exc()
@@ -0,0 +1,88 @@
+"""
+Per-connection registry of the calibrated pages produced by READ_TO_IMAGES.
+
+Pages read and calibrated for a client are kept decoded under the image ids sent
+to it, so a later FIND_CIRCLES job of the same connection can list those ids in
+its "file_ids" instead of uploading the pages back. Pages expire `ttl_seconds`
+after their last use and the least recently used ones are dropped once the
+connection holds more than `max_bytes` of them.
+"""
+
+import time
+from collections import OrderedDict
+
+
+class SessionPageRegistry:
+    """Decoded pages of one connection by image id. Meant to be used from the event loop only."""
+
+    def __init__(self, max_bytes, ttl_seconds, clock=time.monotonic):
+        """
+        Args:
+            max_bytes: Byte budget of the pages held (0 disables the registry)
+            ttl_seconds: Time a page is kept after it was added or last used
+            clock: Time source, in seconds
+        """
+        self.max_bytes = max(0, max_bytes)
+        self.ttl_seconds = ttl_seconds
+        self.size = 0
+        self._clock = clock
+        self._pages = OrderedDict()  # image_id -> (page array, expires at)
+
+    def __len__(self):
+        return len(self._pages)
+
+    def __contains__(self, image_id):
+        self.evict_expired()
+        return image_id in self._pages
+
+    def add(self, image_id, page):
+        """
+        Keep a page (uint8 array) under `image_id`. The array is made read-only,
+        as every job referencing the id shares it.
+        """
+        self.remove(image_id)
+        if page.nbytes > self.max_bytes:
+            return
+
+        page.flags.writeable = False
+        self._pages[image_id] = (page, self._clock() + self.ttl_seconds)
+        self.size += page.nbytes
+        self.evict_expired()
+        self.shrink(self.max_bytes)
+
+    def get(self, image_id):
+        """The page registered under `image_id` (its expiry pushed back), None when not held."""
+        self.evict_expired()
+        entry = self._pages.get(image_id)
+        if entry is None:
+            return None
+
+        page, _ = entry
+        self._pages[image_id] = (page, self._clock() + self.ttl_seconds)
+        self._pages.move_to_end(image_id)
+        return page
+
+    def shrink(self, max_bytes):
+        """Drop the least recently used pages until the registry holds at most `max_bytes`."""
+        while self.size > max_bytes and self._pages:
+            _, (evicted, _) = self._pages.popitem(last=False)
+            self.size -= evicted.nbytes
+
+    def remove(self, image_id):
+        entry = self._pages.pop(image_id, None)
+        if entry is not None:
+            self.size -= entry[0].nbytes
+
+    def evict_expired(self):
+        """Drop the pages whose TTL ran out (the least recently used pages expire first)."""
+        now = self._clock()
+        while self._pages:
+            image_id, (page, expires_at) = next(iter(self._pages.items()))
+            if expires_at > now:
+                break
+            del self._pages[image_id]
+            self.size -= page.nbytes
+
+    def clear(self):
+        self._pages.clear()
+        self.size = 0
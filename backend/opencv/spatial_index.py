@@ -0,0 +1,207 @@
+"""
+Spatial index for the circle post-filter chain.
+
+The post-filters (consensus recovery, overlap removal, grid outliers, bounds)
+compare circles with their neighbours. `CircleSpatialIndex` buckets (N, 3)
+[x, y, radius] circles into a uniform grid so each neighbour query only looks
+at nearby cells, which keeps dense boxes (hundreds of bubbles) near-linear.
+
+Distances are computed in the dtype of the indexed circles with the same
+formula the filters used, so every decision is identical to the pairwise loops.
+"""
+
+import math
+from collections import defaultdict
+
+import numpy as np
+
+
+class CircleSpatialIndex:
+    """Uniform grid buckets over circles [x, y, radius] supporting radius-neighbour queries."""
+
+    def __init__(self, circles, cell_size, dtype=None):
+        """
+        Args:
+            circles: (N, 3) array-like of [x, y, radius]
+            cell_size: Side of the grid cells, ideally close to the typical query radius
+            dtype: Dtype used to store circles and compute distances (defaults to the input's)
+        """
+        circles = np.asarray(circles, dtype=dtype)
+        if circles.size == 0:
+            circles = np.empty((0, 3), dtype=dtype or np.float64)
+        circles = circles.reshape(-1, 3)
+
+        self.cell_size = float(cell_size) if cell_size and cell_size > 0 else 1.0
+        self.dtype = circles.dtype
+        self._data = np.array(circles, dtype=self.dtype)
+        self._size = len(circles)
+        self._buckets = defaultdict(list)
+
+        for index in range(self._size):
+            self._buckets[self._cell(self._data[index, 0], self._data[index, 1])].append(index)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def circles(self):
+        """View of the indexed circles, in insertion order."""
+        return self._data[:self._size]
+
+    def _cell(self, x, y):
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+    def add(self, circle):
+        """Append a circle to the index and return its index."""
+        if self._size == len(self._data):
+            grown = np.empty((max(8, 2 * len(self._data)), 3), dtype=self.dtype)
+            grown[:self._size] = self._data[:self._size]
+            self._data = grown
+
+        index = self._size
+        self._data[index] = circle[:3]
+        self._size += 1
+        self._buckets[self._cell(self._data[index, 0], self._data[index, 1])].append(index)
+        return index
+
+    def candidates(self, x, y, radius):
+        """Indices of the circles in every cell touched by the square around (x, y) (a superset of the neighbours)."""
+        # One extra cell on each side absorbs rounding at cell borders
+        min_cx, min_cy = self._cell(x - radius, y - radius)
+        max_cx, max_cy = self._cell(x + radius, y + radius)
+
+        found = []
+        for cx in range(min_cx - 1, max_cx + 2):
+            for cy in range(min_cy - 1, max_cy + 2):
+                bucket = self._buckets.get((cx, cy))
+                if bucket:
+                    found.extend(bucket)
+        return np.array(found, dtype=np.intp)
+
+    def distances_to(self, indices, x, y):
+        """Center distances from (x, y) to the given circles, as sqrt(dx**2 + dy**2) in the index dtype."""
+        x = self.dtype.type(x)
+        y = self.dtype.type(y)
+        data = self._data[indices]
+        return np.sqrt((data[:, 0] - x)**2 + (data[:, 1] - y)**2)
+
+    def query_radius(self, x, y, radius, strict=False):
+        """
+        Ascending indices of the circles whose center is within `radius` of (x, y)
+        (distance <= radius, or < radius when `strict`).
+        """
+        indices = self.candidates(x, y, radius)
+        if len(indices) == 0:
+            return indices
+
+        distances = self.distances_to(indices, x, y)
+        mask = distances < radius if strict else distances <= radius
+        return np.sort(indices[mask])
+
+    def first_within(self, x, y, radius):
+        """Lowest index of a circle whose center is within `radius` of (x, y), or None."""
+        found = self.query_radius(x, y, radius)
+        return int(found[0]) if len(found) else None
+
+    def neighbour_counts(self, radius):
+        """For every circle, the number of other circles whose center is within `radius`."""
+        counts = np.zeros(self._size, dtype=np.intp)
+        for index in range(self._size):
+            # The circle itself is always at distance 0
+            counts[index] = len(self.query_radius(self._data[index, 0], self._data[index, 1], radius)) - 1
+        return counts
+
+
+def suppress_overlaps(circles, overlap_threshold=0.5, larger_factor=1.1):
+    """
+    Greedy non-maximum suppression of overlapping circles, in input order.
+
+    Circle i is compared with every later circle j still kept. When they overlap by at
+    least `overlap_threshold` of the smaller diameter, j is dropped, unless j is more than
+    `larger_factor` times bigger, in which case i is dropped and stops being compared.
+
+    Returns:
+        kept: Ascending indices of the kept circles
+        removals: (removed_index, kept_index, overlap_ratio) in the order decisions were made
+    """
+    circles = np.asarray(circles, dtype=np.float64).reshape(-1, 3)
+    if len(circles) == 0:
+        return [], []
+
+    max_radius = float(circles[:, 2].max())
+    index = CircleSpatialIndex(circles, cell_size=2 * max_radius)
+
+    removed = np.zeros(len(circles), dtype=bool)
+    removals = []
+
+    for i in range(len(circles)):
+        if removed[i]:
+            continue
+
+        x1, y1, r1 = circles[i]
+        # Any circle overlapping circle i is closer than r1 + max_radius
+        neighbours = index.query_radius(x1, y1, r1 + max_radius)
+        neighbours = neighbours[neighbours > i]
+        if len(neighbours) == 0:
+            continue
+
+        r2 = circles[neighbours, 2]
+        distances = index.distances_to(neighbours, x1, y1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            overlap_ratios = ((r1 + r2) - distances) / (2 * np.minimum(r1, r2))
+        overlapping = (distances < (r1 + r2)) & (overlap_ratios >= overlap_threshold)
+
+        for j, ratio, r_j in zip(neighbours[overlapping], overlap_ratios[overlapping], r2[overlapping]):
+            if removed[j]:
+                continue
+            if r_j > r1 * larger_factor:
+                removed[i] = True
+                removals.append((i, int(j), float(ratio)))
+                break
+            removed[j] = True
+            removals.append((int(j), i, float(ratio)))
+
+    return [i for i in range(len(circles)) if not removed[i]], removals
+
+
+def group_sorted_values(values, tolerance):
+    """
+    Greedy 1D clustering of ascending `values`: a value joins the current group when it is
+    within `tolerance` of the group's first value, otherwise it starts a new group.
+    Returns the start index of every group.
+    """
+    starts = []
+    start = 0
+    while start < len(values):
+        starts.append(start)
+        # Offsets from the group's first value are sorted, so the group ends at the first one above tolerance
+        start += int(np.searchsorted(values[start:] - values[start], tolerance, side='right'))
+    return starts
+
+
+def chain_sorted_values(values, tolerance):
+    """
+    1D clustering of ascending `values` where a value joins the current group when it is
+    within `tolerance` of the previous value. Returns (start, end) bounds of every group.
+    """
+    if len(values) == 0:
+        return []
+
+    breaks = np.flatnonzero(np.diff(values) > tolerance) + 1
+    starts = np.concatenate([[0], breaks])
+    ends = np.concatenate([breaks, [len(values)]])
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def within_tolerance_of_any(values, sorted_lines, tolerance):
+    """For each value, whether some line in ascending `sorted_lines` satisfies abs(value - line) <= tolerance."""
+    values = np.asarray(values)
+    sorted_lines = np.asarray(sorted_lines)
+    if len(sorted_lines) == 0:
+        return np.zeros(len(values), dtype=bool)
+
+    # The closest line is one of the two around the insertion point
+    position = np.searchsorted(sorted_lines, values)
+    below = sorted_lines[np.clip(position - 1, 0, len(sorted_lines) - 1)]
+    above = sorted_lines[np.clip(position, 0, len(sorted_lines) - 1)]
+    return (np.abs(values - below) <= tolerance) | (np.abs(values - above) <= tolerance)
@@ -0,0 +1,61 @@
+import pytest
+from binary_protocol import (
+    DEFAULT_CHUNK_SIZE,
+    MAX_CHUNK_SIZE,
+    MIN_CHUNK_SIZE,
+    ProtocolSettings,
+    decode_frame,
+    encode_frame,
+)
+
+
+def test_frame_round_trip():
+    payload = bytes(range(256)) * 10
+    frame = decode_frame(encode_frame("task-1", "file-abc", 7, payload, True))
+
+    assert frame.task_id == "task-1"
+    assert frame.file_id == "file-abc"
+    assert frame.sequence == 7
+    assert frame.is_final is True
+    assert bytes(frame.payload) == payload
+
+
+def test_frame_not_final_and_empty_payload():
+    frame = decode_frame(encode_frame("t", "f", 0, b"", False))
+
+    assert frame.is_final is False
+    assert len(frame.payload) == 0
+
+
+def test_decode_rejects_truncated_frames():
+    data = encode_frame("task", "file", 0, b"abc", False)
+
+    with pytest.raises(ValueError):
+        decode_frame(data[:4])
+    with pytest.raises(ValueError):
+        decode_frame(data[:10])
+
+
+def test_negotiation_defaults_to_legacy_json():
+    settings = ProtocolSettings.negotiate(None)
+
+    assert settings.binary_frames is False
+    assert settings.chunk_size == DEFAULT_CHUNK_SIZE
+
+
+def test_negotiation_clamps_chunk_size():
+    assert ProtocolSettings.negotiate({"chunk_size": 1}).chunk_size == MIN_CHUNK_SIZE
+    assert ProtocolSettings.negotiate({"chunk_size": 10 ** 12}).chunk_size == MAX_CHUNK_SIZE
+    assert ProtocolSettings.negotiate({"chunk_size": "bad"}).chunk_size == DEFAULT_CHUNK_SIZE
+
+
+def test_negotiation_rejects_unknown_frame_version():
+    settings = ProtocolSettings.negotiate({"binary_frames": True, "binary_frame_version": 99})
+
+    assert settings.binary_frames is False
+
+
+def test_negotiation_ignores_invalid_frame_version():
+    settings = ProtocolSettings.negotiate({"binary_frames": True, "binary_frame_version": "v2"})
+
+    assert settings.binary_frames is False
@@ -0,0 +1,56 @@
+import numpy as np
+
+import cv2
+from circle_darkness import CircleDarkness, disk_template
+
+
+def make_box():
+    rng = np.random.default_rng(0)
+    gray = rng.integers(200, 256, (120, 160), dtype=np.uint8)
+    cv2.circle(gray, (40, 40), 15, 20, -1)  # filled bubble
+    cv2.circle(gray, (100, 40), 15, 20, 1)  # empty bubble outline
+    return gray
+
+
+def masked_pixels(gray, x, y, radius):
+    """Pixels of the disk as the white content filter collected them: white padding and an ogrid mask."""
+    region = np.full((2 * radius, 2 * radius), 255, dtype=np.uint8)
+    height, width = gray.shape
+    x0, y0, x1, y1 = max(x - radius, 0), max(y - radius, 0), min(x + radius, width), min(y + radius, height)
+    if x0 < x1 and y0 < y1:
+        region[y0 - (y - radius):y1 - (y - radius), x0 - (x - radius):x1 - (x - radius)] = gray[y0:y1, x0:x1]
+    y_indices, x_indices = np.ogrid[:2 * radius, :2 * radius]
+    return region[(x_indices - radius)**2 + (y_indices - radius)**2 <= radius**2]
+
+
+def test_measurements_match_masked_pixels():
+    gray = make_box()
+    circles = [[40, 40, 15], [100, 40, 15], [5, 115, 12], [158, 2, 9], [80, 80, 1], [300, 300, 5]]
+
+    measurements = CircleDarkness(gray).measure(circles, dark_threshold=180, white_threshold=200)
+
+    for index, (x, y, radius) in enumerate(circles):
+        pixels = masked_pixels(gray, x, y, radius)
+        assert measurements['pixel_count'][index] == len(pixels)
+        assert np.isclose(measurements['mean'][index], pixels.mean())
+        assert np.isclose(measurements['dark_ratio'][index], np.mean(pixels < 180))
+        assert measurements['white_pixels'][index] == np.sum(pixels >= 200)
+
+
+def test_disk_mean_separates_filled_from_empty_bubbles():
+    measurements = CircleDarkness(make_box()).measure([[40, 40, 15], [100, 40, 15]], white_threshold=None)
+
+    assert measurements['mean'][0] < 180 < measurements['mean'][1]
+    assert measurements['dark_ratio'][0] > 0.9
+    assert measurements['confidence'][0] > 0.8
+    assert 'white_ratio' not in measurements
+
+
+def test_bgr_images_and_empty_disks():
+    bgr = cv2.cvtColor(make_box(), cv2.COLOR_GRAY2BGR)
+    measurements = CircleDarkness(bgr).measure([[40, 40, 0]])
+
+    assert measurements['pixel_count'][0] == 0
+    assert measurements['mean'][0] == 255
+    assert measurements['confidence'][0] == 0
+    assert len(disk_template(15)[0]) == 30
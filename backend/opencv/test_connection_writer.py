@@ -0,0 +1,129 @@
+import asyncio
+import json
+import pytest
+from unittest.mock import MagicMock, patch
+
+from connection_writer import ConnectionWriter
+from utils import Utils
+
+
+@pytest.fixture(autouse=True)
+def mock_utils_logging():
+    with patch.object(Utils, 'log_info', new=MagicMock()), \
+         patch.object(Utils, 'log_error', new=MagicMock()):
+        yield
+
+
+class SlowSocket:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.sent = []
+
+    async def send(self, message):
+        await asyncio.sleep(self.delay)
+        self.sent.append(message)
+
+
+def progress(task_id, message):
+    return json.dumps({"status": "progress", "data": {"task_id": task_id, "message": message}})
+
+
+async def drain(writer):
+    while writer._results or writer._progress:
+        await asyncio.sleep(0.01)
+    # the last message is being sent
+    await asyncio.sleep(0.05)
+
+
+@pytest.mark.asyncio
+async def test_progress_is_coalesced_to_the_latest_message():
+    socket = SlowSocket()
+    writer = ConnectionWriter(socket, progress_interval=0.3)
+
+    for step in range(100):
+        writer.progress("t1", progress("t1", step))
+    await drain(writer)
+    writer.progress("t1", progress("t1", 100))
+    writer.progress("t1", progress("t1", 101))
+    await asyncio.sleep(0.05)
+    sent_within_interval = len(socket.sent)
+    await drain(writer)
+
+    assert [json.loads(message)["data"]["message"] for message in socket.sent] == [99, 101]
+    assert sent_within_interval == 1
+    assert (writer.sent_progress, writer.coalesced_progress) == (2, 100)
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_results_are_sent_before_progress():
+    socket = SlowSocket(delay=0.01)
+    writer = ConnectionWriter(socket, progress_interval=0)
+
+    await writer.send("first result")
+    writer.progress("t1", "progress")
+    await writer.send("chunk 1")
+    await writer.send("chunk 2")
+    await drain(writer)
+
+    assert socket.sent == ["first result", "chunk 1", "chunk 2", "progress"]
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_pending_progress_of_a_task_precedes_its_result():
+    socket = SlowSocket()
+    writer = ConnectionWriter(socket, progress_interval=10)
+
+    writer.progress("t1", "started")
+    writer.progress("t2", "other task")
+    await drain_first(socket)
+    writer.progress("t1", "all pages processed")
+    await writer.send("t1 completed", task_id="t1")
+    await asyncio.sleep(0.05)
+
+    assert socket.sent[-2:] == ["all pages processed", "t1 completed"]
+
+    # progress scheduled by a worker thread can arrive after the task finished
+    writer.forget_task("t1")
+    writer.progress("t1", "late progress")
+    assert "t1" not in writer._progress
+    await writer.close()
+
+
+async def drain_first(socket):
+    while not socket.sent:
+        await asyncio.sleep(0.001)
+
+
+@pytest.mark.asyncio
+async def test_results_wait_for_queue_space():
+    socket = SlowSocket(delay=0.02)
+    writer = ConnectionWriter(socket, max_queue=2)
+
+    started = asyncio.get_running_loop().time()
+    for index in range(5):
+        await writer.send(f"chunk {index}")
+    waited = asyncio.get_running_loop().time() - started
+    await drain(writer)
+
+    assert socket.sent == [f"chunk {index}" for index in range(5)]
+    assert waited >= 0.02
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_send_errors_stop_the_writer():
+    class ClosedSocket:
+        async def send(self, message):
+            raise ConnectionError("closed")
+
+    writer = ConnectionWriter(ClosedSocket())
+    await writer.send("result")
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(ConnectionError):
+        await writer.send("next result")
+    # progress is dropped without raising, detection code never waits on the socket
+    writer.progress("t1", "progress")
+    await writer.close()
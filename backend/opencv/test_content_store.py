@@ -0,0 +1,61 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+from content_store import ContentStore, content_hash
+
+
+def test_files_are_stored_by_content_hash():
+    store = ContentStore(max_bytes=1000)
+    data = bytearray(b"page" * 10)
+
+    digest = store.put(data)
+
+    assert digest == hashlib.sha256(data).hexdigest() == content_hash(data)
+    assert store.get(digest) is data
+    assert store.held(["unknown", digest]) == [digest]
+    # the same content is stored once
+    assert store.put(bytes(data)) == digest
+    assert (len(store), store.size) == (1, 40)
+
+
+def test_least_recently_used_files_are_evicted_over_budget():
+    store = ContentStore(max_bytes=100)
+    first, second = store.put(b"a" * 40), store.put(b"b" * 40)
+
+    # reading the first file makes the second one the oldest
+    store.get(first)
+    third = store.put(b"c" * 40)
+
+    assert store.held([first, second, third]) == [first, third]
+    assert store.size == 80
+    assert store.get(second) is None
+    assert store.stats()["hits"] == 1 and store.stats()["misses"] == 1
+
+
+def test_files_over_budget_are_not_stored():
+    store = ContentStore(max_bytes=10)
+    digest = store.put(b"x" * 11)
+
+    assert digest not in store
+    assert ContentStore(max_bytes=0).held([ContentStore(0).put(b"x")]) == []
+
+
+def test_decoded_pages_are_shared_read_only_and_counted():
+    store = ContentStore(max_bytes=200)
+    digest = store.put(b"p" * 50)
+    image = np.zeros((10, 10), dtype=np.uint8)
+
+    assert store.get_image(digest) is None
+    store.set_image(digest, image)
+
+    assert store.get_image(digest) is image
+    assert store.size == 150
+    with pytest.raises(ValueError):
+        image[0, 0] = 1
+
+    # a decoded page can push older files out
+    other = store.put(b"q" * 60)
+    assert store.held([digest, other]) == [other]
+    assert store.size == 60
@@ -2,7 +2,8 @@ import pytest
 import numpy as np
 import cv2
 from unittest.mock import patch, AsyncMock, MagicMock
-from find_circles import find_circles_cv2, evaluate_circles_quality, find_circles_fallback, save_parameter_circle_counts
+from find_circles import find_circles_cv2, evaluate_circles_quality, find_circles_fallback, save_parameter_circle_counts, group_sorted_values, pairwise_circle_stats
+from parameter_stats import ParameterStatsWriter, build_entry
 from utils import Utils
 from websocket_types import BoxRectangleType
 import json
@@ -73,7 +74,7 @@ async def test_find_circles_cv2_filled_circle_detection():
             )
 
             # Create a mock crop_img that will result in a filled circle
-            mock_crop_img = np.full((400, 400), 50, dtype=np.uint8) # Dark gray, below default darkness_threshold
+            mock_crop_img = np.full((4000, 4000), 50, dtype=np.uint8) # Dark gray, below default darkness_threshold
             with patch('find_circles.cv2.cvtColor', return_value=mock_crop_img): # This mocks the gray image
                 rectangle = {'x': 0.1, 'y': 0.1, 'width': 0.2, 'height': 0.2}
                 result = await find_circles_cv2(
@@ -158,8 +159,53 @@ def test_evaluate_circles_quality_boundary_penalty():
     # Expect a lower score due to boundary penalty
     assert score < 0.8
 
-# Test for save_parameter_circle_counts (mocking file operations)
-def test_save_parameter_circle_counts_writes_file():
+def test_pairwise_circle_stats_matches_pair_loops():
+    rng = np.random.default_rng(0)
+    circles = np.stack([rng.uniform(0, 600, 700), rng.uniform(0, 600, 700), rng.uniform(10, 30, 700)], axis=1).astype(np.float32)
+    min_distance = np.mean(circles[:, 2])
+
+    overlap_count = 0
+    distances = []
+    for i in range(len(circles)):
+        for j in range(i + 1, len(circles)):
+            distance = np.sqrt((circles[i][0] - circles[j][0])**2 + (circles[i][1] - circles[j][1])**2)
+            distances.append(distance)
+            if distance < (circles[i][2] + circles[j][2]) * 0.8:
+                overlap_count += 1
+    expected_nearest = [d for d in sorted(distances) if d > min_distance][:len(circles)]
+
+    count, nearest = pairwise_circle_stats(circles, min_distance, len(circles))
+
+    assert count == overlap_count
+    assert np.array_equal(nearest, np.array(expected_nearest, dtype=np.float32))
+
+def test_group_sorted_values_matches_anchor_grouping():
+    values = np.sort(np.random.default_rng(1).uniform(0, 500, 300).astype(np.float32))
+    tolerance = np.float32(7.5)
+
+    groups = []
+    for value in values:
+        for group in groups:
+            if abs(value - group[0]) <= tolerance:
+                group.append(value)
+                break
+        else:
+            groups.append([value])
+
+    starts = group_sorted_values(values, tolerance)
+
+    assert [end - start for start, end in zip(starts, starts[1:] + [len(values)])] == [len(group) for group in groups]
+
+def test_evaluate_circles_quality_rejects_implausible_counts():
+    rng = np.random.default_rng(2)
+    circles = np.stack([rng.uniform(0, 100, 50), rng.uniform(0, 100, 50), np.full(50, 10)], axis=1).astype(np.float32)
+
+    # At most 100*100 / (pi * 10^2) ~ 31 circles of radius 10 fit in a 100x100 box
+    assert evaluate_circles_quality((circles,), min_radius=10, max_radius=12, img_shape=(100, 100)) == 0
+    assert evaluate_circles_quality((circles[:20],), min_radius=10, max_radius=12, img_shape=(100, 100)) > 0
+
+# Test for save_parameter_circle_counts (the writer is mocked, no file I/O)
+def test_save_parameter_circle_counts_queues_entry():
     mock_param_circle_counts = {
         "dp=1_p1=0.4_p2=2_th=220": 10,
         "dp=1_p1=0.4_p2=2_th=224": 12
@@ -171,26 +217,22 @@ def test_save_parameter_circle_counts_writes_file():
         "page_info": ""
     }
     
-    # Mock os.path.exists and json.dump/load
-    with patch('os.path.exists', return_value=False), \
-         patch('json.dump') as mock_json_dump, \
-         patch('builtins.open', MagicMock()): # Mock open to prevent actual file access
+    with patch('find_circles.get_parameter_stats_writer') as mock_get_writer, \
+         patch('builtins.open', MagicMock()) as mock_open:
         
         save_parameter_circle_counts(mock_param_circle_counts, BoxRectangleType.OUTRO, rectangle_info)
         
-        mock_json_dump.assert_called_once()
-        args, kwargs = mock_json_dump.call_args
-        saved_data = args[0]
+        mock_get_writer.return_value.record.assert_called_once()
+        entry = mock_get_writer.return_value.record.call_args.args[0]
         
-        assert "Outro" in saved_data
-        assert len(saved_data["Outro"]) == 1
-        assert saved_data["Outro"][0]["parameter_combinations"] == mock_param_circle_counts
-        assert saved_data["Outro"][0]["rectangle_info"] == rectangle_info
-
-def test_save_parameter_circle_counts_appends_to_existing_file():
-    mock_param_circle_counts_new = {
-        "dp=1_p1=0.4_p2=2_th=220": 15
-    }
+        assert entry["rectangle_type"] == "Outro"
+        assert entry["parameter_combinations"] == mock_param_circle_counts
+        assert entry["rectangle_info"] == rectangle_info
+        mock_open.assert_not_called()
+
+def test_parameter_stats_writer_appends_to_existing_file(tmp_path):
+    stats_path = tmp_path / "parameter_circle_counts_all_types.json"
+    log_path = tmp_path / "parameter_circle_counts.jsonl"
     existing_data = {
         "Outro": [
             {
@@ -200,19 +242,20 @@ def test_save_parameter_circle_counts_appends_to_existing_file():
             }
         ]
     }
+    stats_path.write_text(json.dumps(existing_data))
     
-    # Mock os.path.exists and json.dump/load
-    with patch('os.path.exists', return_value=True), \
-         patch('json.load', return_value=existing_data), \
-         patch('json.dump') as mock_json_dump, \
-         patch('builtins.open', MagicMock()):
-        
-        save_parameter_circle_counts(mock_param_circle_counts_new, BoxRectangleType.OUTRO)
-        
-        mock_json_dump.assert_called_once()
-        args, kwargs = mock_json_dump.call_args
-        saved_data = args[0]
-        
-        assert "Outro" in saved_data
-        assert len(saved_data["Outro"]) == 2
-        assert saved_data["Outro"][1]["parameter_combinations"] == mock_param_circle_counts_new
+    writer = ParameterStatsWriter(log_path=str(log_path), stats_path=str(stats_path), flush_interval=60, max_entries=3)
+    for count in range(4):
+        writer.record(build_entry({"dp=1_p1=0.4_p2=2_th=220": count}, BoxRectangleType.OUTRO))
+    writer.record(build_entry({"dp=1_p1=0.4_p2=2_th=224": 7}, BoxRectangleType.MATRICULA))
+    
+    writer.flush(compact=False)
+    assert len(log_path.read_text().splitlines()) == 5
+    
+    writer.close()
+    saved_data = json.loads(stats_path.read_text())
+    
+    assert not log_path.exists()
+    assert [entry["parameter_combinations"]["dp=1_p1=0.4_p2=2_th=220"] for entry in saved_data["Outro"]] == [1, 2, 3]
+    assert saved_data["Matricula"][0]["parameter_combinations"] == {"dp=1_p1=0.4_p2=2_th=224": 7}
+    assert not (tmp_path / "parameter_circle_counts_all_types.json.lock").exists()
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+from hough_search import (
+    THRESHOLD_VALUES,
+    AdaptiveSearch,
+    ExhaustiveSearch,
+    HoughParameterSearch,
+    choose_probe_thresholds,
+    create_hough_search,
+    param_key,
+)
+
+
+def paper_crop(paper_level=235):
+    gray = np.full((200, 200), paper_level, dtype=np.uint8)
+    gray[50:70, 50:70] = 30  # a mark
+    return gray
+
+
+def run_search(search, score_fn):
+    waves = []
+    while True:
+        wave = search.next_wave()
+        if not wave:
+            break
+        waves.append(wave)
+        for param_combo in wave:
+            score, count = score_fn(param_combo)
+            search.report(param_combo, score, count)
+    return waves
+
+
+def test_exhaustive_search_covers_the_whole_grid_once():
+    search = ExhaustiveSearch(min_dist=120)
+    waves = run_search(search, lambda combo: (0.5, 10))
+
+    keys = [param_key(combo) for combo in waves[0]]
+    assert len(waves) == 1
+    assert len(keys) == len(set(keys)) == 36
+    assert search.stats() == {'search_strategy': 'exhaustive', 'combinations_evaluated': 36, 'grid_size': 36, 'call_budget': None}
+
+
+def test_call_budget_caps_evaluated_combinations():
+    search = ExhaustiveSearch(min_dist=120, call_budget=10)
+    waves = run_search(search, lambda combo: (0.5, 10))
+
+    assert sum(len(wave) for wave in waves) == 10
+    assert search.max_calls == 10
+
+
+def test_probe_thresholds_stay_below_paper_level():
+    probes = choose_probe_thresholds(paper_crop(235))
+
+    assert probes == [220, 228, 233]
+    assert choose_probe_thresholds(paper_crop(200)) == [220, 228, 243]
+
+
+def test_adaptive_search_stops_when_results_stabilize():
+    search = AdaptiveSearch(min_dist=120, gray_img=paper_crop())
+    run_search(search, lambda combo: (0.8, 25))
+
+    assert search.evaluated < 36
+    assert search.best_count == 25
+
+
+def test_adaptive_search_refines_towards_the_best_threshold():
+    best_threshold = 228
+
+    def score(combo):
+        return 1 - abs(combo['threshold'] - best_threshold) / 100 + combo['param2'] / 1000, 20
+
+    search = AdaptiveSearch(min_dist=120, gray_img=paper_crop(250))
+    run_search(search, score)
+
+    assert search.best_combo['threshold'] == best_threshold
+    assert search.best_combo['param2'] == 9
+    assert search.evaluated < 36
+    assert best_threshold in THRESHOLD_VALUES
+
+
+def test_unknown_strategy_is_rejected():
+    with pytest.raises(ValueError):
+        create_hough_search("random", 120, paper_crop())
+
+
+def test_strategy_without_proposals_cannot_be_built():
+    class IncompleteSearch(HoughParameterSearch):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        IncompleteSearch(120)
@@ -0,0 +1,64 @@
+import cv2
+import numpy as np
+import pytest
+from unittest.mock import MagicMock, patch
+
+from image_encoding import EncodingStats, encode_page, parse_output_format
+from utils import Utils
+
+
+@pytest.fixture(autouse=True)
+def mock_utils_logging():
+    with patch.object(Utils, 'log_info', new=MagicMock()):
+        yield
+
+
+def scanned_page():
+    page = np.full((120, 90), 230, dtype=np.uint8)
+    cv2.circle(page, (45, 60), 20, 30, 2)
+    return page
+
+
+def test_output_format_defaults_and_overrides():
+    assert parse_output_format() == {"format": "png", "quality": 90, "png_compression": 1}
+    assert parse_output_format("JPG")["format"] == "jpeg"
+    assert parse_output_format({"format": "webp", "quality": 60}, {"format": "png", "quality": 80}) == {"format": "webp", "quality": 60, "png_compression": 1}
+    assert parse_output_format(None, {"format": "raw"})["format"] == "raw"
+
+    for spec in ["gif", {"format": "jpeg", "quality": 0}, {"format": "png", "png_compression": 10}]:
+        with pytest.raises(ValueError):
+            parse_output_format(spec)
+
+
+@pytest.mark.parametrize("name", ["png", "jpeg", "webp"])
+def test_pages_decode_back_from_their_format(name):
+    page = scanned_page()
+
+    data = encode_page(page, parse_output_format(name))
+    decoded = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+
+    assert decoded.shape == page.shape
+    if name == "png":
+        assert np.array_equal(decoded, page)
+    else:
+        assert np.abs(decoded.astype(int) - page).mean() < 5
+
+
+def test_raw_pages_are_gray_pixels():
+    page = scanned_page()
+    color = cv2.cvtColor(page, cv2.COLOR_GRAY2BGR)
+
+    assert bytes(encode_page(page, parse_output_format("raw"))) == page.tobytes()
+    assert bytes(encode_page(color, parse_output_format("raw"))) == page.tobytes()
+
+
+def test_encode_time_and_size_are_reported_per_format():
+    stats = EncodingStats()
+    page = scanned_page()
+
+    sizes = [len(stats.timed_encode(page, parse_output_format(name))) for name in ["png", "png", "raw"]]
+
+    report = stats.to_dict()
+    assert report["png"]["pages"] == 2 and report["png"]["bytes"] == sizes[0] + sizes[1]
+    assert report["raw"] == {**report["raw"], "pages": 1, "bytes": 120 * 90, "average_bytes": 120 * 90}
+    assert report["png"]["encode_ms"] >= 0
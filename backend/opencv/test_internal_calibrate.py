@@ -0,0 +1,250 @@
+import numpy as np
+import pytest
+from unittest.mock import MagicMock, patch
+
+import cv2
+import internal_calibrate
+from PIL import Image
+from internal_calibrate import (
+    apply_calibration_to_image,
+    detect_angle_with_fallback,
+    detect_document_corners,
+    detect_shear_and_perspective,
+    find_4_most_distant_pixels,
+    normalize_image_brightness,
+)
+from config_loader import config
+from utils import Utils
+
+# Accuracy the pyramid corner search must keep against the full-resolution search
+CORNER_PYRAMID_TOLERANCE_PX = config.get_corner_detection_config()['tolerance_px']
+
+
+@pytest.fixture(autouse=True)
+def mock_utils_logging():
+    with patch.object(Utils, 'log_info', new=MagicMock()):
+        yield
+
+
+def scanned_page(seed, width=200, height=280):
+    rng = np.random.default_rng(seed)
+    page = np.full((height, width), 235, dtype=np.uint8)
+    margin = int(rng.integers(5, 30))
+    cv2.rectangle(page, (margin, margin), (width - margin, height - margin), 20, int(rng.integers(1, 4)))
+    for _ in range(int(rng.integers(0, 15))):
+        cv2.circle(page, (int(rng.integers(0, width)), int(rng.integers(0, height))), int(rng.integers(1, 8)), int(rng.integers(0, 60)), -1)
+    rotation = cv2.getRotationMatrix2D((width / 2, height / 2), float(rng.uniform(-8, 8)), 1)
+    return cv2.warpAffine(page, rotation, (width, height), borderValue=235)
+
+
+def greedy_corners(pixels, center):
+    """Reference: the pixel-by-pixel greedy selection the corner finder used."""
+    center_distances = np.linalg.norm(pixels - center, axis=1)
+    sorted_indices = np.argsort(center_distances)[::-1]
+    selected_pixels = [pixels[sorted_indices[0]]]
+    selected_indices = [sorted_indices[0]]
+
+    for _ in range(3):
+        best_pixel, best_score, best_idx = None, -1, -1
+        for idx in sorted_indices:
+            if idx in selected_indices:
+                continue
+            min_dist_to_selected = min(np.linalg.norm(pixels[idx] - selected) for selected in selected_pixels)
+            score = (center_distances[idx] / np.max(center_distances)) * 0.5 + (min_dist_to_selected / np.linalg.norm(center * 2)) * 0.5
+            if score > best_score:
+                best_pixel, best_score, best_idx = pixels[idx], score, idx
+        selected_pixels.append(best_pixel)
+        selected_indices.append(best_idx)
+
+    return np.array(selected_pixels, dtype=np.float32)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_corners_match_pixel_by_pixel_greedy(seed):
+    page = scanned_page(seed)
+    _, thresh = cv2.threshold(page, 70, 255, cv2.THRESH_BINARY_INV)
+    pixels = np.array([(pt[1], pt[0]) for pt in np.column_stack(np.where(thresh > 0))])
+    center = np.array([page.shape[1] // 2, page.shape[0] // 2])
+
+    corners, angle = find_4_most_distant_pixels(pixels, center)
+
+    assert np.array_equal(corners, greedy_corners(pixels, center))
+    assert detect_document_corners(page) is not None
+
+
+def test_pages_without_dark_pixels_have_no_corners():
+    assert detect_document_corners(np.full((50, 40), 255, dtype=np.uint8)) is None
+    assert find_4_most_distant_pixels(np.array([[0, 0], [5, 5], [9, 9]]), np.array([5, 5])) == (None, None)
+
+
+def rectangle_angle(corners):
+    return cv2.minAreaRect(corners.astype(np.int32))[2]
+
+
+@pytest.mark.parametrize("seed", range(8))
+@pytest.mark.parametrize("pyramid_factor", [2, 4, 8])
+def test_pyramid_corners_match_full_resolution_search(seed, pyramid_factor):
+    page = scanned_page(seed, width=800, height=1131)
+
+    full = detect_document_corners(page, pyramid_factor=1)
+    pyramid = detect_document_corners(page, pyramid_factor=pyramid_factor)
+
+    assert np.abs(pyramid - full).max() <= CORNER_PYRAMID_TOLERANCE_PX
+    assert rectangle_angle(pyramid) == pytest.approx(rectangle_angle(full), abs=0.5)
+
+
+def test_pyramid_keeps_single_dark_pixels():
+    page = np.full((400, 300), 235, dtype=np.uint8)
+    cv2.rectangle(page, (40, 40), (260, 360), 20, 2)
+    # a speck averaging away at 1/4 scale, the farthest dark pixel from the center
+    page[0, 150] = 0
+
+    full = detect_document_corners(page, pyramid_factor=1)
+    pyramid = detect_document_corners(page, pyramid_factor=4)
+
+    assert [150, 0] in pyramid.tolist()
+    assert np.abs(pyramid - full).max() <= CORNER_PYRAMID_TOLERANCE_PX
+
+
+def rotation_result(angle, crop_ratio, pixel_ratio, size=(100, 100)):
+    width, height = size
+    return {
+        'type': 'rotation',
+        'angle': angle,
+        'crop_rect': {'x': 0, 'y': 0, 'width': int(width * crop_ratio), 'height': height},
+        'pixel_count': int(width * height * pixel_ratio),
+        'rect_dimensions': (70, 90),
+    }
+
+
+def test_confident_percentile_result_skips_legacy_tiers():
+    page = np.full((100, 100, 3), 255, dtype=np.uint8)
+    with patch.object(internal_calibrate, '_detect_percentile_angle', return_value=rotation_result(3, 0.6, 0.2)), \
+         patch.object(internal_calibrate, 'detect_contour_angle_legacy') as mock_legacy:
+        angle, crop_rect, tier = detect_angle_with_fallback(page)
+
+    assert (angle, tier) == (3, 'percentile')
+    assert crop_rect['width'] == 60
+    mock_legacy.assert_not_called()
+
+
+def test_low_confidence_escalates_to_next_tiers():
+    page = np.full((100, 100, 3), 255, dtype=np.uint8)
+    first_set_results = [rotation_result(1, 0.95, 0.001)]
+    legacy_results = [
+        # the first parameter set gave a low confidence result
+        dict(rotation_result(1, 0.95, 0.001), parameter_results=first_set_results),
+        rotation_result(-2, 0.6, 0.2),
+    ]
+
+    with patch.object(internal_calibrate, '_detect_percentile_angle', return_value=rotation_result(20, 0.95, 0.001)), \
+         patch.object(internal_calibrate, 'detect_contour_angle_legacy', side_effect=legacy_results) as mock_legacy:
+        angle, _, tier = detect_angle_with_fallback(page)
+
+    assert (angle, tier) == (-2, 'legacy_averaged')
+    # the single parameter set tier runs first, the averaged one over the other parameter sets after it
+    single, averaged = mock_legacy.call_args_list
+    assert single.args[1] == internal_calibrate.LEGACY_PARAMETER_SETS[:1]
+    assert averaged.args[1] == internal_calibrate.LEGACY_PARAMETER_SETS[1:]
+    assert averaged.args[2] is first_set_results
+
+
+def test_legacy_method_averages_reused_parameter_set_results():
+    page = np.full((100, 100, 3), 255, dtype=np.uint8)
+    angles = iter(range(len(internal_calibrate.LEGACY_PARAMETER_SETS)))
+
+    def detect(cv_img, gray, blur_kernel, threshold, morph_kernel, description):
+        return rotation_result(next(angles), 0.6, 0.2)
+
+    with patch.object(internal_calibrate, '_detect_with_parameters', side_effect=detect) as mock_detect:
+        single = internal_calibrate.detect_contour_angle_legacy(page, internal_calibrate.LEGACY_PARAMETER_SETS[:1])
+        averaged = internal_calibrate.detect_contour_angle_legacy(
+            page, internal_calibrate.LEGACY_PARAMETER_SETS[1:], single['parameter_results'])
+
+    # every parameter set ran once, and all of them are averaged
+    assert mock_detect.call_count == len(internal_calibrate.LEGACY_PARAMETER_SETS)
+    assert averaged['individual_angles'] == list(range(len(internal_calibrate.LEGACY_PARAMETER_SETS)))
+
+
+def test_most_confident_result_is_used_when_no_tier_is_confident():
+    page = np.full((100, 100, 3), 255, dtype=np.uint8)
+    with patch.object(internal_calibrate, '_detect_percentile_angle', return_value=rotation_result(4, 0.95, 0.03)), \
+         patch.object(internal_calibrate, 'detect_contour_angle_legacy', return_value=rotation_result(30, 0.95, 0.001)):
+        angle, _, tier = detect_angle_with_fallback(page)
+
+    assert (angle, tier) == (4, 'percentile')
+
+
+def float_normalization(cv_img):
+    """Reference: the per-channel range stretch and gamma correction normalize_image_brightness did."""
+    gray = cv_img if cv_img.ndim == 2 else cv2.cvtColor(cv_img, cv2.COLOR_BGR2GRAY)
+    min_val, max_val = np.min(gray), np.max(gray)
+    channels = [cv_img] if cv_img.ndim == 2 else [cv_img[:, :, i] for i in range(3)]
+    stretched = [((channel - min_val) / (max_val - min_val) * 255).astype(np.uint8) for channel in channels]
+    cv_img = stretched[0] if cv_img.ndim == 2 else np.dstack(stretched)
+    mean_brightness = np.mean(cv_img if cv_img.ndim == 2 else cv2.cvtColor(cv_img, cv2.COLOR_BGR2GRAY))
+    gamma = 0.7 if mean_brightness < 100 else 1.3 if mean_brightness > 180 else 1.0
+    table = np.array([((i / 255.0) ** (1.0 / gamma)) * 255 for i in np.arange(0, 256)]).astype("uint8")
+    return cv2.LUT(cv_img, table)
+
+
+def loop_contrast(cv_img, clip_hist_percent=1):
+    """Reference: automatic_brightness_and_contrast with its cumulative histogram loop."""
+    gray = cv_img if cv_img.ndim == 2 else cv2.cvtColor(cv_img, cv2.COLOR_BGR2GRAY)
+    hist = cv2.calcHist([gray], [0], None, [256], [0, 256])
+    accumulator = [float(hist[0])]
+    for index in range(1, 256):
+        accumulator.append(accumulator[index - 1] + float(hist[index]))
+    clip = clip_hist_percent * accumulator[-1] / 100.0 / 2.0
+    minimum_gray, maximum_gray = 0, 255
+    while accumulator[minimum_gray] < clip:
+        minimum_gray += 1
+    while accumulator[maximum_gray] >= accumulator[-1] - clip:
+        maximum_gray -= 1
+    alpha = 255 / (maximum_gray - minimum_gray)
+    return cv2.convertScaleAbs(cv_img, alpha=alpha, beta=-minimum_gray * alpha)
+
+
+def previous_calibration(cv_img):
+    """Reference: normalize, rotate, crop with PIL, then stretch contrast, one step after the other."""
+    normalized = float_normalization(cv_img)
+    gray = normalized if normalized.ndim == 2 else cv2.cvtColor(normalized, cv2.COLOR_BGR2GRAY)
+    transform_info = detect_shear_and_perspective(gray)
+    crop_rect = transform_info['crop_rect']
+    x, y = crop_rect['x'] - 0.005 * crop_rect['width'], crop_rect['y'] - 0.005 * crop_rect['height']
+    width, height = crop_rect['width'] * 1.01, crop_rect['height'] * 1.01
+    height_px, width_px = cv_img.shape[:2]
+    M = cv2.getRotationMatrix2D((width_px // 2, height_px // 2), transform_info['angle'], 1.0)
+    rotated = cv2.warpAffine(normalized, M, (width_px, height_px), flags=cv2.INTER_CUBIC,
+                             borderMode=cv2.BORDER_CONSTANT, borderValue=(255, 255, 255))
+    cropped = np.array(Image.fromarray(rotated).crop((x, y, x + width, y + height)))
+    return loop_contrast(cropped)
+
+
+def calibration_page(seed, color):
+    rng = np.random.default_rng(seed)
+    page = scanned_page(seed, width=600, height=850)
+    # scanner exposure: the page does not use the full range
+    page = np.clip(page * rng.uniform(0.6, 1.0) + rng.integers(0, 30), 0, 255).astype(np.uint8)
+    return cv2.cvtColor(page, cv2.COLOR_GRAY2BGR) if color else page
+
+
+@pytest.mark.parametrize("color", [False, True])
+def test_brightness_lut_matches_float_normalization(color):
+    page = calibration_page(0, color)
+
+    assert np.array_equal(normalize_image_brightness(page.copy()), float_normalization(page))
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("color", [False, True])
+def test_calibration_matches_previous_chain(seed, color):
+    page = calibration_page(seed, color)
+    pil_page = Image.fromarray(page if not color else cv2.cvtColor(page, cv2.COLOR_BGR2RGB))
+
+    expected = previous_calibration(page)
+    calibrated = np.array(apply_calibration_to_image(pil_page, auto_contrast=True))
+    if color:
+        calibrated = cv2.cvtColor(calibrated, cv2.COLOR_RGB2BGR)
+
+    assert np.array_equal(calibrated, expected)
@@ -0,0 +1,434 @@
+import asyncio
+import base64
+import json
+import threading
+import pytest
+from unittest.mock import MagicMock, patch
+
+import cv2
+import numpy as np
+
+import main_processing_computer_local as server
+from binary_protocol import ProtocolSettings, encode_frame
+from connection_writer import ConnectionWriter
+from content_store import ContentStore, content_hash
+from memory_budget import MemoryBudget
+from utils import Utils
+from websocket_types import BoxRectangleType, WebsocketMessageCommand, WebsocketMessageStatus
+from worker_pool import WorkerPool
+
+
+@pytest.fixture(autouse=True)
+def mock_utils_logging():
+    with patch.object(Utils, 'log_info', new=MagicMock()), \
+         patch.object(Utils, 'log_error', new=MagicMock()):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def server_state():
+    """Fresh memory budget and content store, and no connection or upload left over between tests."""
+    memory_budget = MemoryBudget(256 * 1024 * 1024)
+    # the server's caches, which size the patched content store
+    for name, size, shrink in server.memory_budget._caches:
+        memory_budget.add_cache(name, size, shrink)
+    with patch.object(server, 'memory_budget', memory_budget), \
+         patch.object(server, 'content_store', ContentStore(64 * 1024 * 1024)):
+        yield
+    for writer in server.writer_per_client.values():
+        writer._task.cancel()
+    for state in (server.connected_clients, server.protocol_per_client, server.writer_per_client,
+                  server.pages_per_client, server.chunks_per_file_id, server.chunk_sequence_per_file_id,
+                  server.files_received, server.file_hash_per_file_id, server.upload_bytes_per_file_id,
+                  server.rejected_uploads, server.dropped_uploads, server.session_page_per_file_id,
+                  server.file_received_events, server.uploads_per_client, server.jobs_per_client):
+        state.clear()
+
+
+class FakeWebSocket:
+    remote_address = ("127.0.0.1", 0)
+
+    def __init__(self):
+        self.sent = []
+        self.incoming = asyncio.Queue()
+
+    async def send(self, message):
+        self.sent.append(message)
+
+    def receive(self, message):
+        """Queue a client message, None closes the connection."""
+        self.incoming.put_nowait(json.dumps(message) if isinstance(message, dict) else message)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self.incoming.get()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+    def messages(self, status=None):
+        messages = [json.loads(message) for message in self.sent if isinstance(message, str)]
+        return [message for message in messages if status is None or message["status"] == status]
+
+
+def connect(websocket, binary_frames=False):
+    """Register a connection the way handle_client does, with progress sent without delay."""
+    client_id = server.get_client_id(websocket)
+    server.connected_clients[client_id] = websocket
+    server.writer_per_client[client_id] = ConnectionWriter(websocket, progress_interval=0)
+    server.protocol_per_client[client_id] = ProtocolSettings(binary_frames=binary_frames)
+
+
+async def drain():
+    """Let the connection writers send what they queued."""
+    await asyncio.sleep(0.05)
+
+
+@pytest.mark.asyncio
+async def test_out_of_order_chunk_rejects_the_upload():
+    websocket = FakeWebSocket()
+    connect(websocket, binary_frames=True)
+
+    await server.handle_binary_message(websocket, encode_frame("task", "file", 0, b"a" * 100, False))
+    assert server.memory_budget.charged == 100
+
+    await server.handle_binary_message(websocket, encode_frame("task", "file", 2, b"b" * 100, False))
+    # the remaining chunks of the file are ignored
+    await server.handle_binary_message(websocket, encode_frame("task", "file", 3, b"c" * 100, True))
+    await drain()
+
+    assert server.memory_budget.charged == 0
+    assert "file" not in server.chunks_per_file_id
+    assert "file" not in server.dropped_uploads
+    assert server.get_file_received_event("file").is_set()
+
+    errors = websocket.messages(WebsocketMessageStatus.ERROR)
+    assert len(errors) == 1
+    assert errors[0]["data"]["task_id"] == "task"
+    assert errors[0]["data"]["file_id"] == "file"
+
+    # the job waiting for the file fails with the same error
+    await server.handle_job_received({
+        "command": WebsocketMessageCommand.FIND_CIRCLES,
+        "task_id": "task",
+        "file_ids": ["file"]
+    }, websocket)
+    await drain()
+
+    errors = websocket.messages(WebsocketMessageStatus.ERROR)
+    assert len(errors) == 2
+    assert "Out of order chunk" in errors[1]["data"]["error"]
+    assert "file" not in server.rejected_uploads
+
+
+def page_file(width, height=50):
+    ok, encoded = cv2.imencode(".png", np.full((height, width), 255, dtype=np.uint8))
+    assert ok
+    return encoded.tobytes()
+
+
+def batch_job(file_ids, **options):
+    return {
+        "command": WebsocketMessageCommand.FIND_CIRCLES,
+        "task_id": "batch",
+        "batch": True,
+        "file_ids": file_ids,
+        "circle_size": 0.02,
+        "boxes": [
+            {"rect": {"x": 0, "y": 0, "width": 0.5, "height": 1}, "rect_type": BoxRectangleType.EXEMPLO_CIRCULO, "name": "example"},
+            {"rect": {"x": 0.5, "y": 0, "width": 0.5, "height": 1}, "rect_type": BoxRectangleType.OUTRO, "name": "answers"},
+        ],
+        **options
+    }
+
+
+@pytest.mark.asyncio
+async def test_batch_sends_every_page_then_a_summary():
+    websocket = FakeWebSocket()
+    connect(websocket)
+    circle_sizes = {}
+    lock = threading.Lock()
+
+    async def fake_find_circles_cv2(path, rect, rect_type, img=None, circle_size=None, **kwargs):
+        width = img.shape[1]
+        if rect_type == BoxRectangleType.EXEMPLO_CIRCULO:
+            # the 150 px wide page has no example circle
+            return [] if width == 150 else [{"center_x": 5.0, "center_y": 5.0, "radius": 10.0}]
+        with lock:
+            circle_sizes[width] = circle_size
+        return [{"center_x": 10.0, "center_y": 10.0, "radius": 5.0}]
+
+    job = batch_job(["wide", "narrow", "broken", "plain"])
+    with patch.object(server, 'find_circles_cv2', new=fake_find_circles_cv2):
+        running = asyncio.ensure_future(server.handle_job_received(job, websocket))
+        # pages start as their files arrive, after the job
+        await asyncio.sleep(0.01)
+        await server.receive_file_chunk(websocket, "batch", "wide", page_file(200), True)
+        await server.receive_file_chunk(websocket, "batch", "narrow", page_file(100), True)
+        await server.receive_file_chunk(websocket, "batch", "broken", b"not an image", True)
+        await server.receive_file_chunk(websocket, "batch", "plain", page_file(150), True)
+        await running
+    await drain()
+
+    pages = {message["data"]["file_id"]: message["data"] for message in websocket.messages(WebsocketMessageStatus.PAGE_COMPLETED)}
+    assert set(pages) == {"wide", "narrow", "broken", "plain"}
+    assert pages["broken"]["error"] and pages["broken"]["circles"] == {}
+    assert pages["wide"]["error"] is None
+    assert pages["wide"]["page_index"] == 0
+    assert len(pages["wide"]["circles"]["answers"]) == 1
+
+    # every page used its own example circle, or the job's circle size when it has none
+    assert circle_sizes == {200: 10.0 / 200, 100: 10.0 / 100, 150: 0.02}
+    assert job["circle_size"] == 0.02
+
+    completed = websocket.messages(WebsocketMessageStatus.COMPLETED_TASK)
+    assert len(completed) == 1
+    summary = completed[0]["data"]["summary"]
+    assert "circles" not in completed[0]["data"]
+    assert summary["total_pages"] == 4
+    assert summary["completed_pages"] == 3
+    assert summary["failed_file_ids"] == ["broken"]
+    assert summary["total_circles"] == 3 * 1 + 2 * 1
+    assert server.memory_budget.charged == 0
+
+
+@pytest.mark.asyncio
+async def test_batch_caps_the_pages_processed_at_once():
+    websocket = FakeWebSocket()
+    connect(websocket)
+    lock = threading.Lock()
+    active = {"now": 0, "max": 0}
+
+    async def fake_find_circles_in_page(job, cv_image, page_info, on_progress):
+        with lock:
+            active["now"] += 1
+            active["max"] = max(active["max"], active["now"])
+        await asyncio.sleep(0.05)
+        with lock:
+            active["now"] -= 1
+        return {}
+
+    file_ids = [f"page-{index}" for index in range(5)]
+    for file_id in file_ids:
+        await server.receive_file_chunk(websocket, "batch", file_id, page_file(60), True)
+
+    with patch.object(server, 'find_circles_in_page', new=fake_find_circles_in_page), \
+         patch.object(server, 'worker_pool', WorkerPool(max_workers=4)), \
+         patch.object(server, 'FIND_CIRCLES_PAGE_CONCURRENCY', 4):
+        await server.handle_job_received(batch_job(file_ids, page_concurrency=2), websocket)
+    await drain()
+
+    assert active["max"] == 2
+    assert len(websocket.messages(WebsocketMessageStatus.PAGE_COMPLETED)) == 5
+    summary = websocket.messages(WebsocketMessageStatus.COMPLETED_TASK)[0]["data"]["summary"]
+    assert summary["page_concurrency"] == 2
+    assert summary["completed_pages"] == 5
+
+
+@pytest.mark.asyncio
+async def test_jobs_outliving_their_connection_do_not_register_a_writer():
+    websocket = FakeWebSocket()
+    websocket.receive(None)
+    await server.handle_client(websocket)
+
+    assert server.writer_per_client == {}
+    sent_before = len(websocket.sent)
+
+    # a job still running for the connection reports progress, then fails to send its result
+    await server.send_progress(websocket, "late progress", "task")
+    with pytest.raises(ConnectionError):
+        await server.get_writer(websocket).send("result", task_id="task")
+
+    await drain()
+    assert server.writer_per_client == {}
+    assert len(websocket.sent) == sent_before
+
+
+@pytest.mark.asyncio
+async def test_disconnect_releases_the_memory_of_its_jobs_and_uploads():
+    websocket = FakeWebSocket()
+    connection = asyncio.ensure_future(server.handle_client(websocket))
+
+    # a partial upload, then a batch job waiting for the rest of its pages
+    websocket.receive({"status": WebsocketMessageStatus.SENDING_CHUNK, "data": {
+        "task_id": "batch", "file_id": "first", "chunk": base64.b64encode(b"a" * 1000).decode("utf-8")
+    }})
+    websocket.receive({"command": WebsocketMessageCommand.FIND_CIRCLES, "data": batch_job(["first", "second"])})
+    await asyncio.sleep(0.05)
+
+    job_reserve = server.MEMORY_CONFIG['job_reserve_mb'] * 1024 * 1024
+    assert server.memory_budget.charged == job_reserve + 1000
+    jobs = set(server.jobs_per_client[server.get_client_id(websocket)])
+
+    websocket.receive(None)
+    await connection
+    await asyncio.sleep(0.05)
+
+    assert all(job.cancelled() for job in jobs)
+    assert server.memory_budget.charged == 0
+    assert server.chunks_per_file_id == {}
+    assert server.file_received_events == {}
+    assert server.uploads_per_client == {} and server.jobs_per_client == {}
+
+
+@pytest.mark.asyncio
+async def test_batch_pages_that_never_arrive_time_out():
+    websocket = FakeWebSocket()
+    connect(websocket)
+
+    async def fake_find_circles_in_page(job, cv_image, page_info, on_progress):
+        return {"answers": [{"center_x": 0.5, "center_y": 0.5, "radius": 0.01}]}
+
+    with patch.object(server, 'find_circles_in_page', new=fake_find_circles_in_page), \
+         patch.dict(server.MEMORY_CONFIG, {'upload_timeout': 0.1}):
+        running = asyncio.ensure_future(server.handle_job_received(batch_job(["sent", "lost"]), websocket))
+        await server.receive_file_chunk(websocket, "batch", "sent", page_file(60), True)
+        await running
+    await drain()
+
+    pages = {message["data"]["file_id"]: message["data"] for message in websocket.messages(WebsocketMessageStatus.PAGE_COMPLETED)}
+    assert pages["sent"]["error"] is None
+    assert "not received" in pages["lost"]["error"]
+    assert websocket.messages(WebsocketMessageStatus.COMPLETED_TASK)[0]["data"]["summary"]["failed_file_ids"] == ["lost"]
+    assert server.memory_budget.charged == 0
+
+
+def circles_job(task_id, file_ids, **options):
+    return {"command": WebsocketMessageCommand.FIND_CIRCLES, "task_id": task_id, "file_ids": file_ids, "boxes": [], **options}
+
+
+async def fake_find_circles_in_page(job, cv_image, page_info, on_progress):
+    return {"answers": [{"center_x": 0.5, "center_y": 0.5, "radius": 0.01}]}
+
+
+@pytest.mark.asyncio
+async def test_cached_files_are_used_without_upload_or_decoding():
+    websocket = FakeWebSocket()
+    connect(websocket)
+    data = page_file(120)
+    digest = content_hash(data)
+    decode = MagicMock(wraps=server.decode_page_image)
+
+    with patch.object(server, 'find_circles_in_page', new=fake_find_circles_in_page), \
+         patch.object(server, 'decode_page_image', new=decode):
+        await server.receive_file_chunk(websocket, "first", "uploaded", data, True)
+        await server.handle_job_received(circles_job("first", ["uploaded"]), websocket)
+
+        await server.handle_query_cached_files(websocket, {"task_id": "query", "hashes": [digest, "0" * 64]})
+        await drain()
+        cached = websocket.messages(WebsocketMessageStatus.CACHED_FILES)
+        assert cached[0]["data"] == {"task_id": "query", "hashes": [digest]}
+
+        # the second job only references the file by its hash
+        await server.handle_job_received(circles_job("second", ["reused"], file_hashes={"reused": digest}), websocket)
+    await drain()
+
+    completed = {message["data"]["task_id"]: message["data"] for message in websocket.messages(WebsocketMessageStatus.COMPLETED_TASK)}
+    assert set(completed) == {"first", "second"}
+    assert websocket.messages(WebsocketMessageStatus.ERROR) == []
+    assert decode.call_count == 1
+    assert server.content_store.hits == 1
+
+
+@pytest.mark.asyncio
+async def test_job_referencing_an_evicted_file_fails():
+    websocket = FakeWebSocket()
+    connect(websocket)
+
+    await server.handle_job_received(circles_job("task", ["page"], file_hashes={"page": "0" * 64}), websocket)
+    await drain()
+
+    errors = websocket.messages(WebsocketMessageStatus.ERROR)
+    assert len(errors) == 1
+    assert errors[0]["data"]["task_id"] == "task"
+    assert "not cached anymore" in errors[0]["data"]["error"]
+    assert websocket.messages(WebsocketMessageStatus.COMPLETED_TASK) == []
+
+
+async def task_finished(websocket, task_id, timeout=5):
+    """Wait for the COMPLETED_TASK (or ERROR) of `task_id`."""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while asyncio.get_running_loop().time() < deadline:
+        for message in websocket.messages():
+            if message["status"] in (WebsocketMessageStatus.COMPLETED_TASK, WebsocketMessageStatus.ERROR) \
+                    and message["data"].get("task_id") == task_id:
+                return message
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Task {task_id} did not finish")
+
+
+@pytest.mark.asyncio
+async def test_read_pages_are_reused_by_image_id_until_disconnect():
+    websocket = FakeWebSocket()
+    connection = asyncio.ensure_future(server.handle_client(websocket))
+    client_id = server.get_client_id(websocket)
+    decode = MagicMock(wraps=server.decode_page_image)
+    pages_found = []
+
+    async def find_circles_in_page(job, cv_image, page_info, on_progress):
+        pages_found.append(cv_image)
+        return await fake_find_circles_in_page(job, cv_image, page_info, on_progress)
+
+    with patch('read_to_images.calibrate_image', side_effect=lambda image, **kwargs: image), \
+         patch.object(server, 'calibration_pool', new=None), \
+         patch.object(server, 'find_circles_in_page', new=find_circles_in_page), \
+         patch.object(server, 'decode_page_image', new=decode):
+        websocket.receive({"status": WebsocketMessageStatus.FINAL_CHUNK, "data": {
+            "task_id": "read", "file_id": "upload", "chunk": base64.b64encode(page_file(120)).decode("utf-8")
+        }})
+        websocket.receive({"command": WebsocketMessageCommand.READ_TO_IMAGES, "data": {
+            "task_id": "read", "file_ids": ["upload"], "filename": "page.png"
+        }})
+        read = await task_finished(websocket, "read")
+        assert read["status"] == WebsocketMessageStatus.COMPLETED_TASK
+        image_id, = read["data"]["images_ids"]
+
+        # the page sent to the client is kept under its image id
+        page = server.pages_per_client[client_id].get(image_id)
+        assert page is not None
+
+        # and a later job references it by that id, without uploading it again
+        websocket.receive({"command": WebsocketMessageCommand.FIND_CIRCLES, "data": {
+            "task_id": "find", "file_ids": [image_id], "boxes": []
+        }})
+        found = await task_finished(websocket, "find")
+
+    assert found["status"] == WebsocketMessageStatus.COMPLETED_TASK
+    assert decode.call_count == 0
+    assert len(pages_found) == 1 and pages_found[0] is page
+    assert image_id not in server.files_received
+
+    websocket.receive(None)
+    await connection
+
+    assert server.pages_per_client == {}
+    assert server.session_pages_size() == 0
+
+
+@pytest.mark.asyncio
+async def test_uploads_and_pages_kept_by_the_content_store_are_charged_once():
+    websocket = FakeWebSocket()
+    connect(websocket)
+    data = page_file(120)
+    page_bytes = 120 * 50
+    used_while_processing = []
+
+    async def find_circles_in_page(job, cv_image, page_info, on_progress):
+        used_while_processing.append(server.memory_budget.used)
+        return await fake_find_circles_in_page(job, cv_image, page_info, on_progress)
+
+    await server.receive_file_chunk(websocket, "first", "uploaded", data, True)
+    assert server.memory_budget.used == len(data)
+    assert server.memory_budget.stats()["cached_bytes"]["content_store"] == 0
+
+    with patch.object(server, 'find_circles_in_page', new=find_circles_in_page):
+        await server.handle_job_received(circles_job("first", ["uploaded"]), websocket)
+
+    job_reserve = server.MEMORY_CONFIG['job_reserve_mb'] * 1024 * 1024
+    # the decoded page is kept in the store and not charged again while it is processed
+    assert used_while_processing == [job_reserve + len(data) + page_bytes]
+    # the upload is dropped with its job, the store now counts the file
+    assert server.memory_budget.charged == 0
+    assert server.memory_budget.used == server.content_store.size == len(data) + page_bytes
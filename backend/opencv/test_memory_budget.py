@@ -0,0 +1,114 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from content_store import ContentStore
+from memory_budget import MemoryBudget
+from session_pages import SessionPageRegistry
+
+
+def test_reserve_within_budget_and_reject_beyond():
+    budget = MemoryBudget(max_bytes=100)
+
+    assert budget.try_reserve(60)
+    assert not budget.try_reserve(50)
+    assert budget.used == 60
+    assert budget.rejected == 1
+
+    budget.release(60)
+    assert budget.try_reserve(100)
+
+
+def test_caches_shrink_first_in_registration_order():
+    store = ContentStore(max_bytes=1000)
+    pages = SessionPageRegistry(max_bytes=1000, ttl_seconds=60)
+    budget = MemoryBudget(max_bytes=1000)
+    budget.add_cache("content_store", lambda: store.size, store.shrink)
+    budget.add_cache("session_pages", lambda: pages.size, pages.shrink)
+
+    store.put(b"a" * 200)
+    store.put(b"b" * 200)
+    pages.add("page", np.zeros((20, 20), dtype=np.uint8))  # 400 bytes
+
+    assert budget.try_reserve(400)
+
+    # the oldest stored file went first, the session pages were not touched
+    assert store.size == 200
+    assert pages.size == 400
+    assert budget.stats()["cached_bytes"] == {"content_store": 200, "session_pages": 400}
+
+    assert budget.try_reserve(500)
+    assert store.size == 0
+    assert pages.size == 0
+    assert budget.used == 900
+
+
+def test_charge_shrinks_caches_and_fit_bounds_them():
+    store = ContentStore(max_bytes=1000)
+    budget = MemoryBudget(max_bytes=500)
+    budget.add_cache("content_store", lambda: store.size, store.shrink)
+
+    store.put(b"a" * 300)
+    store.put(b"b" * 300)
+    budget.fit()
+    assert store.size == 300
+
+    # a decoded page is already allocated: it is charged even when it does not fit
+    with budget.holding(600):
+        assert store.size == 0
+        assert budget.used == 600
+    assert budget.used == 0
+
+
+def test_stored_upload_is_counted_once():
+    store = ContentStore(max_bytes=1000)
+    budget = MemoryBudget(max_bytes=1000)
+    uploads = {}
+    budget.add_cache("content_store", lambda: store.unshared_size(uploads.values()), lambda max_bytes: store.shrink(max_bytes, uploads.values()))
+
+    # the upload is charged and stored as the same buffer
+    assert budget.try_reserve(300)
+    uploads["page"] = bytearray(b"a" * 300)
+    digest = store.put(uploads["page"])
+    store.set_image(digest, np.zeros((10, 10), dtype=np.uint8))
+    assert budget.used == 400
+
+    # evicting it only frees its decoded page, the upload still holds the file
+    assert budget.reclaim(1000) == 100
+    assert digest in store and store.get_image(digest) is None
+    assert budget.used == 300
+
+    # once the upload is dropped the store counts the file
+    del uploads["page"]
+    budget.release(300)
+    assert budget.used == 300
+    assert budget.reclaim(1000) == 300
+    assert store.size == 0
+
+
+@pytest.mark.asyncio
+async def test_reserve_waits_for_released_memory():
+    budget = MemoryBudget(max_bytes=100)
+    assert budget.try_reserve(80)
+
+    async def release_later():
+        await asyncio.sleep(0.05)
+        budget.release(80)
+
+    releasing = asyncio.ensure_future(release_later())
+    assert await budget.reserve(50, timeout=1)
+    await releasing
+
+    assert budget.charged == 50
+    assert budget.rejected == 0
+
+
+@pytest.mark.asyncio
+async def test_reserve_gives_up_after_timeout():
+    budget = MemoryBudget(max_bytes=100)
+    assert budget.try_reserve(80)
+
+    assert not await budget.reserve(50, timeout=0.05)
+    assert budget.charged == 80
+    assert budget.rejected == 1
@@ -0,0 +1,64 @@
+import pickle
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from page_image import PageImage
+
+
+def test_gray_pages_stay_single_channel():
+    image = Image.new("L", (30, 20), 200)
+
+    page = PageImage.from_pil(image, page=3)
+
+    assert page.array.shape == (20, 30)
+    assert page.size == (30, 20)
+    assert page.metadata == {"page": 3}
+    assert page.stats["allocations"] == 1
+    assert page.to_pil().mode == "L"
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "P"])
+def test_color_pages_are_bgr(mode):
+    image = Image.new("RGB", (4, 2), (0, 51, 102)).convert(mode)
+
+    page = PageImage.from_pil(image)
+
+    assert page.array.shape == (2, 4, 3)
+    assert page.array[0, 0].tolist() == [102, 51, 0]
+    assert page.array.flags['C_CONTIGUOUS']
+    # one buffer, the channels are swapped in place
+    assert page.stats["copied_bytes"] == 2 * 4 * 3
+    assert page.to_pil().getpixel((0, 0)) == (0, 51, 102)
+
+
+def test_derived_pages_count_their_buffers():
+    page = PageImage.from_pil(Image.new("L", (10, 10)), page=0)
+
+    resized = page.derive(np.zeros((5, 5), dtype=np.uint8), "resize")
+
+    assert resized.metadata == {"page": 0}
+    assert [step for step, _ in resized.stats["steps"]] == ["decode", "resize"]
+    assert resized.stats["copied_bytes"] == 100 + 25
+    # the original page keeps its own accounting
+    assert page.stats["allocations"] == 1
+    assert page.derive(page.array, "noop") is page
+    assert "2 buffers" in resized.report()
+
+
+def test_pages_survive_pickling():
+    page = PageImage.from_pil(Image.new("RGB", (8, 6), (1, 2, 3)), page=1)
+
+    copy = pickle.loads(pickle.dumps(page))
+
+    assert np.array_equal(copy.array, page.array)
+    assert copy.metadata == page.metadata
+    assert copy.stats == page.stats
+
+
+def test_invalid_arrays_are_rejected():
+    with pytest.raises(ValueError):
+        PageImage(np.zeros((4, 4), dtype=np.float32))
+    with pytest.raises(ValueError):
+        PageImage(np.zeros((4, 8), dtype=np.uint8)[:, ::2])
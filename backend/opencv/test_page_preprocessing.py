@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+from unittest.mock import patch
+
+import cv2
+from page_preprocessing import PagePreprocessor, page_alignment_transform
+
+
+def make_page():
+    img = np.full((500, 400, 3), 255, dtype=np.uint8)
+    cv2.circle(img, (200, 250), 20, (0, 0, 0), -1)
+    return img
+
+
+def test_only_box_regions_are_warped():
+    page = PagePreprocessor(make_page())
+    first = page.to_pixels({"left": 0.1, "top": 0.1, "width": 0.5, "height": 0.5})
+    second = page.to_pixels({"left": 0.4, "top": 0.4, "width": 0.5, "height": 0.5})
+
+    with patch('page_preprocessing.cv2.resize', wraps=cv2.resize) as mock_resize, \
+         patch('page_preprocessing.cv2.warpAffine', wraps=cv2.warpAffine) as mock_warp:
+        page.gray(first)
+        page.gray(second)
+        page.blurred(first)
+
+    assert mock_resize.call_count == 0
+    assert [call.args[2] for call in mock_warp.call_args_list] == [(2000, 2500), (2000, 2500)]
+    assert page.shape[:2] == (5000, 4000)
+    assert page.width_ratio == 10
+
+
+def test_region_planes_match_direct_computation():
+    img = make_page()
+    page = PagePreprocessor(img)
+    region = page.to_pixels({"left": 0.25, "top": 0.3, "width": 0.5, "height": 0.4})
+    x, y, width, height = region
+
+    resized = cv2.resize(img, fx=10, fy=10, dsize=(0, 0))
+    blurred = cv2.GaussianBlur(resized[y:y+height, x:x+width], (17, 17), 1.5)
+
+    # warpAffine and resize round their fixed point interpolation slightly differently
+    assert page.blurred(region).shape == blurred.shape
+    assert np.abs(page.blurred(region).astype(int) - blurred).max() <= 1
+    assert np.abs(page.gray(region).astype(int) - cv2.cvtColor(blurred, cv2.COLOR_BGR2GRAY)).max() <= 1
+    assert page.gray(region) is page.gray(region)
+
+
+def test_grayscale_pages_match_bgr_pages():
+    img = make_page()
+    bgr_page = PagePreprocessor(img)
+    gray_page = PagePreprocessor(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY))
+    region = bgr_page.to_pixels({"left": 0.25, "top": 0.3, "width": 0.5, "height": 0.4})
+
+    assert gray_page.shape == bgr_page.shape[:2]
+    assert gray_page.gray(region) is gray_page.blurred(region)
+    assert np.abs(gray_page.gray(region).astype(int) - bgr_page.gray(region)).max() <= 1
+
+
+def test_aligned_region_matches_full_page_warps():
+    img = make_page()
+    offset = {"x": 12, "y": -7}
+    page = PagePreprocessor(img, transform=page_alignment_transform(img.shape, offset, None))
+    region = page.to_pixels({"left": 0.2, "top": 0.2, "width": 0.6, "height": 0.6})
+    x, y, width, height = region
+
+    shifted = cv2.warpAffine(img, np.float32([[1, 0, 12], [0, 1, -7]]), img.shape[1::-1], flags=cv2.INTER_LINEAR)
+    expected = cv2.resize(shifted, fx=10, fy=10, dsize=(0, 0))[y:y+height, x:x+width]
+
+    assert np.abs(page.crop(region).astype(int) - expected).max() <= 1
+
+
+def test_page_coordinates_undo_offset_and_rotation():
+    img = make_page()
+    transform = page_alignment_transform(img.shape, {"x": 30, "y": -15}, 4.5)
+    page = PagePreprocessor(img, transform=transform)
+    points = np.array([[100.0, 200.0], [350.0, 40.0], [0.0, 499.0]])
+
+    aligned = cv2.transform(points.reshape(-1, 1, 2), transform).reshape(-1, 2)
+
+    assert np.allclose(page.to_page_coordinates(aligned), points)
+    assert page_alignment_transform(img.shape) is None
+
+
+def test_rectangle_outside_unit_range_is_rejected():
+    page = PagePreprocessor(make_page())
+
+    with pytest.raises(ValueError):
+        page.to_pixels({"left": 1.2, "top": 0, "width": 0.1, "height": 0.1})
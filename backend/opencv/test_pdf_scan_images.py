@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+from unittest.mock import MagicMock, patch
+
+from PIL import Image
+from pdf_scan_images import (
+    extract_scan_pages,
+    find_scan_pages,
+    load_scan_image,
+    parse_image_list,
+    parse_page_sizes,
+    unmatched_pages,
+)
+from utils import Utils
+
+IMAGE_LIST = """page   num  type   width height color comp bpc  enc interp  object ID x-ppi y-ppi size ratio
+--------------------------------------------------------------------------------------------
+   1     0 image    2480  3508  gray    1   8  jpeg   no         7  0   300   300  290K 3.4%
+   2     1 image    2480  3508  gray    1   8  jpeg   no        12  0   300   300  301K 3.5%
+   3     2 image    1728  2292  gray    1   1  ccitt  no        17  0   209   196 40.1K 8.3%
+"""
+
+PAGE_INFO = """Pages:           3
+Page    1 size:  595.2 x 841.92 pts (A4)
+Page    1 rot:   0
+Page    2 size:  595.2 x 841.92 pts (A4)
+Page    2 rot:   90
+Page    3 size:  595.2 x 841.92 pts (A4)
+Page    3 rot:   0
+"""
+
+
+@pytest.fixture(autouse=True)
+def mock_utils_logging():
+    with patch.object(Utils, 'log_info', new=MagicMock()), \
+         patch.object(Utils, 'log_error', new=MagicMock()):
+        yield
+
+
+def test_full_page_scans_are_detected():
+    images = parse_image_list(IMAGE_LIST)
+    page_sizes = parse_page_sizes(PAGE_INFO)
+
+    scan_pages = find_scan_pages(images, page_sizes, 3)
+
+    assert [scan_pages[page]['enc'] for page in (1, 2, 3)] == ["jpeg", "jpeg", "ccitt"]
+    assert scan_pages[2]['rotation'] == 90
+
+
+def test_mixed_pdfs_are_rasterized():
+    images = parse_image_list(IMAGE_LIST)
+    page_sizes = parse_page_sizes(PAGE_INFO)
+
+    # a page without images (vector content)
+    assert find_scan_pages(images, page_sizes, 4) is None
+    # a logo that does not cover the page
+    assert find_scan_pages([dict(images[0], width=600)] + images[1:], page_sizes, 3) is None
+    # an image with a soft mask
+    assert find_scan_pages(images + [dict(images[0], type="smask", num=3)], page_sizes, 3) is None
+
+
+def test_jpeg_pages_are_decoded_at_reduced_scale(tmp_path):
+    path = str(tmp_path / "page.jpg")
+    Image.new("RGB", (2480, 3508), "white").save(path, quality=80)
+
+    upright = load_scan_image(path, {'rotation': 0}, 800, grayscale=True)
+    turned = load_scan_image(path, {'rotation': 90}, 800)
+
+    # libjpeg scales by 1/2, 1/4 or 1/8: the smallest scale still 800 px wide is 1/2 (1/4 would be 620)
+    assert upright.size == (1240, 1754) and upright.mode == "L"
+    # 3508 px high pages turned by 90 degrees are displayed 3508 px wide, 1/4 scale keeps them 877 px wide
+    assert turned.size == (877, 620) and turned.mode == "RGB"
+
+
+def test_extracted_pages_are_returned_in_order(tmp_path):
+    def fake_pdfimages(command, args, poppler_path=None):
+        prefix = args[-1]
+        for page in (3, 2):
+            Image.new("L", (1240, 1754), 10 * page).save(f"{prefix}-{page:03d}-{page:03d}.jpg")
+        return ""
+
+    scan_pages = {2: {'rotation': 0}, 3: {'rotation': 180}}
+    with patch('pdf_scan_images.run_poppler', side_effect=fake_pdfimages) as mock_run:
+        images = extract_scan_pages("doc.pdf", 2, 3, scan_pages, str(tmp_path), 800, grayscale=True)
+
+    assert mock_run.call_args.args[1][:6] == ["-j", "-p", "-f", "2", "-l", "3"]
+    assert [int(np.asarray(image).mean()) for image in images] == [20, 30]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_every_extracted_page_is_checked_against_its_render():
+    renders = [Image.new("L", (99, 140), 255) for _ in range(3)]
+    blank = Image.new("L", (1240, 1754), 255)
+    # vector content drawn over the second scan only shows on its render
+    renders[1].paste(0, (0, 0, 99, 100))
+
+    with patch('pdf_scan_images.convert_from_path', return_value=renders) as mock_convert:
+        unmatched = unmatched_pages([blank, blank, blank], "doc.pdf", 4)
+
+    assert unmatched == [5]
+    assert mock_convert.call_count == 1
+    assert mock_convert.call_args.kwargs["first_page"] == 4
+    assert mock_convert.call_args.kwargs["last_page"] == 6
@@ -0,0 +1,232 @@
+import asyncio
+import numpy as np
+import pytest
+from io import BytesIO
+from unittest.mock import MagicMock, patch
+
+from fastapi import UploadFile
+from PIL import Image
+from page_image import PageImage
+from read_to_images import DEFAULT_PAGES_IN_FLIGHT, get_pdf_page_width, get_render_dpi, read_to_images
+from utils import Utils
+
+
+@pytest.fixture(autouse=True)
+def mock_utils_logging():
+    with patch.object(Utils, 'log_info', new=MagicMock()), \
+         patch.object(Utils, 'log_error', new=MagicMock()):
+        yield
+
+
+def fake_pdf(page_count, events, renders=None):
+    def convert(bytes_arr, first_page, last_page, thread_count, dpi, grayscale):
+        events.append(("render", first_page, last_page))
+        if renders is not None:
+            renders.append({"dpi": dpi, "grayscale": grayscale})
+        # A4 width at 200 DPI, like pdf2image's default rendering
+        return [Image.new("L" if grayscale else "RGB", (1654, 2339), "white") for _ in range(first_page, last_page + 1)]
+
+    def calibrate(cv_img, auto_contrast=False):
+        return cv_img.copy()
+
+    return (
+        patch('read_to_images.get_poppler_path', return_value=None),
+        patch('read_to_images.pdfinfo_from_bytes', return_value={"Pages": page_count, "Page size": "595.276 x 841.89 pts (A4)", "Page rot": 0}),
+        patch('read_to_images.convert_from_bytes', side_effect=convert),
+        patch('read_to_images.calibrate_image', side_effect=calibrate),
+        patch('read_to_images.detect_scan_pages', return_value=None),
+    )
+
+
+@pytest.mark.asyncio
+async def test_pdf_pages_are_rendered_in_ranges_and_streamed():
+    events = []
+    sizes = []
+
+    async def on_page(image_id, image):
+        events.append(("page", image_id))
+        sizes.append(image.size)
+
+    poppler, pdfinfo, convert, calibrate, scans = fake_pdf(5, events)
+    with poppler, pdfinfo, convert, calibrate, scans:
+        result = await read_to_images(UploadFile(file=BytesIO(b"%PDF-1.4"), filename="scan.pdf"), on_page=on_page, pages_in_flight=2)
+
+    renders = [event for event in events if event[0] == "render"]
+    page_ids = [event[1] for event in events if event[0] == "page"]
+
+    assert renders == [("render", 1, 2), ("render", 3, 4), ("render", 5, 5)]
+    # the first pages are sent before the next range is rendered
+    assert [event[0] for event in events[:4]] == ["render", "page", "page", "render"]
+    assert result["images"] == {}
+    assert list(result["image_sizes"]) == page_ids
+    assert list(result["image_calibration_rects"]) == page_ids
+    assert sizes == [(800, 1131)] * 5
+
+
+@pytest.mark.asyncio
+async def test_pages_are_kept_in_the_result_without_callback():
+    events = []
+
+    poppler, pdfinfo, convert, calibrate, scans = fake_pdf(3, events)
+    with poppler, pdfinfo, convert, calibrate, scans:
+        result = await read_to_images(UploadFile(file=BytesIO(b"%PDF-1.4"), filename="scan.pdf"))
+
+    assert events == [("render", 1, 3)]
+    assert len(result["images"]) == 3
+    assert all(isinstance(page, PageImage) for page in result["images"].values())
+
+
+@pytest.mark.asyncio
+async def test_calibrated_pdf_pages_are_rendered_gray_at_target_width():
+    renders = []
+
+    poppler, pdfinfo, convert, calibrate, scans = fake_pdf(2, [], renders)
+    with poppler, pdfinfo, convert, calibrate, scans:
+        result = await read_to_images(UploadFile(file=BytesIO(b"%PDF-1.4"), filename="scan.pdf"))
+        color_ids = await read_to_images(UploadFile(file=BytesIO(b"%PDF-1.4"), filename="scan.pdf"), needs_calibration=False)
+
+    assert renders == [{"dpi": 96.76, "grayscale": True}, {"dpi": 96.76, "grayscale": False}]
+    assert all(page.is_gray for page in result["images"].values())
+    assert len(color_ids) == 2
+
+
+@pytest.mark.asyncio
+async def test_scanned_pdfs_use_the_embedded_images():
+    events = []
+    scan_pages = {page: {'rotation': 0} for page in (1, 2, 3)}
+
+    def extract(pdf_path, first_page, last_page, scan_pages, work_dir, target_width, grayscale, poppler_path):
+        events.append(("extract", first_page, last_page))
+        if first_page == 3:
+            raise Exception("pdfimages failed")
+        return [Image.new("L", (1240, 1754), "white") for _ in range(first_page, last_page + 1)]
+
+    def check(images, pdf_path, first_page, poppler_path):
+        events.append(("check", first_page))
+        # vector content drawn over the scan of page 2
+        return [2] if first_page == 1 else []
+
+    poppler, pdfinfo, convert, calibrate, _ = fake_pdf(3, events)
+    with poppler, pdfinfo, convert, calibrate, \
+         patch('read_to_images.detect_scan_pages', return_value=scan_pages), \
+         patch('read_to_images.extract_scan_pages', side_effect=extract), \
+         patch('read_to_images.unmatched_pages', side_effect=check):
+        result = await read_to_images(UploadFile(file=BytesIO(b"%PDF-1.4"), filename="scan.pdf"), pages_in_flight=2)
+
+    # pages that do not match their render and pages whose extraction fails are rasterized
+    assert events == [("extract", 1, 2), ("check", 1), ("render", 2, 2), ("extract", 3, 3), ("render", 3, 3)]
+    assert [image.size for image in result["images"].values()] == [(800, 1131)] * 3
+
+
+@pytest.mark.asyncio
+async def test_pages_are_calibrated_in_parallel_and_kept_in_order():
+    events = []
+    pages = []
+    running = []
+    max_running = []
+
+    class FakePool:
+        def concurrency(self):
+            return 3
+
+        async def run(self, fn, page):
+            running.append(page)
+            max_running.append(len(running))
+            # later pages finish first
+            await asyncio.sleep(0.01 * (5 - page.metadata["page"]))
+            running.remove(page)
+            return fn(page)
+
+    def convert(bytes_arr, first_page, last_page, thread_count, dpi, grayscale):
+        return [Image.new("L", (800, 1131), "white") for _ in range(first_page, last_page + 1)]
+
+    async def on_page(image_id, page):
+        pages.append(page.metadata["page"] + 1)
+
+    poppler, pdfinfo, _, calibrate, scans = fake_pdf(5, events)
+    with poppler, pdfinfo, calibrate, scans, \
+         patch('read_to_images.convert_from_bytes', side_effect=convert), \
+         patch('read_to_images.calibrate_page', side_effect=lambda page: page.derive(page.array.copy(), "calibration")):
+        result = await read_to_images(UploadFile(file=BytesIO(b"%PDF-1.4"), filename="scan.pdf"), on_page=on_page, pages_in_flight=5, calibration_pool=FakePool())
+
+    assert max(max_running) == 3
+    assert pages == [1, 2, 3, 4, 5]
+    assert len(result["image_sizes"]) == 5
+
+
+@pytest.mark.asyncio
+async def test_calibration_runs_across_ranges_with_the_default_pages_in_flight():
+    events = []
+    pages = []
+    running = []
+    max_running = []
+
+    class FakePool:
+        def concurrency(self):
+            return 8
+
+        async def run(self, fn, page):
+            running.append(page)
+            max_running.append(len(running))
+            await asyncio.sleep(0.05)
+            running.remove(page)
+            return fn(page)
+
+    def convert(bytes_arr, first_page, last_page, thread_count, dpi, grayscale):
+        events.append(("render", first_page, len(running)))
+        return [Image.new("L", (800, 1131), "white") for _ in range(first_page, last_page + 1)]
+
+    async def on_page(image_id, page):
+        pages.append(page.metadata["page"] + 1)
+
+    poppler, pdfinfo, _, calibrate, scans = fake_pdf(16, events)
+    with poppler, pdfinfo, calibrate, scans, \
+         patch('read_to_images.convert_from_bytes', side_effect=convert), \
+         patch('read_to_images.calibrate_page', side_effect=lambda page: page.derive(page.array.copy(), "calibration")):
+        await read_to_images(UploadFile(file=BytesIO(b"%PDF-1.4"), filename="scan.pdf"), on_page=on_page, calibration_pool=FakePool())
+
+    # 4 pages are rendered at a time, but the pool calibrates 8 at once
+    assert DEFAULT_PAGES_IN_FLIGHT == 4
+    assert max(max_running) == 8
+    # later ranges render while earlier pages calibrate
+    assert max(calibrating for _, _, calibrating in events) > 0
+    assert pages == list(range(1, 17))
+
+
+def test_render_dpi():
+    # poppler rounds the page size up, the DPI keeps A4 and Letter pages within 800 px
+    for size in ["595.276 x 841.89 pts (A4)", "612 x 792 pts (letter)"]:
+        width = get_pdf_page_width({"Page size": size})
+        assert np.ceil(width * get_render_dpi(width) / 72) <= 800
+
+    assert get_pdf_page_width({"Page size": "595 x 842 pts (A4)", "Page rot": 90}) == 842
+    assert get_render_dpi(200) == 200
+    assert get_render_dpi(None) == 200
+
+
+@pytest.mark.asyncio
+async def test_pdf_conversion_errors_return_none():
+    on_progress = MagicMock()
+
+    async def progress(message):
+        on_progress(message)
+
+    with patch('read_to_images.get_poppler_path', return_value=None), \
+         patch('read_to_images.pdfinfo_from_bytes', side_effect=Exception("Unable to get page count. Is poppler installed?")):
+        result = await read_to_images(UploadFile(file=BytesIO(b"%PDF-1.4"), filename="scan.pdf"), on_progress=progress)
+
+    assert result is None
+    assert "poppler not found" in on_progress.call_args.args[0]
+
+
+@pytest.mark.asyncio
+async def test_pages_report_their_buffers():
+    poppler, pdfinfo, convert, calibrate, scans = fake_pdf(1, [])
+    with poppler, pdfinfo, convert, calibrate, scans:
+        result = await read_to_images(UploadFile(file=BytesIO(b"%PDF-1.4"), filename="scan.pdf"))
+
+    page, = result["images"].values()
+    # the 1654 px wide page is decoded, resized to 800 px and calibrated, nothing else is copied
+    assert [step for step, _ in page.stats["steps"]] == ["decode", "resize", "calibration"]
+    assert page.stats["copied_bytes"] == 1654 * 2339 + 2 * 800 * 1131
+    Utils.log_info.assert_any_call(f"📐 Page 1: {page.report()}")
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from session_pages import SessionPageRegistry
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def page(width=10, height=10):
+    return np.zeros((height, width), dtype=np.uint8)
+
+
+def test_pages_are_shared_read_only():
+    pages = SessionPageRegistry(max_bytes=1000, ttl_seconds=60)
+    first = page()
+
+    pages.add("a", first)
+
+    assert pages.get("a") is first
+    assert "a" in pages and "b" not in pages
+    assert pages.get("b") is None
+    with pytest.raises(ValueError):
+        first[0, 0] = 1
+
+
+def test_pages_expire_after_their_last_use():
+    clock = FakeClock()
+    pages = SessionPageRegistry(max_bytes=1000, ttl_seconds=60, clock=clock)
+    pages.add("a", page())
+    pages.add("b", page())
+
+    clock.now = 50
+    pages.get("a")
+    clock.now = 61
+
+    assert "a" in pages and "b" not in pages
+    assert pages.size == 100
+
+    clock.now = 200
+    assert pages.get("a") is None
+    assert (len(pages), pages.size) == (0, 0)
+
+
+def test_least_recently_used_pages_are_dropped_over_budget():
+    pages = SessionPageRegistry(max_bytes=300, ttl_seconds=60)
+    for image_id in "abc":
+        pages.add(image_id, page())
+
+    pages.get("a")
+    pages.add("d", page())
+
+    assert [image_id for image_id in "abcd" if image_id in pages] == ["a", "c", "d"]
+    assert pages.size == 300
+    # pages over the budget are not kept, a replaced page is counted once
+    pages.add("e", page(30, 30))
+    pages.add("d", page(5, 10))
+    assert "e" not in pages
+    assert pages.size == 250
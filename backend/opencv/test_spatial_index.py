@@ -0,0 +1,96 @@
+import numpy as np
+from unittest.mock import patch
+
+from find_circles import remove_grid_outliers, remove_overlapping_circles
+from spatial_index import (
+    CircleSpatialIndex,
+    chain_sorted_values,
+    suppress_overlaps,
+    within_tolerance_of_any,
+)
+
+
+def noisy_grid(seed=0, rows=8, cols=10, extra=25):
+    rng = np.random.default_rng(seed)
+    xs, ys = np.meshgrid(np.arange(cols) * 45.0 + 20, np.arange(rows) * 45.0 + 20)
+    circles = np.stack([xs.ravel(), ys.ravel(), np.full(xs.size, 12.0)], axis=1)
+    circles[:, :2] += rng.normal(0, 3, (len(circles), 2))
+    duplicates = circles[rng.integers(0, len(circles), extra)] + rng.normal(0, 2, (extra, 3))
+    strays = np.column_stack([rng.uniform(0, cols * 45.0, extra), rng.uniform(0, rows * 45.0, extra), rng.uniform(6, 20, extra)])
+    circles = np.concatenate([circles, duplicates, strays])
+    rng.shuffle(circles)
+    return circles.astype(np.float32)
+
+
+def test_query_radius_matches_brute_force():
+    circles = noisy_grid()
+    index = CircleSpatialIndex(circles, cell_size=30)
+
+    for x, y, radius in [(100, 100, 30), (0, 0, 60), (250.5, 180.25, 45), (900, 900, 10)]:
+        distances = np.sqrt((circles[:, 0] - np.float32(x))**2 + (circles[:, 1] - np.float32(y))**2)
+        assert index.query_radius(x, y, radius).tolist() == np.flatnonzero(distances <= radius).tolist()
+
+
+def test_added_circles_are_found():
+    index = CircleSpatialIndex(np.empty((0, 3), dtype=np.float32), cell_size=15)
+    assert index.first_within(10, 10, 15) is None
+
+    for i in range(20):
+        index.add(np.float32([i * 10, 5, 3]))
+
+    assert len(index) == 20
+    assert index.first_within(52, 5, 15) == 4
+
+
+def test_suppress_overlaps_matches_pairwise_greedy():
+    circles = noisy_grid(seed=3).astype(np.float64)
+
+    # Reference: the pairwise greedy loop the overlap filter used
+    removed = set()
+    for i, (x1, y1, r1) in enumerate(circles):
+        if i in removed:
+            continue
+        for j in range(i + 1, len(circles)):
+            if j in removed:
+                continue
+            x2, y2, r2 = circles[j]
+            distance = np.sqrt((x1 - x2)**2 + (y1 - y2)**2)
+            if distance < r1 + r2 and ((r1 + r2) - distance) / (2 * min(r1, r2)) >= 0.5:
+                if r2 > r1 * 1.1:
+                    removed.add(i)
+                    break
+                removed.add(j)
+
+    kept, removals = suppress_overlaps(circles, 0.5)
+
+    assert kept == [i for i in range(len(circles)) if i not in removed]
+    assert {removal[0] for removal in removals} == removed
+
+
+def test_grid_lines_helpers():
+    values = np.array([0.0, 1.0, 2.5, 10.0, 11.0, 30.0])
+
+    assert chain_sorted_values(values, 1.5) == [(0, 3), (3, 5), (5, 6)]
+    assert within_tolerance_of_any(np.array([4.0, 9.0, 29.0]), [1.0, 10.5], 1.5).tolist() == [False, True, False]
+
+
+@patch('find_circles.Utils.log_info')
+def test_filters_keep_dense_grids_near_linear(mock_log_info):
+    circles = list(noisy_grid(seed=5, rows=40, cols=50, extra=200))
+
+    candidate_counts = []
+    candidates = CircleSpatialIndex.candidates
+
+    def counting_candidates(self, x, y, radius):
+        found = candidates(self, x, y, radius)
+        candidate_counts.append(len(found))
+        return found
+
+    with patch.object(CircleSpatialIndex, 'candidates', counting_candidates):
+        filtered = remove_overlapping_circles(circles)
+        remove_grid_outliers(filtered)
+
+    compared = sum(candidate_counts)
+    # A pairwise pass would compute len(circles) ** 2 distances
+    assert compared < len(circles) * 100
+    assert 1500 < len(filtered) < len(circles)
@@ -0,0 +1,83 @@
+import asyncio
+import os
+import threading
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from worker_pool import ProcessWorkerPool, WorkerPool, WorkerPoolFullError, threadsafe_progress
+
+
+@pytest.mark.asyncio
+async def test_run_executes_off_the_event_loop_thread():
+    pool = WorkerPool(max_workers=2, max_queue_depth=4)
+    try:
+        thread_name = await pool.run(lambda: threading.current_thread().name)
+        assert thread_name != threading.current_thread().name
+        assert pool.stats()['in_flight'] == 0
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_run_async_reports_progress_to_the_main_loop():
+    pool = WorkerPool(max_workers=1, max_queue_depth=1)
+    received = []
+
+    async def on_progress(message):
+        received.append((message, threading.current_thread().name))
+
+    async def work(value, on_progress):
+        await on_progress("halfway")
+        return value * 2
+
+    try:
+        result = await pool.run_async(work, 21, on_progress=threadsafe_progress(asyncio.get_running_loop(), on_progress))
+        await asyncio.sleep(0)
+    finally:
+        pool.shutdown()
+
+    assert result == 42
+    assert received == [("halfway", threading.current_thread().name)]
+
+
+@pytest.mark.asyncio
+async def test_run_rejects_jobs_when_queue_is_full():
+    pool = WorkerPool(max_workers=1, max_queue_depth=1)
+    release = threading.Event()
+
+    try:
+        running = [asyncio.ensure_future(pool.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+
+        with pytest.raises(WorkerPoolFullError):
+            await pool.run(lambda: None)
+        assert pool.stats()['queued'] == 1
+    finally:
+        release.set()
+        await asyncio.gather(*running)
+        pool.shutdown()
+
+    assert pool.stats()['in_flight'] == 0
+
+
+@pytest.mark.asyncio
+async def test_process_pool_runs_jobs_in_worker_processes():
+    pool = ProcessWorkerPool(max_workers=2)
+    try:
+        pids = await asyncio.gather(*(pool.run(os.getpid) for _ in range(4)))
+        assert os.getpid() not in pids
+        assert await pool.run(pow, 3, 4) == 81
+    finally:
+        pool.shutdown()
+
+
+def test_process_pool_concurrency_follows_available_memory():
+    pool = ProcessWorkerPool(max_workers=8, memory_per_worker_mb=256)
+
+    with patch('worker_pool.psutil.virtual_memory', return_value=SimpleNamespace(available=1024 * 1024 * 1024)):
+        assert pool.concurrency() == 4
+    with patch('worker_pool.psutil.virtual_memory', return_value=SimpleNamespace(available=0)):
+        assert pool.concurrency() == 1
+    with patch('worker_pool.psutil.virtual_memory', return_value=SimpleNamespace(available=64 * 1024**3)):
+        assert pool.concurrency() == 8
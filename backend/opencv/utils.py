@@ -120,50 +120,48 @@ class Utils:
     def automatic_brightness_and_contrast(image, clip_hist_percent=1):
 
         if type(image) == Image.Image:
-            image = cv2.cvtColor(np.array(image), cv2.COLOR_BGR2RGB)
+            image = np.array(image) if image.mode == 'L' else cv2.cvtColor(np.array(image), cv2.COLOR_BGR2RGB)
 
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        # grayscale pages are already a single plane
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         
         # Calculate grayscale histogram
-        hist = cv2.calcHist([gray],[0],None,[256],[0,256])
-        hist_size = len(hist)
+        hist = cv2.calcHist([gray],[0],None,[256],[0,256]).ravel()
         
-        # Calculate cumulative distribution from the histogram
-        accumulator = []
-        accumulator.append(float(hist[0]))
-        for index in range(1, hist_size):
-            accumulator.append(accumulator[index -1] + float(hist[index]))
+        lut, alpha, beta = Utils.brightness_and_contrast_lut(hist, clip_hist_percent)
+        
+        auto_result = cv2.LUT(image, lut)
+        return (auto_result, alpha, beta)
+
+    @staticmethod
+    def brightness_and_contrast_lut(hist, clip_hist_percent=1):
+        """
+        Lookup table of automatic_brightness_and_contrast for a 256-bin grayscale histogram:
+        stretches the levels between the clipped histogram ends to 0-255.
+        Returns (lut, alpha, beta); the table is the identity when the clipped histogram has no range.
+        """
+        # Cumulative distribution from the histogram
+        accumulator = np.cumsum(hist, dtype=np.float64)
         
         # Locate points to clip
         maximum = accumulator[-1]
         clip_hist_percent *= (maximum/100.0)
         clip_hist_percent /= 2.0
         
-        # Locate left cut
-        minimum_gray = 0
-        while accumulator[minimum_gray] < clip_hist_percent:
-            minimum_gray += 1
+        # Left cut: first level reaching the clip count, right cut: last level before the top clip count
+        minimum_gray = int(np.searchsorted(accumulator, clip_hist_percent, side='left'))
+        maximum_gray = int(np.searchsorted(accumulator, maximum - clip_hist_percent, side='left')) - 1
         
-        # Locate right cut
-        maximum_gray = hist_size -1
-        while accumulator[maximum_gray] >= (maximum - clip_hist_percent):
-            maximum_gray -= 1
+        levels = np.arange(256, dtype=np.uint8)
+        if maximum_gray < 0 or maximum_gray == minimum_gray:
+            return levels, 1.0, 0.0
         
         # Calculate alpha and beta values
         alpha = 255 / (maximum_gray - minimum_gray)
         beta = -minimum_gray * alpha
         
-        '''
-        # Calculate new histogram with desired range and show histogram 
-        new_hist = cv2.calcHist([gray],[0],None,[256],[minimum_gray,maximum_gray])
-        plt.plot(hist)
-        plt.plot(new_hist)
-        plt.xlim([0,256])
-        plt.show()
-        '''
-
-        auto_result = cv2.convertScaleAbs(image, alpha=alpha, beta=beta)
-        return (auto_result, alpha, beta)
+        # Same arithmetic and rounding as convertScaleAbs on every gray level
+        return cv2.convertScaleAbs(levels, alpha=alpha, beta=beta).ravel(), alpha, beta
 
     @staticmethod
     def set_image_show_flag(flag_name, value):
@@ -4,6 +4,8 @@ class WebsocketMessageCommand:
     GET_CALIBRATION = "getCalibration"
     FIND_CIRCLES = "findCircles"
     PING = "ping"
+    NEGOTIATE_PROTOCOL = "negotiateProtocol"
+    QUERY_CACHED_FILES = "queryCachedFiles"
 
 
 
@@ -18,6 +20,10 @@ class WebsocketMessageStatus:
     FINAL_CHUNK = "finalChunk"
     INTERNAL_CLIENT_REPORT = "internalClientReport"
     CONNECTED = "connected"
+    PROTOCOL_NEGOTIATED = "protocolNegotiated"
+    PAGE_COMPLETED = "pageCompleted"
+    CACHED_FILES = "cachedFiles"
+    RETRY_LATER = "retryLater"
 
 class BoxRectangleType:
     TYPE_B = "Tipo B"
@@ -0,0 +1,189 @@
+"""
+Long-lived worker pool for the CPU-bound stages of the local processing server.
+
+The asyncio loop only coordinates I/O (WebSocket messages, uploads, progress);
+OpenCV work such as circle detection, PDF conversion and calibration is handed
+to this pool so PING/PONG and chunk reception keep flowing while pages are
+being processed. Page calibration, which holds the GIL for long stretches, can
+additionally be fanned out to worker processes (`ProcessWorkerPool`).
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import psutil
+
+from utils import Utils
+
+
+class WorkerPoolFullError(Exception):
+    """Raised when a job is submitted while the pool's queue is already full."""
+
+
+class WorkerPool:
+    """
+    Thread pool with a bounded backlog.
+
+    OpenCV releases the GIL inside its heavy functions, so threads give real
+    parallelism for the detection and calibration stages while still letting
+    worker code report progress back to the event loop.
+    """
+
+    def __init__(self, max_workers=None, max_queue_depth=None):
+        """
+        Args:
+            max_workers: Number of worker threads (defaults to the number of CPU cores)
+            max_queue_depth: Maximum number of jobs waiting for a free worker
+                             (None = unbounded)
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue_depth = max_queue_depth
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="corigge-worker")
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def _reserve_slot(self):
+        with self._lock:
+            if self.max_queue_depth is not None and self._in_flight >= self.max_workers + self.max_queue_depth:
+                raise WorkerPoolFullError(
+                    f"Worker pool is full ({self._in_flight} jobs in flight, "
+                    f"{self.max_workers} workers, queue depth {self.max_queue_depth}). Try again later."
+                )
+            self._in_flight += 1
+
+    def _release_slot(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        """Run a blocking function on a worker thread and await its result."""
+        self._reserve_slot()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, lambda: fn(*args, **kwargs))
+        finally:
+            self._release_slot()
+
+    async def run_async(self, coro_fn, *args, **kwargs):
+        """
+        Run a coroutine function to completion on a worker thread, inside its own event loop.
+        Used for the detection pipeline, whose functions are async because they report progress.
+        """
+        return await self.run(_run_coroutine_in_new_loop, coro_fn, args, kwargs)
+
+    def stats(self):
+        with self._lock:
+            in_flight = self._in_flight
+        return {
+            'max_workers': self.max_workers,
+            'max_queue_depth': self.max_queue_depth,
+            'in_flight': in_flight,
+            'queued': max(0, in_flight - self.max_workers)
+        }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+class ProcessWorkerPool:
+    """
+    Process pool for page stages that hold the GIL (calibration mixes numpy, PIL
+    and Python loops, so threads serialize on it).
+
+    Worker processes are started on first use with the spawn method, so they do not
+    inherit the server's threads and sockets. How many pages run at once is capped
+    by the memory available at the time (`concurrency`).
+    """
+
+    def __init__(self, max_workers=None, memory_per_worker_mb=256):
+        """
+        Args:
+            max_workers: Number of worker processes (defaults to the number of CPU cores,
+                         1 runs everything in the calling thread)
+            memory_per_worker_mb: Memory a busy worker needs, used to cap concurrency
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.memory_per_worker_mb = memory_per_worker_mb
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def concurrency(self):
+        """Jobs that fit in the memory available right now (at least 1, at most `max_workers`)."""
+        available_mb = psutil.virtual_memory().available / 1024 / 1024
+        return max(1, min(self.max_workers, int(available_mb // max(self.memory_per_worker_mb, 1))))
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    async def run(self, fn, *args):
+        """Run a picklable top-level function in a worker process and await its result."""
+        if self.max_workers <= 1:
+            return fn(*args)
+
+        try:
+            return await asyncio.wrap_future(self._get_executor().submit(fn, *args))
+        except BrokenProcessPool as e:
+            # A worker died (e.g. killed when out of memory): start a fresh pool next time, run this job here
+            Utils.log_error(f"Process pool broken, running job in the calling thread: {e}")
+            with self._lock:
+                self._executor = None
+            return fn(*args)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+
+def _run_coroutine_in_new_loop(coro_fn, args, kwargs):
+    loop = asyncio.new_event_loop()
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(coro_fn(*args, **kwargs))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def threadsafe_progress(loop, on_progress):
+    """
+    Wrap an async progress callback owned by `loop` so it can be awaited from a worker thread.
+    The message is scheduled on the main loop and the worker continues without waiting for the send.
+    """
+    if on_progress is None:
+        return None
+
+    async def forward(message):
+        future = asyncio.run_coroutine_threadsafe(on_progress(message), loop)
+        future.add_done_callback(_log_forward_error)
+
+    return forward
+
+
+def threadsafe_callback(loop, callback):
+    """
+    Wrap an async callback owned by `loop` so it can be awaited from a worker thread.
+    Unlike `threadsafe_progress`, the worker waits until the callback finished on the
+    main loop, which gives backpressure when the callback sends data to a client.
+    """
+    async def forward(*args, **kwargs):
+        future = asyncio.run_coroutine_threadsafe(callback(*args, **kwargs), loop)
+        return await asyncio.wrap_future(future)
+
+    return forward
+
+
+def _log_forward_error(future):
+    if not future.cancelled() and future.exception() is not None:
+        Utils.log_error(f"Failed to send progress from worker: {future.exception()}")